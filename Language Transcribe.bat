@@ -132,29 +132,15 @@ if defined NO_TRANSLATE (
 echo ======================================
 echo.
 
-rem 비디오 파일 확장자 체크
-if /i "%FILE_EXT%"==".mp4" goto VIDEO
-if /i "%FILE_EXT%"==".avi" goto VIDEO
-if /i "%FILE_EXT%"==".mkv" goto VIDEO
-if /i "%FILE_EXT%"==".mov" goto VIDEO
-if /i "%FILE_EXT%"==".wmv" goto VIDEO
-if /i "%FILE_EXT%"==".flv" goto VIDEO
-if /i "%FILE_EXT%"==".webm" goto VIDEO
-goto AUDIO
-
-:VIDEO
-echo [INFO] 비디오 파일 감지 - 오디오 추출중...
-set AUDIO_FILE=%FILE_DIR%%FILE_NAME%.ogg
-"C:\ffmpeg\bin\ffmpeg.exe" -i "%INPUT_FILE%" -vn -ac 1 -ar 16000 -af "aresample=async=1:first_pts=0" -c:a libopus -b:a 32k -y "%AUDIO_FILE%"
-if errorlevel 1 (
-    echo [ERROR] 오디오 추출 실패
-    pause
-    exit /b 1
-)
-python "%SCRIPT_DIR%main.py" "%AUDIO_FILE%" --source %SOURCE_LANG% --dest %DEST_LANG% %NO_TRANSLATE% --subtitle-mode %MODE% %USE_EXTERNAL_SRT% --temp-audio
+rem 기존 SRT 번역은 오디오 처리가 필요 없음 (번역 전용 모드)
+if defined USE_EXTERNAL_SRT goto SRT_ONLY
+
+rem 비디오/오디오 모두 main.py가 직접 처리 (비디오는 ffmpeg 출력을 파이프로 받아 임시 파일 없음)
+set FFMPEG_BIN=C:\ffmpeg\bin\ffmpeg.exe
+python "%SCRIPT_DIR%main.py" "%INPUT_FILE%" --source %SOURCE_LANG% --dest %DEST_LANG% %NO_TRANSLATE% --subtitle-mode %MODE%
 goto END
 
-:AUDIO
+:SRT_ONLY
 python "%SCRIPT_DIR%main.py" "%INPUT_FILE%" --source %SOURCE_LANG% --dest %DEST_LANG% %NO_TRANSLATE% --subtitle-mode %MODE% %USE_EXTERNAL_SRT%
 goto END
 
@@ -2,32 +2,111 @@
 FastAPI wrapper for LanguageReactor subtitle generation and translation.
 Designed for n8n integration with shared /workspace volume.
 """
+import asyncio
+import functools
+import hashlib
+import json
 import os
-import subprocess
+import time
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import Optional
+from typing import AsyncIterator, Dict, List, Optional, Union
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 
-from step1 import generate_data_hash, check_file_exists
-from step2 import upload_file
-from step3 import wait_for_subtitles
-from step4 import translate_subtitles
-from srt_build import parse_srt
+import client
+import metrics
+import profiling
+import ratelimit
+from cache import DiskCache
+from audio_cache import audio_cache
+from jobs import COMPLETED, FINISHED_STATES, POLL_INTERVAL, Job, JobManager
+from pipeline import VALID_MODES, PipelineError, StageTracker, run_transcription, run_translation_only
+from segment import segmentations
+from singleflight import SingleFlight
+from step2 import uploads
+from step3 import scheduler
+from step4 import inflight_translations
+from srt_build import split_list
+from subtitles import DEFAULT_FORMATS, FORMATS
 
 # Constants
-WORKSPACE_DIR = Path("/workspace")
-SUPPORTED_VIDEO_EXTENSIONS = {'.mp4', '.avi', '.mkv', '.mov', '.wmv', '.flv', '.webm'}
+WORKSPACE_DIR = Path(os.environ.get("LR_WORKSPACE_DIR", "/workspace"))
+MAX_CONCURRENT_JOBS = int(os.environ.get("LR_MAX_CONCURRENT_JOBS", "32"))
+JOB_WORKERS = int(os.environ.get("LR_JOB_WORKERS", "4"))
+# Idle progress streams send a keepalive this often so proxies keep them open
+STREAM_KEEPALIVE = float(os.environ.get("LR_STREAM_KEEPALIVE", "15"))
 
-app = FastAPI(title="LanguageReactor API", version="1.0.0")
+# Bounds how many transcriptions run at once; extra requests wait their turn
+job_slots = asyncio.Semaphore(MAX_CONCURRENT_JOBS)
+
+# Identical requests in flight share one pipeline run
+transcriptions = SingleFlight("transcription")
+# Tracker of the caller that started each in-flight transcription; joiners follow its events
+flight_trackers: Dict[tuple, StageTracker] = {}
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Keep pooled dioco.io clients and the job workers for the lifetime of the server."""
+    client.get_session()
+    client.get_async_client()
+    job_manager.start()
+    yield
+    await job_manager.stop()
+    await client.close_async_client()
+    client.close_session()
+
+
+app = FastAPI(title="LanguageReactor API", version="1.0.0", lifespan=lifespan)
 
 
 class TranscribeRequest(BaseModel):
     filename: str
     source_lang: str = "ja"
-    target_lang: str = "ko"
-    mode: str = "orig"  # "orig", "dual", or "trans"
+    target_lang: Union[str, List[str]] = "ko"  # one language, a list, or "ko,en"
+    mode: Union[str, List[str]] = "orig"  # "orig", "dual", "trans", or several of them
+    segment: Optional[bool] = None  # split long audio at silences for parallel ASR (default: LR_SEGMENT_ASR)
+    trim_silence: Optional[bool] = None  # cut long silences before upload (default: LR_TRIM_SILENCE)
+    format: Union[str, List[str], None] = None  # "srt", "vtt", "ass", "json" or several (default: LR_SUBTITLE_FORMATS)
+    profile: bool = False  # write <stem>.trace.json (Chrome/Perfetto timeline) next to the outputs
+    profile_cpu: bool = False  # also write <stem>.prof (cProfile of hashing, parsing and rendering); implies profile
+
+    def target_langs(self) -> List[str]:
+        return split_list(self.target_lang)
+
+    def modes(self) -> List[str]:
+        return split_list(self.mode)
+
+    def formats(self) -> List[str]:
+        return split_list(self.format) if self.format else DEFAULT_FORMATS
+
+
+class TranslateRequest(BaseModel):
+    filename: str  # the .srt itself, or a media file whose same-name .srt should be used
+    source_lang: str = "ja"
+    target_lang: Union[str, List[str]] = "ko"
+    mode: Union[str, List[str]] = "trans"
+    format: Union[str, List[str], None] = None
+
+    def target_langs(self) -> List[str]:
+        return split_list(self.target_lang)
+
+    def modes(self) -> List[str]:
+        return split_list(self.mode)
+
+    def formats(self) -> List[str]:
+        return split_list(self.format) if self.format else DEFAULT_FORMATS
+
+
+class OutputFile(BaseModel):
+    mode: str
+    lang: str
+    format: str = "srt"
+    filename: str
+    path: str
 
 
 class TranscribeResponse(BaseModel):
@@ -36,73 +115,43 @@ class TranscribeResponse(BaseModel):
     output_path: str
     used_external_srt: bool
     subtitle_count: int
+    outputs: List[OutputFile] = []
     message: Optional[str] = None
+    stage_timings: Dict[str, float] = {}
+    counters: Dict[str, float] = {}
+    profile_files: List[str] = []
 
 
-def ms_to_srt_time(ms):
-    """Convert milliseconds to SRT time format."""
-    seconds = ms / 1000
-    hours = int(seconds // 3600)
-    minutes = int((seconds % 3600) // 60)
-    secs = int(seconds % 60)
-    millis = int((ms % 1000))
-    return f"{hours:02d}:{minutes:02d}:{secs:02d},{millis:03d}"
-
-
-def create_srt_content(subs, originals, translations, mode='orig'):
-    """Generate SRT file content."""
-    lines = []
-    for i, (sub, orig, trans) in enumerate(zip(subs, originals, translations), 1):
-        start_time = ms_to_srt_time(sub['begin'])
-        end_time = ms_to_srt_time(sub['end'])
-
-        lines.append(f"{i}")
-        lines.append(f"{start_time} --> {end_time}")
-        
-        if mode == 'orig':
-            lines.append(orig)
-        elif mode == 'dual':
-            lines.append(orig)
-            if trans:
-                lines.append(f"({trans})")
-        elif mode == 'trans':
-            if trans:
-                lines.append(trans)
-            else:
-                lines.append(orig)
-        
-        lines.append("")  # Empty line between subtitles
-    
-    return "\n".join(lines)
+class JobSubmitResponse(BaseModel):
+    job_id: str
+    state: str
+    queue_position: Optional[int] = None
 
 
-def extract_audio_from_video(video_path: Path, output_audio_path: Path) -> bool:
-    """Extract audio from video file using ffmpeg."""
-    try:
-        cmd = [
-            'ffmpeg',
-            '-i', str(video_path),
-            '-vn',  # No video
-            '-ac', '1',  # Mono
-            '-ar', '16000',  # Sample rate
-            '-af', 'aresample=async=1:first_pts=0',
-            '-c:a', 'libopus',
-            '-b:a', '32k',
-            '-y',  # Overwrite
-            str(output_audio_path)
-        ]
-        
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        
-        if result.returncode == 0:
-            print(f"[INFO] Audio extracted: {output_audio_path}")
-            return True
-        else:
-            print(f"[ERROR] FFmpeg failed: {result.stderr}")
-            return False
-    except Exception as e:
-        print(f"[ERROR] Failed to extract audio: {e}")
-        return False
+class JobStatusResponse(BaseModel):
+    job_id: str
+    filename: str
+    state: str
+    stage: Optional[str] = None
+    queue_position: Optional[int] = None
+    stage_timings: Dict[str, float] = {}
+    counters: Dict[str, float] = {}
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    error: Optional[str] = None
+
+
+class QueueStatsResponse(BaseModel):
+    workers: int  # job slots across every process sharing the queue
+    processes: int
+    queue_depth: int
+    running: int
+    jobs: Dict[str, int]
+
+
+class UpstreamStatsResponse(BaseModel):
+    endpoints: Dict[str, Dict[str, Union[float, str]]]
 
 
 @app.get("/")
@@ -117,121 +166,479 @@ async def transcribe(request: TranscribeRequest):
     Generate or translate subtitles for audio/video files.
     
     Automatically detects if a matching .srt file exists in /workspace.
-    If found, skips ASR and uses the existing subtitle file.
+    If found, skips all audio work and only translates the existing subtitle file.
+    target_lang and mode may be lists; ASR runs once and every output is written.
     """
-    filename = request.filename
-    source_lang = request.source_lang
-    target_lang = request.target_lang
-    mode = request.mode
-    
+    input_path, srt_path = _resolve_request(request)
+    tracker = StageTracker()
+
+    async with job_slots:
+        try:
+            result = await _run_shared(request, input_path, srt_path, tracker)
+        except PipelineError as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        except Exception as e:
+            print(f"[ERROR] {e}")
+            raise HTTPException(status_code=500, detail=str(e))
+
+    return TranscribeResponse(success=True, message="Subtitles generated successfully",
+                              stage_timings=tracker.timings, counters=tracker.counters, **result)
+
+
+@app.post("/transcribe/stream")
+async def transcribe_stream(request: TranscribeRequest, http_request: Request):
+    """
+    /transcribe with live progress.
+
+    Streams Server-Sent Events (or JSON lines with `Accept: application/x-ndjson`):
+    stage / stage_done, upload bytes, ASR polls, subtitle and translation
+    counts and each output file as it is written, ending with a "result"
+    event (the /transcribe response) or an "error" event. Validation errors
+    are still plain HTTP errors. Disconnecting cancels the run unless an
+    identical request shares it.
+    """
+    input_path, srt_path = _resolve_request(request)
+    tracker = StageTracker()
+
+    async def run():
+        if job_slots.locked():
+            tracker.emit("waiting", reason="concurrency limit")
+        async with job_slots:
+            return await _run_shared(request, input_path, srt_path, tracker)
+
+    async def events():
+        listener = _EventListener()
+        tracker.subscribe(listener)
+        task = asyncio.create_task(run())
+        try:
+            async for event in listener.until(task):
+                yield event
+            try:
+                result = task.result()
+            except Exception as e:
+                print(f"[ERROR] {e}")
+                yield {"event": "error", "detail": str(e)}
+            else:
+                yield {"event": "result", **TranscribeResponse(
+                    success=True, message="Subtitles generated successfully",
+                    stage_timings=tracker.timings, counters=tracker.counters, **result
+                ).model_dump()}
+        finally:
+            tracker.unsubscribe(listener)
+            if not task.done():
+                print(f"[INFO] Progress stream closed, cancelling: {request.filename}")
+                task.cancel()
+
+    return _stream_response(http_request, events())
+
+
+@app.post("/translate", response_model=TranscribeResponse)
+async def translate(request: TranslateRequest):
+    """
+    Translate an existing SRT in /workspace.
+
+    Subtitle-only fast path: the media file is never read, so there is no
+    ffmpeg, hashing or upload.
+    """
+    _validate_outputs(request)
+    srt_path = WORKSPACE_DIR / request.filename
+    if srt_path.suffix.lower() != ".srt":
+        srt_path = srt_path.with_suffix(".srt")
+    if not srt_path.exists():
+        raise HTTPException(status_code=404, detail=f"SRT file not found: {srt_path.name}")
+
+    print(f"[INFO] Translating SRT: {srt_path.name}")
+    try:
+        result = await run_translation_only(
+            srt_path, request.source_lang, request.target_langs(), request.modes(), WORKSPACE_DIR,
+            formats=request.formats()
+        )
+    except Exception as e:
+        print(f"[ERROR] {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return TranscribeResponse(success=True, message="Subtitles translated successfully", **result)
+
+
+@app.post("/jobs", response_model=JobSubmitResponse, status_code=202)
+async def submit_job(request: TranscribeRequest):
+    """
+    Queue a transcription and return immediately with a job id.
+
+    Poll GET /jobs/{job_id} for progress and GET /jobs/{job_id}/result once completed.
+    Any replica sharing the queue may run it; an identical job that is still
+    queued or running is returned instead of a new one.
+    """
+    input_path, srt_path = _resolve_request(request)
+    dedupe_key = hashlib.sha256(repr(_flight_key(request, input_path, srt_path)).encode()).hexdigest()
+
+    def submit():
+        job = job_manager.submit(request.model_dump(), dedupe_key)
+        return job, job_manager.queue_position(job)
+
+    job, position = await asyncio.to_thread(submit)
+    print(f"[INFO] Job queued: {job.id} ({request.filename})")
+    return JobSubmitResponse(job_id=job.id, state=job.state, queue_position=position)
+
+
+@app.get("/jobs", response_model=QueueStatsResponse)
+async def queue_stats():
+    """Queue depth, running jobs and job slots across every process sharing the queue."""
+    return QueueStatsResponse(**await asyncio.to_thread(job_manager.stats))
+
+
+@app.get("/upstream", response_model=UpstreamStatsResponse)
+async def upstream_stats():
+    """Rate limit, retry and circuit-breaker state of each dioco endpoint."""
+    return UpstreamStatsResponse(endpoints=ratelimit.stats())
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Per-step histograms, in-flight gauges, cache hit ratios and upstream state (Prometheus text format)."""
+    return PlainTextResponse(await asyncio.to_thread(metrics.render),
+                             media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.get("/jobs/{job_id}", response_model=JobStatusResponse)
+async def job_status(job_id: str):
+    """Current state, stage and per-stage timings of a job."""
+    return await asyncio.to_thread(lambda: _job_status(_get_job(job_id)))
+
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, http_request: Request):
+    """
+    Progress of a job as Server-Sent Events (or JSON lines with `Accept: application/x-ndjson`).
+
+    Starts with a "status" event. While the job runs in this process every
+    stage, upload, ASR poll and output event is passed on as it happens; a
+    job queued or running on another replica is followed through the shared
+    queue at heartbeat granularity. Ends with "result" or "error" once the
+    job finishes.
+    """
+    await asyncio.to_thread(_get_job, job_id)
+    return _stream_response(http_request, _job_events(job_id))
+
+
+@app.get("/jobs/{job_id}/result", response_model=TranscribeResponse)
+async def job_result(job_id: str):
+    """Result of a completed job; 409 while it is still queued/running or if it did not complete."""
+    job = await asyncio.to_thread(_get_job, job_id)
+    if job.state != COMPLETED:
+        raise HTTPException(status_code=409, detail=f"Job is {job.state}" + (f": {job.error}" if job.error else ""))
+    return TranscribeResponse(success=True, message="Subtitles generated successfully",
+                              stage_timings=job.tracker.timings, counters=job.tracker.counters, **job.result)
+
+
+@app.delete("/jobs/{job_id}", response_model=JobStatusResponse)
+async def cancel_job(job_id: str):
+    """Cancel a queued or running job (one running on another replica stops at its next heartbeat)."""
+    job = await asyncio.to_thread(job_manager.cancel, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    print(f"[INFO] Job cancel requested: {job_id}")
+    return await asyncio.to_thread(_job_status, job)
+
+
+def _validate_outputs(request):
+    """Check the requested modes and target languages."""
+    modes = request.modes()
+    target_langs = request.target_langs()
+
     # Validate mode
-    if mode not in ['orig', 'dual', 'trans']:
-        raise HTTPException(status_code=400, detail=f"Invalid mode: {mode}. Must be 'orig', 'dual', or 'trans'")
-    
+    for mode in modes:
+        if mode not in VALID_MODES:
+            raise HTTPException(status_code=400, detail=f"Invalid mode: {mode}. Must be 'orig', 'dual', or 'trans'")
+    if not modes or not target_langs:
+        raise HTTPException(status_code=400, detail="At least one mode and one target language are required")
+    for fmt in request.formats():
+        if fmt not in FORMATS:
+            raise HTTPException(status_code=400, detail=f"Invalid format: {fmt}. Must be one of {', '.join(FORMATS)}")
+
+    return modes, target_langs
+
+
+def _resolve_request(request: TranscribeRequest):
+    """Validate a request and return (input_path, external srt_path or None)."""
+    filename = request.filename
+    modes, target_langs = _validate_outputs(request)
+
     # Build paths
     input_path = WORKSPACE_DIR / filename
     file_stem = input_path.stem
-    file_ext = input_path.suffix.lower()
-    
+
     if not input_path.exists():
         raise HTTPException(status_code=404, detail=f"File not found: {filename}")
-    
+
     # Check for external SRT file
     srt_path = WORKSPACE_DIR / f"{file_stem}.srt"
     has_external_srt = srt_path.exists()
-    
+
     print(f"[INFO] Processing: {filename}")
-    print(f"[INFO] Mode: {mode}")
-    print(f"[INFO] Languages: {source_lang} -> {target_lang}")
+    print(f"[INFO] Mode: {', '.join(modes)}")
+    print(f"[INFO] Languages: {request.source_lang} -> {', '.join(target_langs)}")
     print(f"[INFO] External SRT: {has_external_srt}")
-    
+
+    return input_path, srt_path if has_external_srt else None
+
+
+async def _run_job(job: Job) -> dict:
+    """Worker entry point: re-resolve paths at start time and run the pipeline."""
+    request = TranscribeRequest(**job.params)
+    input_path, srt_path = _resolve_request(request)
+    return await _run_shared(request, input_path, srt_path, job.tracker)
+
+
+def _flight_key(request: TranscribeRequest, input_path: Path, srt_path: Optional[Path]) -> tuple:
+    """Same file version, languages, modes and options -> same outputs."""
+    key = [str(input_path), request.source_lang, tuple(request.target_langs()), tuple(request.modes()),
+           request.segment, request.trim_silence, tuple(request.formats()),
+           request.profile or request.profile_cpu, request.profile_cpu]
+    for path in (input_path, srt_path):
+        if path is not None:
+            st = path.stat()
+            key += [st.st_size, st.st_mtime_ns]
+    return tuple(key)
+
+
+async def _run_shared(request: TranscribeRequest, input_path: Path, srt_path: Optional[Path],
+                      tracker: Optional[StageTracker] = None) -> dict:
+    """Run the pipeline, or join an identical run already in flight (n8n retries, duplicate submits)."""
+    key = _flight_key(request, input_path, srt_path)
+    tracker = tracker or StageTracker()
+    owner = None
+    if transcriptions.in_flight(key):
+        owner = flight_trackers.get(key)
+        tracker.stage = "coalesced"
+        tracker.counters["coalesced"] = 1
+        tracker.emit("coalesced", stage=owner.stage if owner is not None else None)
+        if owner is not None:
+            # The shared run reports to the tracker of the caller that started it
+            owner.subscribe(tracker.forward)
+    else:
+        flight_trackers[key] = tracker
+    fn = run_transcription
+    if request.profile or request.profile_cpu:
+        fn = functools.partial(_run_profiled, WORKSPACE_DIR / input_path.stem, request.profile_cpu)
     try:
-        # Handle video files (extract audio)
-        audio_path = input_path
-        is_video = file_ext in SUPPORTED_VIDEO_EXTENSIONS
-        temp_audio_path = None
-        
-        if is_video:
-            print("[INFO] Video file detected, extracting audio...")
-            temp_audio_path = WORKSPACE_DIR / f"{file_stem}_temp.ogg"
-            if not extract_audio_from_video(input_path, temp_audio_path):
-                raise HTTPException(status_code=500, detail="Failed to extract audio from video")
-            audio_path = temp_audio_path
-        
-        # Step 1: Generate hash and check existence
-        print("[Step 1] Generating hash and checking existence...")
-        hash_info = generate_data_hash(str(audio_path))
-        exists = check_file_exists(hash_info['dataHash'])
-        
-        # Step 2: Upload if not exists
-        if not exists:
-            print("[Step 2] Uploading audio file...")
-            upload_file(hash_info['file_content'], hash_info['dataHash'])
-        else:
-            print("[Step 2] File already exists on server, skipping upload")
-        
-        # Step 3: Get subtitles (either from external SRT or ASR)
-        if has_external_srt:
-            print(f"[Step 3] Using external SRT: {srt_path}")
-            subs, subs_texts = parse_srt(str(srt_path))
-        else:
-            print("[Step 3] Requesting ASR subtitles from API...")
-            subtitle_result = wait_for_subtitles(hash_info['dataHash'], source_lang)
-            if not subtitle_result:
-                raise HTTPException(status_code=500, detail="ASR subtitle generation failed")
-            
-            subs = subtitle_result['data']['subs']
-            subs_texts = [sub['text'] for sub in subs]
-        
-        print(f"[INFO] Subtitle count: {len(subs)}")
-        
-        # Step 4: Translate if needed
-        translations = []
-        if mode in ['dual', 'trans']:
-            print(f"[Step 4] Translating subtitles to {target_lang}...")
-            translation_result = translate_subtitles(subs_texts, source_lang, target_lang)
-            if translation_result:
-                translations = translation_result['data']['subs']
-            else:
-                print("[WARNING] Translation failed, using original text")
-                translations = [None] * len(subs_texts)
-        else:
-            print("[Step 4] Skipping translation (mode=orig)")
-            translations = [None] * len(subs_texts)
-        
-        # Generate output SRT
-        srt_content = create_srt_content(subs, subs_texts, translations, mode)
-        
-        # Save output file
-        if mode == "trans":
-            output_filename = f"{file_stem}_{target_lang}.srt"
-        else:
-            output_filename = f"{file_stem}.srt"
-        
-        output_path = WORKSPACE_DIR / output_filename
-        output_path.write_text(srt_content, encoding='utf-8')
-        
-        print(f"[OK] Output saved: {output_path}")
-        
-        # Clean up temporary audio file
-        if temp_audio_path and temp_audio_path.exists():
-            temp_audio_path.unlink()
-            print(f"[INFO] Cleaned up temp audio: {temp_audio_path}")
-        
-        return TranscribeResponse(
-            success=True,
-            output_filename=output_filename,
-            output_path=str(output_path),
-            used_external_srt=has_external_srt,
-            subtitle_count=len(subs),
-            message="Subtitles generated successfully"
+        return await transcriptions.do(
+            key, _run_flight, key, fn, input_path, srt_path, request.source_lang, request.target_langs(),
+            request.modes(), WORKSPACE_DIR, tracker=tracker, segment=request.segment,
+            trim=request.trim_silence, formats=request.formats()
         )
-    
-    except HTTPException:
-        raise
-    except Exception as e:
-        print(f"[ERROR] {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if owner is not None:
+            owner.unsubscribe(tracker.forward)
+
+
+async def _run_flight(key: tuple, fn, *args, tracker: StageTracker, **kwargs) -> dict:
+    """The shared run; its tracker stays registered for joining callers until it ends."""
+    try:
+        return await fn(*args, tracker=tracker, **kwargs)
+    finally:
+        if flight_trackers.get(key) is tracker:
+            del flight_trackers[key]
+
+
+async def _run_profiled(base_path: Path, cpu: bool, *args, **kwargs) -> dict:
+    """run_transcription recording a trace; written even when the run fails, listed in profile_files."""
+    trace = profiling.Trace(base_path.name, cpu=cpu)
+    try:
+        with profiling.bound(trace):
+            result = await run_transcription(*args, **kwargs)
+    finally:
+        files = await asyncio.to_thread(trace.write, base_path)
+        print(f"[INFO] Profile written: {', '.join(files)}")
+    return {**result, "profile_files": files}
+
+
+class _EventListener:
+    """Tracker listener that hands events (emitted on any thread) to one streaming response."""
+
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+        self.queue: asyncio.Queue = asyncio.Queue()
+
+    def __call__(self, event: dict):
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, event)
+
+    async def next(self, timeout: float) -> Optional[dict]:
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def until(self, task: asyncio.Task) -> AsyncIterator[Optional[dict]]:
+        """Events until `task` finishes; None when nothing happened for STREAM_KEEPALIVE seconds."""
+        while not task.done():
+            getter = asyncio.ensure_future(self.queue.get())
+            done, _ = await asyncio.wait({getter, task}, timeout=STREAM_KEEPALIVE,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if getter in done:
+                yield getter.result()
+            else:
+                getter.cancel()
+                if not done:
+                    yield None
+        # Events emitted just before the task finished
+        await asyncio.sleep(0)
+        while not self.queue.empty():
+            yield self.queue.get_nowait()
+
+
+def _stream_response(http_request: Request, events: AsyncIterator[Optional[dict]]) -> StreamingResponse:
+    """Server-Sent Events, or JSON lines when the client accepts application/x-ndjson; None is a keepalive."""
+    ndjson = "application/x-ndjson" in http_request.headers.get("accept", "")
+
+    async def body():
+        seq = 0
+        async for event in events:
+            if event is None:
+                yield '{"event": "keepalive"}\n' if ndjson else ": keepalive\n\n"
+                continue
+            seq += 1
+            data = json.dumps(event, ensure_ascii=False)
+            yield f"{data}\n" if ndjson else f"id: {seq}\nevent: {event['event']}\ndata: {data}\n\n"
+
+    return StreamingResponse(
+        body(), media_type="application/x-ndjson" if ndjson else "text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def _job_snapshot(job_id: str):
+    """(job, queue position), or (None, None) if it does not exist (blocking: reads the shared queue)."""
+    job = job_manager.get(job_id)
+    if job is None:
+        return None, None
+    return job, job_manager.queue_position(job)
+
+
+async def _job_events(job_id: str) -> AsyncIterator[Optional[dict]]:
+    """Status changes of a job, with its live tracker events whenever it runs in this process."""
+    last = None
+    listener = listening_to = None
+    idle_since = time.monotonic()
+    try:
+        while True:
+            job, position = await asyncio.to_thread(_job_snapshot, job_id)
+            if job is None:
+                yield {"event": "error", "detail": f"Job not found: {job_id}"}
+                return
+            # A local run reports its stages itself; otherwise stage changes come from the store
+            key = (job.state, position) if listener else (job.state, job.stage, position)
+            if key != last:
+                last = key
+                idle_since = time.monotonic()
+                yield {"event": "status", "job_id": job.id, "state": job.state, "stage": job.stage,
+                       "queue_position": position, "stage_timings": dict(job.tracker.timings)}
+
+            if job.state in FINISHED_STATES:
+                if job.state == COMPLETED:
+                    yield {"event": "result", **TranscribeResponse(
+                        success=True, message="Subtitles generated successfully",
+                        stage_timings=job.tracker.timings, counters=job.tracker.counters, **job.result
+                    ).model_dump()}
+                else:
+                    yield {"event": "error", "state": job.state, "detail": job.error}
+                return
+
+            local = job_manager.running.get(job_id)
+            if local is not None and listener is None:
+                listener = _EventListener()
+                local.tracker.subscribe(listener)
+                listening_to = local.tracker
+                last = (job.state, position)
+
+            if listener is not None:
+                event = await listener.next(POLL_INTERVAL)
+                while event is not None:
+                    idle_since = time.monotonic()
+                    yield event
+                    event = listener.queue.get_nowait() if not listener.queue.empty() else None
+            else:
+                await asyncio.sleep(POLL_INTERVAL)
+            if time.monotonic() - idle_since >= STREAM_KEEPALIVE:
+                idle_since = time.monotonic()
+                yield None
+    finally:
+        if listening_to is not None:
+            listening_to.unsubscribe(listener)
+
+
+def _get_job(job_id: str) -> Job:
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    return job
+
+
+def _job_status(job: Job) -> JobStatusResponse:
+    return JobStatusResponse(
+        job_id=job.id,
+        filename=job.params["filename"],
+        state=job.state,
+        stage=job.stage,
+        queue_position=job_manager.queue_position(job),
+        stage_timings=job.tracker.timings,
+        counters=job.tracker.counters,
+        created_at=job.created_at,
+        started_at=job.started_at,
+        finished_at=job.finished_at,
+        error=job.error,
+    )
+
+
+# Jobs live in the shared queue (LR_QUEUE_PATH): every replica and worker.py claims from it, and jobs
+# of a process that dies are claimed again and resume from their checkpoints
+job_manager = JobManager(_run_job, workers=JOB_WORKERS)
+
+
+def _collect_metrics():
+    """Scrape-time view of state that already lives in the job manager, caches and limiters."""
+    stats = job_manager.stats()
+    yield ("lr_jobs", "gauge", "Jobs by state",
+           [({"state": state}, count) for state, count in stats["jobs"].items()])
+    yield ("lr_job_workers", "gauge", "Job slots across every process sharing the queue", [({}, stats["workers"])])
+    yield ("lr_job_processes", "gauge", "Processes claiming from the shared queue", [({}, stats["processes"])])
+
+    flights = [flight.stats() for flight in (transcriptions, uploads, inflight_translations, segmentations)]
+    yield ("lr_single_flight_in_flight", "gauge", "Coalesced calls currently running",
+           [({"name": flight["name"]}, flight["in_flight"]) for flight in flights])
+    yield ("lr_single_flight_started_total", "counter", "Calls that did the work",
+           [({"name": flight["name"]}, flight["started"]) for flight in flights])
+    yield ("lr_single_flight_coalesced_total", "counter", "Calls that joined one already in flight",
+           [({"name": flight["name"]}, flight["coalesced"]) for flight in flights])
+
+    polls = scheduler.stats()
+    yield ("lr_asr_waits_pending", "gauge", "ASR results being polled for", [({}, polls["pending"])])
+    yield ("lr_asr_status_polls_total", "counter", "ASR status requests sent", [({}, polls["total_polls"])])
+    yield ("lr_asr_timeouts_total", "counter", "ASR waits that timed out", [({}, polls["timeouts"])])
+
+    caches = [cache.stats() for cache in DiskCache.instances]
+    yield ("lr_cache_hits_total", "counter", "Disk cache hits",
+           [({"cache": cache["name"]}, cache["hits"]) for cache in caches])
+    yield ("lr_cache_misses_total", "counter", "Disk cache misses",
+           [({"cache": cache["name"]}, cache["misses"]) for cache in caches])
+    yield ("lr_cache_hit_ratio", "gauge", "Disk cache hits / lookups since start",
+           [({"cache": cache["name"]}, cache["hit_ratio"]) for cache in caches])
+    yield ("lr_audio_cache_bytes", "gauge", "Extracted audio kept on disk", [({}, audio_cache.usage()["bytes"])])
+
+    upstream = ratelimit.stats()
+    for key, help in (("requests", "Requests sent to each dioco endpoint"),
+                      ("retries", "Retried requests"),
+                      ("throttled", "429 responses"),
+                      ("failures", "5xx responses and connection errors"),
+                      ("rate_wait_seconds", "Time spent waiting for a rate-limit token")):
+        yield (f"lr_upstream_{key}_total", "counter", help,
+               [({"endpoint": endpoint}, values[key]) for endpoint, values in upstream.items()])
+    yield ("lr_upstream_circuit_open", "gauge", "1 while the endpoint's circuit breaker is open or half-open",
+           [({"endpoint": endpoint}, int(values["state"] != ratelimit.CLOSED))
+            for endpoint, values in upstream.items()])
+
+
+metrics.register_collector(_collect_metrics)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,227 @@
+"""
+Audio extraction from video files with ffmpeg (blocking and asyncio variants).
+
+The streaming variants read ffmpeg's stdout through a pipe, compute the
+dataHash as bytes arrive and keep the encoded audio in a spooled buffer
+under local tmp, so nothing is written to the shared /workspace volume.
+"""
+import asyncio
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+import metrics
+import profiling
+
+SUPPORTED_VIDEO_EXTENSIONS = {'.mp4', '.avi', '.mkv', '.mov', '.wmv', '.flv', '.webm'}
+
+FFMPEG_BIN = os.environ.get('FFMPEG_BIN', 'ffmpeg')
+
+# Spooled audio stays in memory up to this size, then spills to LOCAL_TMP_DIR
+LOCAL_TMP_DIR = os.environ.get('LR_LOCAL_TMP', tempfile.gettempdir())
+SPOOL_MAX_MEMORY = int(os.environ.get('LR_SPOOL_MAX_MEMORY', str(32 * 1024 * 1024)))
+PIPE_CHUNK_SIZE = 1024 * 1024
+
+# 16 kHz mono Opus, same settings as run_transcribe.sh
+FFMPEG_AUDIO_ARGS = [
+    '-vn',  # No video
+    '-ac', '1',  # Mono
+    '-ar', '16000',  # Sample rate
+    '-af', 'aresample=async=1:first_pts=0',
+    '-c:a', 'libopus',
+    '-b:a', '32k',
+]
+
+
+def build_ffmpeg_command(video_path: Path, output_audio_path: Path) -> list:
+    """Build the ffmpeg command line for audio extraction."""
+    return [
+        FFMPEG_BIN,
+        '-i', str(video_path),
+        *FFMPEG_AUDIO_ARGS,
+        '-y',  # Overwrite
+        str(output_audio_path)
+    ]
+
+
+def build_ffmpeg_pipe_command(video_path: Path) -> list:
+    """Build the ffmpeg command line that writes Ogg/Opus to stdout."""
+    return [
+        FFMPEG_BIN,
+        '-loglevel', 'error',
+        '-i', str(video_path),
+        *FFMPEG_AUDIO_ARGS,
+        '-f', 'ogg',
+        'pipe:1'
+    ]
+
+
+class StreamedAudio:
+    """Encoded audio captured from an ffmpeg pipe, with its dataHash."""
+
+    def __init__(self):
+        self._md5 = hashlib.md5()
+        self.size = 0
+        self.buffer = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY, dir=LOCAL_TMP_DIR)
+
+    def feed(self, chunk: bytes):
+        self._md5.update(chunk)
+        self.size += len(chunk)
+        self.buffer.write(chunk)
+
+    @property
+    def md5(self) -> str:
+        return self._md5.hexdigest()
+
+    @property
+    def data_hash(self) -> str:
+        return f"{self.md5}_{self.size}"
+
+    def hash_info(self) -> dict:
+        """Same shape as step1.generate_data_hash, with the buffer in place of a path."""
+        self.buffer.seek(0)
+        return {
+            'dataHash': self.data_hash,
+            'file_path': None,
+            'buffer': self.buffer,
+            'md5': self.md5,
+            'size': self.size,
+        }
+
+    def save_temp(self) -> str:
+        """Write the audio to a named file in LOCAL_TMP_DIR; the caller deletes it."""
+        fd, path = tempfile.mkstemp(dir=LOCAL_TMP_DIR, suffix='.ogg')
+        with os.fdopen(fd, 'wb') as out:
+            self.buffer.seek(0)
+            shutil.copyfileobj(self.buffer, out)
+        self.buffer.seek(0)
+        return path
+
+    def close(self):
+        self.buffer.close()
+
+
+@metrics.timed('extract_audio', failure=lambda audio: audio is None)
+def extract_audio_stream(video_path: Path) -> Optional[StreamedAudio]:
+    """Extract audio through a pipe, hashing incrementally. Returns None on failure."""
+    audio = StreamedAudio()
+    try:
+        with tempfile.TemporaryFile(dir=LOCAL_TMP_DIR) as stderr, \
+                profiling.span('ffmpeg extract+md5', 'subprocess', input=str(video_path)) as span:
+            proc = subprocess.Popen(build_ffmpeg_pipe_command(video_path),
+                                    stdout=subprocess.PIPE, stderr=stderr)
+            with proc:
+                while True:
+                    chunk = proc.stdout.read(PIPE_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    audio.feed(chunk)
+            span['bytes'] = audio.size
+
+            if proc.returncode != 0:
+                stderr.seek(0)
+                print(f"[ERROR] FFmpeg failed: {stderr.read().decode(errors='replace')}")
+                audio.close()
+                return None
+    except Exception as e:
+        print(f"[ERROR] Failed to extract audio: {e}")
+        audio.close()
+        return None
+
+    print(f"[INFO] Audio extracted (streamed): {audio.size} bytes, DataHash: {audio.data_hash}")
+    return audio
+
+
+@metrics.timed('extract_audio', failure=lambda audio: audio is None)
+async def extract_audio_stream_async(video_path: Path) -> Optional[StreamedAudio]:
+    """Asyncio variant of extract_audio_stream; buffer writes run in a worker thread."""
+    audio = StreamedAudio()
+    proc = None
+    try:
+        with profiling.span('ffmpeg extract+md5', 'subprocess', input=str(video_path)) as span:
+            proc = await asyncio.create_subprocess_exec(
+                *build_ffmpeg_pipe_command(video_path),
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+            )
+            # Drain stderr concurrently so ffmpeg never blocks on a full pipe
+            stderr_task = asyncio.create_task(proc.stderr.read())
+            while True:
+                chunk = await proc.stdout.read(PIPE_CHUNK_SIZE)
+                if not chunk:
+                    break
+                await asyncio.to_thread(audio.feed, chunk)
+            stderr = await stderr_task
+            await proc.wait()
+            span['bytes'] = audio.size
+
+        if proc.returncode != 0:
+            print(f"[ERROR] FFmpeg failed: {stderr.decode(errors='replace')}")
+            audio.close()
+            return None
+    except asyncio.CancelledError:
+        if proc is not None and proc.returncode is None:
+            proc.kill()
+        audio.close()
+        raise
+    except Exception as e:
+        print(f"[ERROR] Failed to extract audio: {e}")
+        audio.close()
+        return None
+
+    print(f"[INFO] Audio extracted (streamed): {audio.size} bytes, DataHash: {audio.data_hash}")
+    return audio
+
+
+@metrics.timed('extract_audio', failure=lambda ok: not ok)
+def extract_audio_from_video(video_path: Path, output_audio_path: Path) -> bool:
+    """Extract audio from video file using ffmpeg."""
+    try:
+        cmd = build_ffmpeg_command(video_path, output_audio_path)
+
+        with profiling.span('ffmpeg extract', 'subprocess', input=str(video_path)):
+            result = subprocess.run(cmd, capture_output=True, text=True)
+
+        if result.returncode == 0:
+            print(f"[INFO] Audio extracted: {output_audio_path}")
+            return True
+        else:
+            print(f"[ERROR] FFmpeg failed: {result.stderr}")
+            return False
+    except Exception as e:
+        print(f"[ERROR] Failed to extract audio: {e}")
+        return False
+
+
+@metrics.timed('extract_audio', failure=lambda ok: not ok)
+async def extract_audio_from_video_async(video_path: Path, output_audio_path: Path) -> bool:
+    """Extract audio with an asyncio subprocess so the event loop keeps running."""
+    proc = None
+    try:
+        cmd = build_ffmpeg_command(video_path, output_audio_path)
+
+        with profiling.span('ffmpeg extract', 'subprocess', input=str(video_path)):
+            proc = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.PIPE,
+            )
+            _, stderr = await proc.communicate()
+
+        if proc.returncode == 0:
+            print(f"[INFO] Audio extracted: {output_audio_path}")
+            return True
+        else:
+            print(f"[ERROR] FFmpeg failed: {stderr.decode(errors='replace')}")
+            return False
+    except asyncio.CancelledError:
+        if proc is not None and proc.returncode is None:
+            proc.kill()
+        raise
+    except Exception as e:
+        print(f"[ERROR] Failed to extract audio: {e}")
+        return False
@@ -0,0 +1,220 @@
+"""
+Content-keyed cache of audio extracted from video files.
+
+Entries are keyed by the video's identity (path, size, mtime, inode) plus the
+ffmpeg arguments, so re-running the same video for another target language,
+mode or after a failed translation skips both transcoding and hashing.
+The Opus files live under AUDIO_CACHE_DIR and are evicted least recently
+used first once their total size exceeds AUDIO_CACHE_MAX_BYTES.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+from typing import Optional, Tuple
+
+from audio import FFMPEG_AUDIO_ARGS, StreamedAudio, extract_audio_stream, extract_audio_stream_async
+from cache import CACHE_DIR, DiskCache
+from step1 import _file_identity
+
+AUDIO_CACHE_DIR = os.environ.get('LR_AUDIO_CACHE_DIR', os.path.join(CACHE_DIR, 'audio'))
+# 0 disables the cache
+AUDIO_CACHE_MAX_BYTES = int(os.environ.get('LR_AUDIO_CACHE_MAX_BYTES', str(2 * 1024 ** 3)))
+
+
+class AudioCache:
+    """Extracted audio files on disk plus a dataHash index, capped by total bytes."""
+
+    def __init__(self, directory: str = AUDIO_CACHE_DIR, max_bytes: int = AUDIO_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.index = DiskCache('extracted_audio', cache_dir=directory)
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def key(self, video_path) -> str:
+        video_path = os.path.abspath(video_path)
+        identity = _file_identity(video_path)
+        raw = json.dumps([video_path, identity, FFMPEG_AUDIO_ARGS])
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.ogg")
+
+    def lookup(self, video_path) -> Optional[dict]:
+        """hash_info for the cached audio of this video, or None."""
+        if not self.enabled:
+            return None
+        key = self.key(video_path)
+        path = self._path(key)
+
+        def valid(entry):
+            try:
+                return os.path.getsize(path) == entry['size']
+            except OSError:
+                return False
+
+        entry = self.index.get(key, validate=valid)
+        if entry is None:
+            return None
+        try:
+            # Touch so eviction sees it as recently used
+            os.utime(path)
+        except OSError:
+            return None
+        return {
+            'dataHash': entry['dataHash'],
+            'file_path': path,
+            'md5': entry['md5'],
+            'size': entry['size'],
+            'cached': True,
+        }
+
+    def store(self, video_path, audio: StreamedAudio) -> Optional[dict]:
+        """Copy a streamed extraction into the cache. Returns hash_info pointing at the file."""
+        if not self.enabled or audio.size > self.max_bytes:
+            return None
+        key = self.key(video_path)
+        path = self._path(key)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.part')
+            try:
+                with os.fdopen(fd, 'wb') as out:
+                    audio.buffer.seek(0)
+                    shutil.copyfileobj(audio.buffer, out)
+                # Atomic so concurrent readers never see a partial file
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except OSError as e:
+            print(f"[WARNING] Failed to cache extracted audio: {e}")
+            return None
+        finally:
+            audio.buffer.seek(0)
+
+        self.index.set(key, {'dataHash': audio.data_hash, 'md5': audio.md5, 'size': audio.size})
+        self._evict(keep=path)
+        return {
+            'dataHash': audio.data_hash,
+            'file_path': path,
+            'md5': audio.md5,
+            'size': audio.size,
+        }
+
+    def _evict(self, keep: Optional[str] = None):
+        # Oldest mtime first; lookup() touches files on every hit
+        files = []
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith('.ogg'):
+                continue
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"[WARNING] Failed to evict cached audio {path}: {e}")
+                continue
+            total -= size
+            with self._lock:
+                self.evictions += 1
+
+    def usage(self) -> dict:
+        files = 0
+        total = 0
+        if os.path.isdir(self.directory):
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith('.ogg'):
+                    files += 1
+                    total += entry.stat().st_size
+        return {'files': files, 'bytes': total, 'max_bytes': self.max_bytes, 'evictions': self.evictions}
+
+    def stats(self) -> dict:
+        return {**self.index.stats(), **self.usage()}
+
+
+audio_cache = AudioCache()
+
+
+def extract_audio_cached(video_path: Path) -> Tuple[Optional[dict], Optional[StreamedAudio]]:
+    """
+    Return (hash_info, streamed) for a video, transcoding only on a cache miss.
+
+    hash_info['file_path'] points at the cached audio when it could be cached;
+    otherwise it is None and hash_info['buffer'] holds the streamed audio.
+    The caller closes `streamed` when it is not None.
+    """
+    cached = audio_cache.lookup(video_path)
+    if cached is not None:
+        print(f"[INFO] Using cached audio: {cached['file_path']}, DataHash: {cached['dataHash']}")
+        return cached, None
+
+    streamed = extract_audio_stream(video_path)
+    if streamed is None:
+        return None, None
+    stored = audio_cache.store(video_path, streamed)
+    if stored is not None:
+        streamed.close()
+        return stored, None
+    return streamed.hash_info(), streamed
+
+
+async def extract_audio_cached_async(video_path: Path) -> Tuple[Optional[dict], Optional[StreamedAudio]]:
+    """Asyncio variant of extract_audio_cached."""
+    cached = await asyncio.to_thread(audio_cache.lookup, video_path)
+    if cached is not None:
+        print(f"[INFO] Using cached audio: {cached['file_path']}, DataHash: {cached['dataHash']}")
+        return cached, None
+
+    streamed = await extract_audio_stream_async(video_path)
+    if streamed is None:
+        return None, None
+    stored = await asyncio.to_thread(audio_cache.store, video_path, streamed)
+    if stored is not None:
+        streamed.close()
+        return stored, None
+    return streamed.hash_info(), streamed
+
+
+def extract_audio_to_file(video_path) -> Optional[dict]:
+    """
+    Picklable variant of extract_audio_cached for process pools.
+
+    Always returns hash_info with a file path. When the audio could not be
+    cached it is written to local tmp and hash_info['temporary'] is True;
+    the caller deletes that file when done. Returns None on failure.
+    """
+    hash_info, streamed = extract_audio_cached(video_path)
+    if streamed is None:
+        return hash_info
+    try:
+        tmp_path = streamed.save_temp()
+    finally:
+        streamed.close()
+    return {
+        'dataHash': hash_info['dataHash'],
+        'file_path': tmp_path,
+        'md5': hash_info['md5'],
+        'size': hash_info['size'],
+        'temporary': True,
+    }
@@ -0,0 +1,309 @@
+"""
+Staged, pipelined batch executor for `main.py --batch`.
+
+Every file runs as its own task and passes through the stages
+extract -> hash -> upload -> asr -> translate. Each stage has its own
+concurrency limit, so while one file waits for ASR the next one is
+uploading and a third is being transcoded: throughput is bounded by the
+slowest stage instead of the sum of all stages per file.
+"""
+import asyncio
+import functools
+import glob
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import List, Optional
+
+import client
+import ratelimit
+from audio import SUPPORTED_VIDEO_EXTENSIONS
+from audio_cache import extract_audio_to_file
+from checkpoint import Checkpoint
+from pipeline import (PipelineError, StageTracker, request_asr, run_translation_only, translate_and_write,
+                      trim_for_asr)
+from subtitles import DEFAULT_FORMATS, cues_from_subs
+from step1 import generate_data_hash_async
+from step3 import cached_subtitles_async, store_subtitles
+from segment import SEGMENT_ASR
+from singleflight import release_after, started_calls
+from trim import TRIM_SILENCE, remap_result
+
+AUDIO_EXTENSIONS = {'.mp3', '.m4a', '.wav', '.ogg', '.opus', '.flac', '.aac'}
+MEDIA_EXTENSIONS = SUPPORTED_VIDEO_EXTENSIONS | AUDIO_EXTENSIONS
+
+STAGES = ('extract', 'hash', 'upload', 'asr', 'translate')
+
+# Tracked steps that borrow another stage's slots: trimming re-encodes like
+# extraction; the existence check is a quick request that must not queue
+# behind long uploads, so it keeps the hash slots it always used
+SHARED_SLOTS = {'trim': 'extract', 'exists': 'hash'}
+
+# Per-stage concurrency limits; extraction defaults to one process per CPU
+DEFAULT_LIMITS = {
+    'extract': int(os.environ.get('LR_BATCH_EXTRACT_WORKERS', str(os.cpu_count() or 2))),
+    'hash': int(os.environ.get('LR_BATCH_HASH_WORKERS', '4')),
+    'upload': int(os.environ.get('LR_BATCH_UPLOAD_WORKERS', '2')),
+    'asr': int(os.environ.get('LR_BATCH_ASR_WORKERS', '32')),
+    'translate': int(os.environ.get('LR_BATCH_TRANSLATE_WORKERS', '4')),
+}
+
+
+def find_batch_files(target: str) -> List[Path]:
+    """Media files in a directory (non-recursive) or matching a glob pattern, sorted."""
+    if os.path.isdir(target):
+        candidates = [os.path.join(target, name) for name in os.listdir(target)]
+    else:
+        candidates = glob.glob(target, recursive=True)
+    return sorted(
+        Path(path).resolve() for path in candidates
+        if os.path.isfile(path) and Path(path).suffix.lower() in MEDIA_EXTENSIONS
+    )
+
+
+def _remove_files(paths: List[str]):
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError as e:
+            print(f"[WARNING] Failed to remove temp file {path}: {e}")
+
+
+class BatchItem:
+    """One file of the batch and its outcome."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.tracker = StageTracker()
+        self.status = 'pending'
+        self.error: Optional[str] = None
+        self.outputs: List[dict] = []
+        self.elapsed: Optional[float] = None
+
+    def report(self) -> dict:
+        return {
+            'file': str(self.path),
+            'status': self.status,
+            'error': self.error,
+            'failed_stage': self.tracker.stage if self.status == 'failed' else None,
+            'elapsed': self.elapsed,
+            'stage_timings': dict(self.tracker.timings),
+            'counters': dict(self.tracker.counters),
+            'outputs': [output['path'] for output in self.outputs],
+        }
+
+
+class BatchRunner:
+    """Runs many files through bounded stages concurrently."""
+
+    def __init__(self, source_lang: str, target_langs: List[str], modes: List[str],
+                 external_srt: bool = False, limits: Optional[dict] = None,
+                 segment: bool = SEGMENT_ASR, trim: bool = TRIM_SILENCE,
+                 formats: Optional[List[str]] = None):
+        self.source_lang = source_lang
+        self.target_langs = target_langs
+        self.modes = modes
+        self.external_srt = external_srt
+        self.segment = segment
+        self.trim = trim
+        self.formats = formats or DEFAULT_FORMATS
+        self.limits = {**DEFAULT_LIMITS, **(limits or {})}
+        self._slots = {}
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    @asynccontextmanager
+    async def stage(self, item: BatchItem, name: str, track: bool = True):
+        """Wait for a free slot in `name`, then record the time spent in it."""
+        queued = time.perf_counter()
+        async with self._slots[name]:
+            wait = time.perf_counter() - queued
+            item.tracker.counters[f'{name}_queue_wait'] = round(
+                item.tracker.counters.get(f'{name}_queue_wait', 0.0) + wait, 3
+            )
+            if track:
+                with item.tracker.track(name):
+                    yield
+            else:
+                item.tracker.stage = name
+                yield
+
+    @asynccontextmanager
+    async def _asr_stage(self, item: BatchItem, name: str):
+        """`stage` for the shared pipeline helpers (see SHARED_SLOTS)."""
+        if name in SHARED_SLOTS:
+            async with self.stage(item, SHARED_SLOTS[name], track=False):
+                with item.tracker.track(name):
+                    yield
+        else:
+            async with self.stage(item, name):
+                yield
+
+    async def run(self, paths: List[Path]) -> dict:
+        self._slots = {name: asyncio.Semaphore(max(1, self.limits[name])) for name in STAGES}
+        items = [BatchItem(path) for path in paths]
+        started = time.perf_counter()
+        # spawn: forking a process that already runs asyncio and worker threads is unsafe
+        self._pool = ProcessPoolExecutor(max_workers=max(1, self.limits['extract']),
+                                         mp_context=multiprocessing.get_context('spawn'))
+        try:
+            await asyncio.gather(*(self._run_item(item) for item in items))
+        finally:
+            self._pool.shutdown(cancel_futures=True)
+            await client.close_async_client()
+        return self._report(items, time.perf_counter() - started)
+
+    async def _run_item(self, item: BatchItem):
+        started = time.perf_counter()
+        item.status = 'running'
+        try:
+            item.outputs = await self._process(item)
+            item.status = 'completed'
+        except Exception as e:
+            item.status = 'failed'
+            item.error = str(e)
+            print(f"[ERROR] {item.path.name}: {e}")
+        item.elapsed = round(time.perf_counter() - started, 3)
+
+    async def _process(self, item: BatchItem) -> List[dict]:
+        path = item.path
+        output_dir = path.parent
+        srt_path = path.with_suffix('.srt')
+
+        if self.external_srt and srt_path.exists():
+            async with self.stage(item, 'translate', track=False):
+                result = await run_translation_only(srt_path, self.source_lang, self.target_langs,
+                                                    self.modes, output_dir, item.tracker, self.formats)
+            return result['outputs']
+
+        checkpoint = await asyncio.to_thread(Checkpoint.load, path, self.source_lang)
+        item.tracker.counters['resumed'] = int(bool(checkpoint.data))
+        subs = checkpoint.get('subs')
+        if subs is None:
+            subs = await self._transcribe(item, checkpoint)
+            await asyncio.to_thread(checkpoint.save, 'subs', subs)
+
+        async with self.stage(item, 'translate', track=False):
+            outputs = await translate_and_write(cues_from_subs(subs), path.stem, self.source_lang,
+                                                self.target_langs, self.modes, output_dir, item.tracker,
+                                                checkpoint, self.formats)
+        if not item.tracker.counters.get('translation_failures'):
+            await asyncio.to_thread(checkpoint.clear)
+        return outputs
+
+    async def _transcribe(self, item: BatchItem, checkpoint: Checkpoint) -> List[dict]:
+        """Same stages and checkpoints (audio, trim, uploaded) as pipeline._transcribe_audio, in batch slots."""
+        path = item.path
+        stage = functools.partial(self._asr_stage, item)
+        temp_files = []
+        with started_calls() as shared:
+            try:
+                hash_info = checkpoint.audio()
+                if hash_info is not None:
+                    print(f"[INFO] {path.name}: audio from checkpoint: {hash_info['file_path']}")
+                elif path.suffix.lower() in SUPPORTED_VIDEO_EXTENSIONS:
+                    # Transcode and hash in a worker process; cached audio skips both
+                    async with self.stage(item, 'extract'):
+                        loop = asyncio.get_running_loop()
+                        hash_info = await loop.run_in_executor(self._pool, extract_audio_to_file, str(path))
+                        if hash_info is None:
+                            raise PipelineError("Failed to extract audio from video")
+                    item.tracker.counters['audio_cache_hit'] = int(hash_info.get('cached', False))
+                else:
+                    async with self.stage(item, 'hash'):
+                        hash_info = await generate_data_hash_async(str(path))
+
+                if hash_info.get('temporary'):
+                    temp_files.append(hash_info['file_path'])
+                await asyncio.to_thread(checkpoint.save_audio, hash_info)
+
+                async with self.stage(item, 'hash'):
+                    subtitle_result = await cached_subtitles_async(hash_info['dataHash'], self.source_lang)
+                item.tracker.counters['asr_cache_hit'] = int(subtitle_result is not None)
+
+                if subtitle_result is None:
+                    asr_info, offsets, segment = hash_info, None, self.segment
+                    if self.trim:
+                        asr_info, trimmed_path, offsets, resumed = await trim_for_asr(
+                            hash_info, hash_info['file_path'], checkpoint, stage
+                        )
+                        if trimmed_path is not None:
+                            temp_files.append(trimmed_path)
+                        if resumed:
+                            segment = False
+
+                    subtitle_result = await request_asr(asr_info, asr_info['file_path'], asr_info['file_path'],
+                                                        self.source_lang, segment, item.tracker, checkpoint, stage)
+
+                    if offsets is not None:
+                        subtitle_result = remap_result(subtitle_result, offsets)
+                        await asyncio.to_thread(store_subtitles, hash_info['dataHash'], self.source_lang,
+                                                subtitle_result)
+            finally:
+                # Shared uploads/segmentations may still read these for other callers
+                release_after(shared, functools.partial(_remove_files, temp_files))
+        return subtitle_result['data']['subs']
+
+    def _report(self, items: List[BatchItem], wall: float) -> dict:
+        stage_totals = {}
+        for item in items:
+            for name, seconds in item.tracker.timings.items():
+                stage_totals[name] = round(stage_totals.get(name, 0.0) + seconds, 3)
+        return {
+            'files': len(items),
+            'completed': sum(1 for item in items if item.status == 'completed'),
+            'failed': sum(1 for item in items if item.status == 'failed'),
+            'wall_time': round(wall, 3),
+            'stage_totals': stage_totals,
+            'limits': self.limits,
+            'upstream': ratelimit.stats(),
+            'items': [item.report() for item in items],
+        }
+
+
+def print_report(report: dict):
+    columns = ('extract', 'trim', 'hash', 'exists', 'upload', 'asr', 'translate', 'write')
+    print("\n" + "=" * 60)
+    print(f"Batch: {report['completed']}/{report['files']} completed, "
+          f"{report['failed']} failed, {report['wall_time']:.1f}s wall time")
+    print("=" * 60)
+    print(f"{'file':<32}" + ''.join(f"{name:>10}" for name in columns) + "  status")
+    for entry in report['items']:
+        name = os.path.basename(entry['file'])
+        if len(name) > 31:
+            name = name[:28] + '...'
+        timings = entry['stage_timings']
+        cells = ''.join(
+            f"{timings[col]:>10.1f}" if col in timings else f"{'-':>10}" for col in columns
+        )
+        status = entry['status']
+        if entry['error']:
+            status += f" ({entry['failed_stage']}: {entry['error']})"
+        print(f"{name:<32}{cells}  {status}")
+    totals = report['stage_totals']
+    print(f"{'total (stage time)':<32}" + ''.join(
+        f"{totals[col]:>10.1f}" if col in totals else f"{'-':>10}" for col in columns
+    ))
+
+
+def run_batch(target: str, source_lang: str, target_langs: List[str], modes: List[str],
+              external_srt: bool = False, limits: Optional[dict] = None,
+              report_path: Optional[str] = None, segment: bool = SEGMENT_ASR,
+              trim: bool = TRIM_SILENCE, formats: Optional[List[str]] = None) -> dict:
+    """Entry point used by main.py; prints the report and optionally saves it as JSON."""
+    paths = find_batch_files(target)
+    if not paths:
+        raise PipelineError(f"No media files found: {target}")
+    print(f"[INFO] Batch: {len(paths)} files")
+
+    runner = BatchRunner(source_lang, target_langs, modes, external_srt, limits, segment, trim, formats)
+    report = asyncio.run(runner.run(paths))
+    print_report(report)
+    if report_path:
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"[OK] Batch report saved: {report_path}")
+    return report
@@ -0,0 +1,376 @@
+"""
+Offline benchmark of main.py and the API against the fake dioco server.
+
+Every scenario (target x file size x cue count x concurrency) gets fresh
+random input files and an empty cache directory (the API target gets a
+freshly started server per scenario), so each run goes through
+hashing, upload, ASR polling, translation and writing. Inputs are audio
+files, so ffmpeg is not part of the measurement.
+
+    python benchmark.py
+    python benchmark.py --targets api --sizes 1M 16M --cues 100 5000 --concurrency 1 8 32
+    python benchmark.py --json bench.json
+    python benchmark.py --baseline bench.json     # exit 1 on a regression beyond --tolerance
+
+Reports latency percentiles, throughput and peak RSS of the measured processes.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List, Optional
+
+import httpx
+
+from fake_dioco import FakeConfig, start_server
+
+ROOT = Path(__file__).resolve().parent
+_UNITS = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+
+def parse_size(text: str) -> int:
+    text = text.strip().upper().rstrip('B')
+    if text and text[-1] in _UNITS:
+        return int(float(text[:-1]) * _UNITS[text[-1]])
+    return int(text)
+
+
+def format_size(size: int) -> str:
+    for unit in ('G', 'M', 'K'):
+        if size >= _UNITS[unit] and size % _UNITS[unit] == 0:
+            return f"{size // _UNITS[unit]}{unit}"
+    return str(size)
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile: the smallest value with at least pct% of the values at or below it."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    # pct * n / 100 rather than pct / 100 * n: keeps exact ranks exact (7 / 100 * 100 > 7)
+    return ordered[max(0, math.ceil(pct * len(ordered) / 100) - 1)]
+
+
+def summarize(latencies: List[float], wall: float, size: int, errors: int, peak_rss: Optional[int]) -> dict:
+    done = len(latencies)
+    return {
+        'requests': done + errors,
+        'errors': errors,
+        'wall_seconds': round(wall, 3),
+        'throughput_per_second': round(done / wall, 3) if wall else 0.0,
+        'throughput_mb_per_second': round(done * size / wall / 1024 ** 2, 3) if wall else 0.0,
+        'latency': {
+            'mean': round(sum(latencies) / done, 3) if done else 0.0,
+            'p50': round(percentile(latencies, 50), 3),
+            'p90': round(percentile(latencies, 90), 3),
+            'p95': round(percentile(latencies, 95), 3),
+            'p99': round(percentile(latencies, 99), 3),
+            'max': round(max(latencies), 3) if latencies else 0.0,
+        },
+        'peak_rss_mb': round(peak_rss / 1024 ** 2, 1) if peak_rss is not None else None,
+    }
+
+
+def make_inputs(directory: Path, count: int, size: int, prefix: str) -> List[Path]:
+    """Random (so uniquely hashed) files of `size` bytes."""
+    paths = []
+    for i in range(count):
+        path = directory / f"{prefix}_{i:04d}.mp3"
+        with open(path, 'wb') as f:
+            remaining = size
+            while remaining:
+                chunk = min(remaining, 1024 * 1024)
+                f.write(os.urandom(chunk))
+                remaining -= chunk
+        paths.append(path)
+    return paths
+
+
+def _maxrss_bytes(usage) -> int:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    return usage.ru_maxrss if sys.platform == 'darwin' else usage.ru_maxrss * 1024
+
+
+def _child_env(fake_url: str, cache_dir: Path, workspace: Optional[Path] = None) -> dict:
+    env = {
+        **os.environ,
+        'LR_DIOCO_API_BASE': fake_url,
+        'LR_DIOCO_CDN_BASE': fake_url,
+        'LR_CACHE_DIR': str(cache_dir),
+        'PYTHONUNBUFFERED': '1',
+    }
+    if workspace is not None:
+        env['LR_WORKSPACE_DIR'] = str(workspace)
+    return env
+
+
+def _run_cli_once(path: Path, env: dict, args: argparse.Namespace) -> tuple:
+    cmd = [sys.executable, str(ROOT / 'main.py'), str(path), '--source', 'ja', '--dest', *args.dest,
+           '--subtitle-mode', args.mode]
+    started = time.perf_counter()
+    proc = subprocess.Popen(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    peak = None
+    if hasattr(os, 'wait4'):
+        _, status, usage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        peak = _maxrss_bytes(usage)
+    else:
+        proc.wait()
+    return time.perf_counter() - started, proc.returncode == 0, peak
+
+
+async def bench_cli(work: Path, fake_url: str, size: int, count: int, concurrency: int,
+                    args: argparse.Namespace) -> dict:
+    """`count` main.py processes, `concurrency` at a time; peak RSS is the largest single process."""
+    paths = make_inputs(work, count, size, 'cli')
+    env = _child_env(fake_url, work / 'cache')
+    slots = asyncio.Semaphore(concurrency)
+    latencies, errors, peaks = [], 0, []
+
+    async def run(path):
+        nonlocal errors
+        async with slots:
+            latency, ok, peak = await asyncio.to_thread(_run_cli_once, path, env, args)
+        if ok:
+            latencies.append(latency)
+        else:
+            errors += 1
+        if peak is not None:
+            peaks.append(peak)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(run(path) for path in paths))
+    return summarize(latencies, time.perf_counter() - started, size, errors, max(peaks) if peaks else None)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _reset_peak_rss(pid: int):
+    # Linux: writing 5 to clear_refs resets VmHWM so each scenario reports its own peak
+    try:
+        with open(f'/proc/{pid}/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def _peak_rss(pid: int) -> Optional[int]:
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+class ApiServer:
+    """uvicorn running app.py in a subprocess, pointed at the fake server and a scratch workspace."""
+
+    def __init__(self, work: Path, fake_url: str):
+        self.workspace = work / 'workspace'
+        self.workspace.mkdir()
+        self.port = _free_port()
+        self.url = f'http://127.0.0.1:{self.port}'
+        self.proc = subprocess.Popen(
+            [sys.executable, '-m', 'uvicorn', 'app:app', '--host', '127.0.0.1', '--port', str(self.port),
+             '--log-level', 'warning'],
+            cwd=ROOT, env=_child_env(fake_url, work / 'cache', self.workspace),
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+
+    async def wait_ready(self, timeout: float = 30.0):
+        deadline = time.monotonic() + timeout
+        async with httpx.AsyncClient() as http:
+            while time.monotonic() < deadline:
+                if self.proc.poll() is not None:
+                    raise RuntimeError(f"API server exited with {self.proc.returncode}")
+                try:
+                    if (await http.get(self.url + '/')).status_code == 200:
+                        return
+                except httpx.TransportError:
+                    pass
+                await asyncio.sleep(0.2)
+        raise RuntimeError("API server did not start")
+
+    def stop(self):
+        self.proc.terminate()
+        try:
+            self.proc.wait(10)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+
+
+async def bench_api_scenario(work: Path, fake_url: str, size: int, count: int, concurrency: int,
+                             args: argparse.Namespace) -> dict:
+    """bench_api against a server started for this scenario only."""
+    server = ApiServer(work, fake_url)
+    try:
+        await server.wait_ready()
+        return await bench_api(server, size, count, concurrency, 'bench', args)
+    finally:
+        server.stop()
+
+
+async def bench_api(server: ApiServer, size: int, count: int, concurrency: int, tag: str,
+                    args: argparse.Namespace) -> dict:
+    """`count` POST /transcribe calls, `concurrency` in flight; peak RSS is the server's."""
+    paths = make_inputs(server.workspace, count, size, tag)
+    _reset_peak_rss(server.proc.pid)
+    slots = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async with httpx.AsyncClient(base_url=server.url, timeout=None,
+                                 limits=httpx.Limits(max_connections=concurrency)) as http:
+        async def run(path):
+            nonlocal errors
+            async with slots:
+                started = time.perf_counter()
+                response = await http.post('/transcribe', json={
+                    'filename': path.name, 'source_lang': 'ja', 'target_lang': args.dest, 'mode': args.mode,
+                })
+                if response.status_code == 200:
+                    latencies.append(time.perf_counter() - started)
+                else:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(run(path) for path in paths))
+        wall = time.perf_counter() - started
+
+    return summarize(latencies, wall, size, errors, _peak_rss(server.proc.pid))
+
+
+async def run_matrix(args: argparse.Namespace) -> List[dict]:
+    config = FakeConfig(latency=args.latency, asr_delay=args.asr_delay, asr_factor=args.asr_factor,
+                        translate_delay=args.translate_delay, seed=0)
+    fake = start_server(config)
+    results = []
+    try:
+        for target in args.targets:
+            work = Path(tempfile.mkdtemp(prefix=f'lr-bench-{target}-'))
+            try:
+                for size in args.sizes:
+                    for cues in args.cues:
+                        for concurrency in args.concurrency:
+                            # The fake server reads its config per request, so switching cue counts is live
+                            config.cues = cues
+                            count = args.requests or concurrency * 2
+                            label = f"{target} size={format_size(size)} cues={cues} c={concurrency}"
+                            print(f"[INFO] {label} ({count} requests)", flush=True)
+                            # Fresh cache (and for the API a fresh process) so no scenario runs warm
+                            scenario_dir = Path(tempfile.mkdtemp(dir=work))
+                            try:
+                                if target == 'api':
+                                    summary = await bench_api_scenario(scenario_dir, fake.base_url, size,
+                                                                       count, concurrency, args)
+                                else:
+                                    summary = await bench_cli(scenario_dir, fake.base_url, size, count,
+                                                              concurrency, args)
+                            finally:
+                                shutil.rmtree(scenario_dir, ignore_errors=True)
+                            results.append({'target': target, 'size': size, 'cues': cues,
+                                            'concurrency': concurrency, **summary})
+            finally:
+                shutil.rmtree(work, ignore_errors=True)
+    finally:
+        fake.shutdown()
+        fake.server_close()
+    return results
+
+
+def print_results(results: List[dict]):
+    header = (f"{'target':<6}{'size':>7}{'cues':>7}{'conc':>6}{'reqs':>6}{'err':>5}"
+              f"{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}{'req/s':>9}{'MB/s':>9}{'rss MB':>9}")
+    print("\n" + header)
+    print("-" * len(header))
+    for r in results:
+        lat = r['latency']
+        rss = f"{r['peak_rss_mb']:.1f}" if r['peak_rss_mb'] is not None else '-'
+        print(f"{r['target']:<6}{format_size(r['size']):>7}{r['cues']:>7}{r['concurrency']:>6}"
+              f"{r['requests']:>6}{r['errors']:>5}{lat['p50']:>9.3f}{lat['p95']:>9.3f}{lat['p99']:>9.3f}"
+              f"{lat['max']:>9.3f}{r['throughput_per_second']:>9.2f}{r['throughput_mb_per_second']:>9.2f}{rss:>9}")
+
+
+def _scenario_key(r: dict) -> tuple:
+    return r['target'], r['size'], r['cues'], r['concurrency']
+
+
+def compare(results: List[dict], baseline: List[dict], tolerance: float) -> List[str]:
+    """Regressions beyond `tolerance` (fraction) in p50/p95 latency, throughput or peak RSS."""
+    previous = {_scenario_key(r): r for r in baseline}
+    regressions = []
+    for r in results:
+        old = previous.get(_scenario_key(r))
+        if old is None:
+            continue
+        label = f"{r['target']} size={format_size(r['size'])} cues={r['cues']} c={r['concurrency']}"
+        for pct in ('p50', 'p95'):
+            if old['latency'][pct] and r['latency'][pct] > old['latency'][pct] * (1 + tolerance):
+                regressions.append(f"{label}: {pct} {old['latency'][pct]:.3f}s -> {r['latency'][pct]:.3f}s")
+        if old['throughput_per_second'] and \
+                r['throughput_per_second'] < old['throughput_per_second'] * (1 - tolerance):
+            regressions.append(f"{label}: throughput {old['throughput_per_second']:.2f} -> "
+                               f"{r['throughput_per_second']:.2f} req/s")
+        if old.get('peak_rss_mb') and r.get('peak_rss_mb') and \
+                r['peak_rss_mb'] > old['peak_rss_mb'] * (1 + tolerance):
+            regressions.append(f"{label}: peak RSS {old['peak_rss_mb']:.1f} -> {r['peak_rss_mb']:.1f} MB")
+        if r['errors'] > old['errors']:
+            regressions.append(f"{label}: errors {old['errors']} -> {r['errors']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline throughput/latency benchmark against fake_dioco.py')
+    parser.add_argument('--targets', nargs='+', default=['cli', 'api'], choices=['cli', 'api'])
+    parser.add_argument('--sizes', nargs='+', default=['256K', '4M'], help='input file sizes (e.g. 512K 8M)')
+    parser.add_argument('--cues', nargs='+', type=int, default=[50, 2000], help='cues per ASR result')
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 4])
+    parser.add_argument('--requests', type=int, help='requests per scenario (default: 2 x concurrency)')
+    parser.add_argument('--dest', nargs='+', default=['ko'], help='target languages')
+    parser.add_argument('--mode', default='dual', choices=['orig', 'dual', 'trans'])
+    parser.add_argument('--latency', type=float, default=0.005, help='fake server latency per response (s)')
+    parser.add_argument('--asr-delay', type=float, default=0.5, help='fake ASR processing time per upload (s)')
+    parser.add_argument('--asr-factor', type=float, default=0.0, help='fake ASR seconds per second of audio')
+    parser.add_argument('--translate-delay', type=float, default=0.05, help='fake seconds per translation request')
+    parser.add_argument('--json', metavar='PATH', help='write the results as JSON')
+    parser.add_argument('--baseline', metavar='PATH', help='results JSON to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed regression vs baseline (0.25 = 25%%)')
+    args = parser.parse_args()
+    args.sizes = [parse_size(size) for size in args.sizes]
+
+    results = asyncio.run(run_matrix(args))
+    print_results(results)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'created_at': time.time(), 'results': results}, f, indent=2)
+        print(f"\n[OK] Results saved: {args.json}")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n[ERROR] {len(regressions)} regression(s) beyond {args.tolerance:.0%}:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"\n[OK] No regressions beyond {args.tolerance:.0%} against {args.baseline}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,251 @@
+# 로컬 디스크 캐시 (SQLite 기반 LRU)
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# 캐시 저장 위치 (환경변수로 변경 가능)
+CACHE_DIR = os.environ.get(
+    'LR_CACHE_DIR',
+    os.path.join(os.path.expanduser('~'), '.cache', 'language-transcribe')
+)
+
+# 다른 프로세스(API/워커 레플리카)가 쓰기 잠금을 잡고 있을 때 기다리는 최대 시간(초)
+BUSY_TIMEOUT = float(os.environ.get('LR_CACHE_BUSY_TIMEOUT', '30'))
+
+
+def enable_wal(conn):
+    # WAL: 읽기가 쓰기를 막지 않고, 쓰기끼리만 busy timeout 안에서 차례로 진행됨 (DB 파일에 유지되는 설정)
+    conn.execute('PRAGMA journal_mode=WAL')
+
+
+class DiskCache:
+    # key -> JSON 값을 저장하는 크기 제한 캐시
+    # 최대 개수를 넘으면 가장 오래 사용되지 않은 항목부터 삭제
+
+    # 만들어진 모든 캐시 (/metrics 적중률 집계용)
+    instances = []
+
+    def __init__(self, name, max_entries=10000, cache_dir=None):
+        DiskCache.instances.append(self)
+        self.name = name
+        self.max_entries = max_entries
+        self.path = os.path.join(cache_dir or CACHE_DIR, f"{name}.sqlite3")
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self):
+        # 호출마다 새 연결 사용 (스레드/프로세스 간 공유 안전)
+        if not self._initialized:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT)
+        if not self._initialized:
+            enable_wal(conn)
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS entries ('
+                ' key TEXT PRIMARY KEY,'
+                ' value TEXT NOT NULL,'
+                ' accessed REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)')
+            conn.commit()
+            self._initialized = True
+        return conn
+
+    def get(self, key, validate=None):
+        # 캐시 조회 (없으면 None)
+        # validate(value)가 False면 오래된 항목으로 보고 삭제 후 미스 처리
+        try:
+            conn = self._connect()
+        except sqlite3.Error as e:
+            print(f"    [WARNING] 캐시 열기 실패 ({self.name}): {e}")
+            self._count(hit=False)
+            return None
+
+        try:
+            with conn:
+                row = conn.execute('SELECT value FROM entries WHERE key = ?', (key,)).fetchone()
+                if row is not None:
+                    conn.execute('UPDATE entries SET accessed = ? WHERE key = ?', (time.time(), key))
+        except sqlite3.Error as e:
+            print(f"    [WARNING] 캐시 조회 실패 ({self.name}): {e}")
+            row = None
+        finally:
+            conn.close()
+
+        value = json.loads(row[0]) if row is not None else None
+        if value is not None and validate is not None and not validate(value):
+            self.delete(key)
+            value = None
+
+        self._count(hit=value is not None)
+        return value
+
+    def set(self, key, value):
+        # 캐시 저장 후 최대 개수 초과분 삭제
+        try:
+            conn = self._connect()
+        except sqlite3.Error as e:
+            print(f"    [WARNING] 캐시 열기 실패 ({self.name}): {e}")
+            return
+
+        try:
+            with conn:
+                conn.execute(
+                    'INSERT OR REPLACE INTO entries (key, value, accessed) VALUES (?, ?, ?)',
+                    (key, json.dumps(value, ensure_ascii=False), time.time())
+                )
+                self._evict(conn)
+        except sqlite3.Error as e:
+            print(f"    [WARNING] 캐시 저장 실패 ({self.name}): {e}")
+        finally:
+            conn.close()
+
+    def update(self, key, fn):
+        # 읽기-수정-쓰기를 한 트랜잭션으로 처리 (다른 프로세스의 같은 키 갱신과 섞이지 않음)
+        # fn(기존 값 또는 None) -> 새 값, None이면 항목 삭제. 저장된 새 값을 돌려줌 (실패 시 None)
+        try:
+            conn = self._connect()
+        except sqlite3.Error as e:
+            print(f"    [WARNING] 캐시 열기 실패 ({self.name}): {e}")
+            return None
+
+        conn.isolation_level = None
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = conn.execute('SELECT value FROM entries WHERE key = ?', (key,)).fetchone()
+                value = fn(json.loads(row[0]) if row is not None else None)
+                if value is None:
+                    conn.execute('DELETE FROM entries WHERE key = ?', (key,))
+                else:
+                    conn.execute(
+                        'INSERT OR REPLACE INTO entries (key, value, accessed) VALUES (?, ?, ?)',
+                        (key, json.dumps(value, ensure_ascii=False), time.time())
+                    )
+                    self._evict(conn)
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+        except sqlite3.Error as e:
+            print(f"    [WARNING] 캐시 저장 실패 ({self.name}): {e}")
+            value = None
+        finally:
+            conn.close()
+        return value
+
+    def get_many(self, keys):
+        # 여러 키를 한 번에 조회 -> {key: value} (없는 키는 빠짐)
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        if not keys:
+            return found
+        try:
+            conn = self._connect()
+        except sqlite3.Error as e:
+            print(f"    [WARNING] 캐시 열기 실패 ({self.name}): {e}")
+            self._count_many(0, len(keys))
+            return found
+
+        try:
+            with conn:
+                now = time.time()
+                # SQLite 변수 개수 제한 때문에 나눠서 조회
+                for i in range(0, len(keys), 500):
+                    batch = keys[i:i + 500]
+                    marks = ','.join('?' * len(batch))
+                    rows = conn.execute(
+                        f'SELECT key, value FROM entries WHERE key IN ({marks})', batch
+                    ).fetchall()
+                    for key, value in rows:
+                        found[key] = json.loads(value)
+                    conn.execute(
+                        f'UPDATE entries SET accessed = ? WHERE key IN ({marks})', [now, *batch]
+                    )
+        except sqlite3.Error as e:
+            print(f"    [WARNING] 캐시 조회 실패 ({self.name}): {e}")
+            found = {}
+        finally:
+            conn.close()
+
+        self._count_many(len(found), len(keys) - len(found))
+        return found
+
+    def set_many(self, items):
+        # 여러 항목을 한 트랜잭션으로 저장
+        items = list(items.items()) if isinstance(items, dict) else list(items)
+        if not items:
+            return
+        try:
+            conn = self._connect()
+        except sqlite3.Error as e:
+            print(f"    [WARNING] 캐시 열기 실패 ({self.name}): {e}")
+            return
+
+        try:
+            with conn:
+                now = time.time()
+                conn.executemany(
+                    'INSERT OR REPLACE INTO entries (key, value, accessed) VALUES (?, ?, ?)',
+                    [(key, json.dumps(value, ensure_ascii=False), now) for key, value in items]
+                )
+                self._evict(conn)
+        except sqlite3.Error as e:
+            print(f"    [WARNING] 캐시 저장 실패 ({self.name}): {e}")
+        finally:
+            conn.close()
+
+    def delete(self, key):
+        # 항목 무효화
+        try:
+            conn = self._connect()
+        except sqlite3.Error:
+            return
+        try:
+            with conn:
+                conn.execute('DELETE FROM entries WHERE key = ?', (key,))
+        except sqlite3.Error as e:
+            print(f"    [WARNING] 캐시 삭제 실패 ({self.name}): {e}")
+        finally:
+            conn.close()
+
+    def _evict(self, conn):
+        count = conn.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+        overflow = count - self.max_entries
+        if overflow > 0:
+            conn.execute(
+                'DELETE FROM entries WHERE key IN ('
+                ' SELECT key FROM entries ORDER BY accessed LIMIT ?)',
+                (overflow,)
+            )
+            with self._lock:
+                self.evictions += overflow
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def _count_many(self, hits, misses):
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+
+    def stats(self):
+        # 적중/미스 카운터
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'name': self.name,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': self.hits / total if total else 0.0,
+            }
@@ -0,0 +1,121 @@
+"""
+Per-job checkpoints so an interrupted run resumes from its last completed stage.
+
+A checkpoint is keyed by the input file's identity and the source language
+and records, as each stage finishes:
+
+    audio        hash_info of the extracted audio (only when it lives on disk)
+    trim         dataHash, size and kept stretches of the trimmed audio
+    uploaded     dataHash confirmed on the server (uploaded or already present)
+    subs         final ASR subs on the original timeline
+    translations {dest: [translated lines]}
+
+Several runs may share a checkpoint (other target languages or modes,
+/transcribe next to a queued job, two workers): every stage is merged into
+the stored record in one transaction, never written back as a whole, and
+translations are merged per language. A finished run removes only what it
+owns (the stages it resumed from or saved itself), so the record survives
+until the last run on it is done.
+"""
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Optional
+
+from cache import DiskCache
+
+checkpoints = DiskCache('checkpoints', max_entries=int(os.environ.get('LR_CHECKPOINT_MAX', '1000')))
+
+
+def checkpoint_key(input_path, source_lang: str) -> str:
+    input_path = os.path.abspath(input_path)
+    st = os.stat(input_path)
+    raw = json.dumps([input_path, st.st_size, st.st_mtime_ns, st.st_ino, source_lang])
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class Checkpoint:
+    """Stage results of one job, written through to the checkpoint store."""
+
+    def __init__(self, key: Optional[str], data: Optional[dict] = None):
+        self.key = key
+        self.data = data or {}
+        # Stages ('translations', dest for translations) this run resumed from or saved
+        self._owned = {(stage, dest) for stage, value in self.data.items()
+                       for dest in (value if stage == 'translations' else [None])}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, input_path, source_lang: str) -> 'Checkpoint':
+        key = checkpoint_key(input_path, source_lang)
+        data = checkpoints.get(key)
+        if data:
+            print(f"[INFO] Checkpoint found, resuming after: {', '.join(data)}")
+        return cls(key, data)
+
+    def get(self, stage: str, default: Any = None) -> Any:
+        return self.data.get(stage, default)
+
+    def _merge(self, stage: str, dest: Optional[str], value: Any):
+        # Merge one stage into the stored record (and pick up what other runs saved meanwhile)
+        def merge(data: Optional[dict]) -> dict:
+            data = dict(data or {})
+            if dest is None:
+                data[stage] = value
+            else:
+                data[stage] = {**data.get(stage, {}), dest: value}
+            return data
+
+        with self._lock:
+            self._owned.add((stage, dest))
+            stored = checkpoints.update(self.key, merge) if self.key is not None else None
+            self.data = stored if stored is not None else merge(self.data)
+
+    def save(self, stage: str, value: Any):
+        self._merge(stage, None, value)
+
+    def save_translation(self, dest: str, lines: list):
+        self._merge('translations', dest, lines)
+
+    def audio(self) -> Optional[dict]:
+        """Checkpointed hash_info, if its audio file is still there unchanged."""
+        info = self.get('audio')
+        if info is None:
+            return None
+        try:
+            if os.path.getsize(info['file_path']) != info['size']:
+                return None
+        except OSError:
+            return None
+        return dict(info)
+
+    def save_audio(self, hash_info: dict):
+        # Spooled buffers and temp files do not survive a restart
+        if hash_info.get('file_path') and not hash_info.get('temporary'):
+            self.save('audio', {
+                'dataHash': hash_info['dataHash'],
+                'file_path': hash_info['file_path'],
+                'md5': hash_info['md5'],
+                'size': hash_info['size'],
+            })
+
+    def clear(self):
+        """Remove this run's stages; the record goes once nothing of other runs is left in it."""
+        def remove(data: Optional[dict]) -> Optional[dict]:
+            data = dict(data or {})
+            for stage, dest in owned:
+                if dest is None:
+                    data.pop(stage, None)
+                elif stage in data:
+                    data[stage] = {lang: lines for lang, lines in data[stage].items() if lang != dest}
+                    if not data[stage]:
+                        del data[stage]
+            return data or None
+
+        with self._lock:
+            owned = set(self._owned)
+            if self.key is not None:
+                checkpoints.update(self.key, remove)
+            self.data = {}
+            self._owned = set()
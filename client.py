@@ -0,0 +1,341 @@
+# dioco.io 공용 HTTP 클라이언트 (keep-alive 커넥션 풀 재사용)
+import asyncio
+import email.utils
+import os
+import random
+import threading
+import time
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+import profiling
+import ratelimit
+
+# 로컬 가짜 서버(fake_dioco.py) 등으로 돌릴 때는 환경변수로 변경
+API_BASE = os.environ.get('LR_DIOCO_API_BASE', 'https://api.dioco.io').rstrip('/')
+CDN_BASE = os.environ.get('LR_DIOCO_CDN_BASE', 'https://api-cdn.dioco.io').rstrip('/')
+
+# 호스트 수와 호스트당 최대 커넥션 수
+POOL_CONNECTIONS = int(os.environ.get('LR_POOL_CONNECTIONS', '4'))
+POOL_MAXSIZE = int(os.environ.get('LR_POOL_MAXSIZE', '16'))
+
+# (연결, 읽기) 타임아웃 초 - 업로드는 읽기 대기가 길어 따로 둠
+CONNECT_TIMEOUT = float(os.environ.get('LR_CONNECT_TIMEOUT', '10'))
+READ_TIMEOUT = float(os.environ.get('LR_READ_TIMEOUT', '60'))
+UPLOAD_READ_TIMEOUT = float(os.environ.get('LR_UPLOAD_READ_TIMEOUT', '600'))
+
+# 일시적인 실패(429, 5xx, 연결 오류/타임아웃)는 지수 백오프로 재시도
+RETRIES = int(os.environ.get('LR_HTTP_RETRIES', '3'))
+RETRY_BASE_DELAY = float(os.environ.get('LR_RETRY_BASE_DELAY', '0.5'))
+RETRY_MAX_DELAY = float(os.environ.get('LR_RETRY_MAX_DELAY', '30'))
+# 서버가 너무 긴 Retry-After를 주면 이 값으로 자름
+RETRY_AFTER_MAX = float(os.environ.get('LR_RETRY_AFTER_MAX', '120'))
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+BASE_HEADERS = {
+    'accept-language': 'ko,en;q=0.9,en-US;q=0.8',
+    'origin': 'https://www.languagereactor.com',
+    'referer': 'https://www.languagereactor.com/',
+    'user-agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+}
+
+JSON_HEADERS = {
+    'accept': 'application/json, text/plain, */*',
+    'content-type': 'application/json',
+}
+
+UPLOAD_HEADERS = {
+    'accept': '*/*',
+    'content-type': 'application/octet-stream',
+}
+
+TRANSLATE_HEADERS = {
+    **JSON_HEADERS,
+    'priority': 'u=1, i',
+    'sec-ch-ua': '"Microsoft Edge";v="143", "Chromium";v="143", "Not A(Brand";v="24"',
+    'sec-ch-ua-mobile': '?0',
+    'sec-ch-ua-platform': '"Windows"',
+    'sec-fetch-dest': 'empty',
+    'sec-fetch-mode': 'cors',
+    'sec-fetch-site': 'cross-site',
+}
+
+# --profile 트레이스에서 httpcore 단계 이벤트 이름 -> 구간 이름 (DNS 조회는 connect_tcp 안에 포함됨)
+HTTP_PHASES = {
+    'connection.connect_tcp': 'dns+connect',
+    'connection.start_tls': 'tls',
+    'http11.send_request_headers': 'send headers',
+    'http11.send_request_body': 'send body',
+    'http11.receive_response_headers': 'ttfb',
+    'http11.receive_response_body': 'transfer',
+    'http2.send_request_headers': 'send headers',
+    'http2.send_request_body': 'send body',
+    'http2.receive_response_headers': 'ttfb',
+    'http2.receive_response_body': 'transfer',
+}
+
+_session = None
+# --profile 트레이스가 켜져 있을 때만 쓰는 세션 (urllib3 내부 클래스로 커넥션 단계를 기록)
+_traced_session = None
+_session_lock = threading.Lock()
+
+_async_client = None
+
+
+class _TracedHTTPConnection(HTTPConnection):
+    # 새 커넥션을 맺는 시간(DNS + TCP)을 트레이스에 기록 (트레이스가 없으면 그냥 통과)
+    def _new_conn(self):
+        with profiling.span('dns+connect', 'http', host=self.host):
+            return super()._new_conn()
+
+
+class _TracedHTTPSConnection(HTTPSConnection):
+    def _new_conn(self):
+        with profiling.span('dns+connect', 'http', host=self.host):
+            return super()._new_conn()
+
+    def connect(self):
+        # TLS 핸드셰이크 시간 = 이 구간에서 안쪽 dns+connect 구간을 뺀 나머지
+        with profiling.span('connect+tls', 'http', host=self.host):
+            super().connect()
+
+
+class _TracedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TracedHTTPConnection
+
+
+class _TracedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TracedHTTPSConnection
+
+
+class _TracingAdapter(HTTPAdapter):
+    # 커넥션 풀만 위 클래스로 바꾼 HTTPAdapter
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _TracedHTTPConnectionPool,
+            'https': _TracedHTTPSConnectionPool,
+        }
+
+
+def _new_session(adapter_class):
+    session = requests.Session()
+    adapter = adapter_class(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update(BASE_HEADERS)
+    return session
+
+
+def get_session():
+    # 프로세스 전체에서 하나의 세션을 공유
+    # 트레이스가 켜진 요청만 커넥션 단계를 기록하는 별도 세션으로 보냄 (평소에는 기본 HTTPAdapter 그대로)
+    global _session, _traced_session
+    if profiling.current() is not None:
+        if _traced_session is None:
+            with _session_lock:
+                if _traced_session is None:
+                    _traced_session = _new_session(_TracingAdapter)
+        return _traced_session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _new_session(HTTPAdapter)
+    return _session
+
+
+def close_session():
+    # 풀에 남은 커넥션 정리 (서버 종료 시)
+    global _session, _traced_session
+    with _session_lock:
+        for session in (_session, _traced_session):
+            if session is not None:
+                session.close()
+        _session = _traced_session = None
+
+
+def _retry_after(response):
+    # Retry-After 헤더 (초 또는 HTTP 날짜) -> 초, 없으면 None
+    value = response.headers.get('retry-after') if response is not None else None
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = email.utils.parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return min(RETRY_AFTER_MAX, max(0.0, seconds))
+
+
+def _retry_delay(endpoint, attempt, retries, response=None, error=None):
+    # 응답/오류를 브레이커에 기록하고, 재시도할 거면 대기 시간(초)을 돌려줌 (None이면 그대로 끝냄)
+    if error is None and response.status_code not in RETRY_STATUSES:
+        endpoint.breaker.record_success()
+        return None
+
+    if error is not None:
+        reason = f"{type(error).__name__}: {error}"
+    else:
+        reason = f"HTTP {response.status_code}"
+    if response is not None and response.status_code == 429:
+        # 속도 제한은 서버 장애가 아니므로 브레이커에는 세지 않음
+        endpoint.count(throttled=1)
+    else:
+        endpoint.count(failures=1)
+        endpoint.breaker.record_failure()
+    if attempt >= retries or endpoint.breaker.state == ratelimit.OPEN:
+        return None
+
+    delay = _retry_after(response)
+    if delay is not None:
+        # 같은 엔드포인트로 가는 다른 요청도 함께 멈춤
+        endpoint.bucket.pause(delay)
+    else:
+        delay = random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+    endpoint.count(retries=1)
+    print(f"    [WARNING] {endpoint.name}: {reason} - {delay:.1f}초 후 재시도 ({attempt + 1}/{retries})")
+    return delay
+
+
+def _request_body(kwargs):
+    # 스트리밍 본문은 한 번 읽으면 끝이므로, 재시도마다 새로 만들 수 있게 함수로 받음
+    return {key: value() if key in ('data', 'content') and callable(value) else value
+            for key, value in kwargs.items()}
+
+
+def _trace_wait(endpoint, started):
+    # 속도 제한으로 기다린 시간을 트레이스에 기록
+    trace = profiling.current()
+    now = time.perf_counter()
+    if trace is not None and now - started >= 0.001:
+        trace.complete('rate_limit', 'http', started, now, {'endpoint': endpoint.name})
+
+
+def _trace_response(span, response):
+    span['status'] = response.status_code
+    span['bytes'] = len(response.content)
+
+
+def _httpcore_trace(trace):
+    # httpcore 단계 이벤트(*.started / *.complete / *.failed)를 요청 구간 안의 하위 구간으로 변환
+    started = {}
+
+    async def callback(event_name, info):
+        name, _, phase = event_name.rpartition('.')
+        if phase == 'started':
+            started[name] = time.perf_counter()
+        elif name in started and name in HTTP_PHASES:
+            trace.complete(HTTP_PHASES[name], 'http', started.pop(name), time.perf_counter(),
+                           {'failed': True} if phase == 'failed' else None)
+    return callback
+
+
+def post(url, headers=None, timeout=None, retries=RETRIES, **kwargs):
+    # 공용 세션으로 POST (헤더는 BASE_HEADERS 위에 덮어씀)
+    # 엔드포인트별 속도 제한을 지키고, 일시적인 실패는 재시도 (마지막 응답을 그대로 돌려주거나 마지막 예외를 던짐)
+    endpoint = ratelimit.endpoint_for_url(url)
+    for attempt in range(retries + 1):
+        endpoint.breaker.before_request()
+        started = time.perf_counter()
+        endpoint.count(requests=1, waited=endpoint.bucket.acquire())
+        _trace_wait(endpoint, started)
+        try:
+            with profiling.span(f'POST {endpoint.name}', 'http', attempt=attempt) as span:
+                started = time.perf_counter()
+                response = get_session().post(
+                    url,
+                    headers=headers,
+                    timeout=timeout or (CONNECT_TIMEOUT, READ_TIMEOUT),
+                    **_request_body(kwargs)
+                )
+                _trace_response(span, response)
+                # requests 세션은 단계 훅이 없으므로 elapsed(헤더 수신까지)로 TTFB/본문 수신을 나눔
+                trace = profiling.current()
+                if trace is not None:
+                    headers_at = started + response.elapsed.total_seconds()
+                    trace.complete('ttfb', 'http', started, headers_at)
+                    trace.complete('transfer', 'http', headers_at, time.perf_counter())
+        except (requests.ConnectionError, requests.Timeout) as e:
+            delay = _retry_delay(endpoint, attempt, retries, error=e)
+            if delay is None:
+                raise
+        else:
+            delay = _retry_delay(endpoint, attempt, retries, response=response)
+            if delay is None:
+                return response
+        time.sleep(delay)
+
+
+def get_async_client():
+    # 이벤트 루프용 비동기 클라이언트 (같은 풀 설정 사용)
+    global _async_client
+    if _async_client is None:
+        _async_client = httpx.AsyncClient(
+            headers=BASE_HEADERS,
+            limits=httpx.Limits(
+                max_connections=POOL_CONNECTIONS * POOL_MAXSIZE,
+                max_keepalive_connections=POOL_MAXSIZE,
+            ),
+            timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+        )
+    return _async_client
+
+
+async def close_async_client():
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+
+
+async def apost(url, headers=None, timeout=None, retries=RETRIES, **kwargs):
+    # 비동기 POST (post()와 같은 인자 형식, 같은 속도 제한/재시도)
+    if timeout is not None:
+        connect, read = timeout
+        kwargs['timeout'] = httpx.Timeout(read, connect=connect)
+    endpoint = ratelimit.endpoint_for_url(url)
+    trace = profiling.current()
+    if trace is not None:
+        kwargs['extensions'] = {**kwargs.get('extensions', {}), 'trace': _httpcore_trace(trace)}
+    for attempt in range(retries + 1):
+        endpoint.breaker.before_request()
+        started = time.perf_counter()
+        endpoint.count(requests=1, waited=await endpoint.bucket.acquire_async())
+        _trace_wait(endpoint, started)
+        try:
+            with profiling.span(f'POST {endpoint.name}', 'http', attempt=attempt) as span:
+                response = await get_async_client().post(url, headers=headers, **_request_body(kwargs))
+                _trace_response(span, response)
+        except httpx.TransportError as e:
+            delay = _retry_delay(endpoint, attempt, retries, error=e)
+            if delay is None:
+                raise
+        else:
+            delay = _retry_delay(endpoint, attempt, retries, response=response)
+            if delay is None:
+                return response
+        await asyncio.sleep(delay)
+
+
+async def iter_file(source, chunk_size=1024 * 1024):
+    # 파일(경로 또는 열린 파일 객체)을 청크 단위로 읽어 업로드 본문으로 넘김 (이벤트 루프를 막지 않음)
+    if isinstance(source, (str, os.PathLike)):
+        f = await asyncio.to_thread(open, source, 'rb')
+    else:
+        f = source
+        f.seek(0)
+    try:
+        while True:
+            chunk = await asyncio.to_thread(f.read, chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        if f is not source:
+            await asyncio.to_thread(f.close)
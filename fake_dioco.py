@@ -0,0 +1,255 @@
+"""
+Local stand-in for the dioco.io endpoints, for offline runs and benchmarks.
+
+Implements fasr_ada_UPLOAD, fasr_uploadAudio, fasr_asc and
+base_media_videoFileTranslations with configurable latency, ASR
+processing time and status progression, cue counts and injected errors.
+Point the client at it with
+
+    LR_DIOCO_API_BASE=http://127.0.0.1:8765 LR_DIOCO_CDN_BASE=http://127.0.0.1:8765
+
+State lives in memory; GET /_stats returns request counts and POST /_reset clears it.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+
+# Bytes per second of audio at the extraction bitrate (-b:a 32k), for simulated durations
+AUDIO_BYTES_PER_SECOND = 4000
+
+
+class FakeConfig:
+    """Behaviour of the fake server; every field has a CLI flag."""
+
+    def __init__(self, latency: float = 0.0, asr_delay: float = 1.0, asr_factor: float = 0.0,
+                 asr_chunks: int = 3, cues: int = 0, cue_seconds: float = 3.0,
+                 translate_delay: float = 0.0, translate_per_cue: float = 0.0,
+                 error_rate: float = 0.0, seed: Optional[int] = None):
+        self.latency = latency  # added to every response
+        self.asr_delay = asr_delay  # fixed ASR processing time per upload
+        self.asr_factor = asr_factor  # plus this fraction of the audio duration
+        self.asr_chunks = asr_chunks  # lastChunkIndex steps reported while processing
+        self.cues = cues  # cues per result; 0 means one per cue_seconds of audio
+        self.cue_seconds = cue_seconds
+        self.translate_delay = translate_delay
+        self.translate_per_cue = translate_per_cue
+        self.error_rate = error_rate  # fraction of requests answered with 503
+        self.random = random.Random(seed)
+
+
+class FakeState:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.uploads = {}  # dataHash -> (size, upload finished at)
+        self.requests = {}
+        self.errors = 0
+        self.bytes_received = 0
+
+    def count(self, endpoint: str):
+        with self.lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                'requests': dict(self.requests),
+                'uploads': len(self.uploads),
+                'bytes_received': self.bytes_received,
+                'errors': self.errors,
+            }
+
+
+def _size_from_hash(data_hash: str) -> int:
+    # dataHash is "<md5>_<size>"
+    try:
+        return int(data_hash.rsplit('_', 1)[1])
+    except (IndexError, ValueError):
+        return 0
+
+
+def asr_result(config: FakeConfig, data_hash: str, size: int) -> list:
+    """Deterministic subs for an upload: text is unique per dataHash so translation caches miss."""
+    duration = size / AUDIO_BYTES_PER_SECOND
+    count = config.cues or max(1, int(duration / config.cue_seconds))
+    step = max(1, int(duration * 1000 / count)) if duration else int(config.cue_seconds * 1000)
+    tag = data_hash[:8]
+    return [
+        {'begin': i * step, 'end': i * step + int(step * 0.9), 'text': f'{tag} line {i} of {count}'}
+        for i in range(count)
+    ]
+
+
+class FakeDiocoHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server: 'FakeDiocoServer'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_body(self) -> bytes:
+        if self.headers.get('transfer-encoding', '').lower() == 'chunked':
+            parts = []
+            while True:
+                size = int(self.rfile.readline().split(b';')[0].strip(), 16)
+                if size == 0:
+                    self.rfile.readline()
+                    break
+                parts.append(self.rfile.read(size))
+                self.rfile.readline()
+            return b''.join(parts)
+        return self.rfile.read(int(self.headers.get('content-length', 0)))
+
+    def _drain_body(self) -> int:
+        # Uploads are counted, not kept
+        if self.headers.get('transfer-encoding', '').lower() == 'chunked':
+            return len(self._read_body())
+        remaining = int(self.headers.get('content-length', 0))
+        total = remaining
+        while remaining:
+            chunk = self.rfile.read(min(remaining, 1024 * 1024))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+        return total - remaining
+
+    def _send(self, status: int, payload, headers: Optional[dict] = None):
+        body = json.dumps(payload).encode() if not isinstance(payload, bytes) else payload
+        self.send_response(status)
+        self.send_header('content-type', 'application/json' if not isinstance(payload, bytes) else 'text/html')
+        self.send_header('content-length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/_stats':
+            self._send(200, self.server.state.stats())
+        else:
+            self._send(404, {'status': 'error'})
+
+    def do_POST(self):
+        config, state = self.server.config, self.server.state
+        url = urlparse(self.path)
+        endpoint = url.path.strip('/')
+        state.count(endpoint)
+
+        if endpoint == '_reset':
+            self._read_body()
+            self.server.state = FakeState()
+            self._send(200, {'status': 'success'})
+            return
+
+        if endpoint == 'fasr_uploadAudio':
+            received = self._drain_body()
+            body = None
+        else:
+            received = 0
+            body = json.loads(self._read_body() or b'{}')
+
+        if config.latency:
+            time.sleep(config.latency)
+        if config.error_rate and config.random.random() < config.error_rate:
+            with state.lock:
+                state.errors += 1
+            self._send(503, b'<html>Service Unavailable</html>', {'retry-after': '0'})
+            return
+
+        if endpoint == 'fasr_ada_UPLOAD':
+            exists = body.get('dataHash') in state.uploads
+            self._send(200, {'status': 'success', 'data': {'exists': exists}})
+
+        elif endpoint == 'fasr_uploadAudio':
+            data_hash = parse_qs(url.query).get('dataHash', [''])[0]
+            with state.lock:
+                state.uploads[data_hash] = (received, time.monotonic())
+                state.bytes_received += received
+            self._send(200, {'status': 'success', 'data': {'dataHash': data_hash, 'size': received}})
+
+        elif endpoint == 'fasr_asc':
+            data_hash = body.get('dataHash', '')
+            upload = state.uploads.get(data_hash)
+            if upload is None:
+                self._send(200, {'status': 'error', 'data': {'status': 'NOT_FOUND'}})
+                return
+            size, uploaded_at = upload
+            size = size or _size_from_hash(data_hash)
+            processing = config.asr_delay + config.asr_factor * size / AUDIO_BYTES_PER_SECOND
+            elapsed = time.monotonic() - uploaded_at
+            if elapsed < processing:
+                chunk = int(config.asr_chunks * elapsed / processing) if processing else 0
+                self._send(200, {'status': 'success', 'data': {'status': {'lastChunkIndex': chunk}, 'subs': []}})
+            else:
+                subs = asr_result(config, data_hash, size)
+                self._send(200, {'status': 'success', 'data': {'status': 'COMPLETE', 'subs': subs}})
+
+        elif endpoint == 'base_media_videoFileTranslations':
+            subs = body.get('subs', [])
+            delay = config.translate_delay + config.translate_per_cue * len(subs)
+            if delay:
+                time.sleep(delay)
+            dest = body.get('destLangCode_G', '')
+            self._send(200, {'status': 'success', 'data': {'subs': [f'[{dest}] {text}' for text in subs]}})
+
+        else:
+            self._send(404, {'status': 'error'})
+
+
+class FakeDiocoServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, config: FakeConfig):
+        super().__init__(address, FakeDiocoHandler)
+        self.config = config
+        self.state = FakeState()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+
+def start_server(config: Optional[FakeConfig] = None, host: str = '127.0.0.1', port: int = 0) -> FakeDiocoServer:
+    """Serve in a daemon thread (port 0 picks a free port); call .shutdown() to stop."""
+    server = FakeDiocoServer((host, port), config or FakeConfig())
+    threading.Thread(target=server.serve_forever, name='fake-dioco', daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local fake of the dioco.io ASR/translation endpoints')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    parser.add_argument('--asr-delay', type=float, default=1.0, help='fixed ASR processing seconds per upload')
+    parser.add_argument('--asr-factor', type=float, default=0.0,
+                        help='extra ASR seconds per second of audio (size / 4000 B/s)')
+    parser.add_argument('--asr-chunks', type=int, default=3, help='progress steps reported while processing')
+    parser.add_argument('--cues', type=int, default=0, help='cues per result (0: one per --cue-seconds of audio)')
+    parser.add_argument('--cue-seconds', type=float, default=3.0)
+    parser.add_argument('--translate-delay', type=float, default=0.0, help='seconds per translation request')
+    parser.add_argument('--translate-per-cue', type=float, default=0.0, help='extra seconds per translated cue')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of requests answered with 503')
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    config = FakeConfig(args.latency, args.asr_delay, args.asr_factor, args.asr_chunks, args.cues,
+                        args.cue_seconds, args.translate_delay, args.translate_per_cue, args.error_rate,
+                        args.seed)
+    server = FakeDiocoServer((args.host, args.port), config)
+    print(f"[INFO] Fake dioco server on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
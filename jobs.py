@@ -0,0 +1,247 @@
+"""
+Job queue shared by every process on the same JobStore, run by a fixed pool of asyncio workers.
+"""
+import asyncio
+import os
+import socket
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, Optional
+
+from jobstore import CANCELLED, COMPLETED, FAILED, FINISHED_STATES, QUEUED, RUNNING, JobStore
+from pipeline import StageTracker
+
+# How often running jobs renew their leases and publish their stage/timings
+HEARTBEAT_INTERVAL = float(os.environ.get("LR_QUEUE_HEARTBEAT", "10"))
+# Idle workers look for new jobs this often (jobs submitted to this process wake them at once)
+POLL_INTERVAL = float(os.environ.get("LR_QUEUE_POLL_INTERVAL", "1"))
+
+
+class Job:
+    """One submitted transcription and everything known about its progress."""
+
+    def __init__(self, params: dict, job_id: Optional[str] = None):
+        self.id = job_id or uuid.uuid4().hex
+        self.params = params
+        self.state = QUEUED
+        self.tracker = StageTracker()
+        self.result: Optional[dict] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.worker: Optional[str] = None
+        self.attempts = 0
+        self.task: Optional[asyncio.Task] = None
+        self.cancel_requested = False
+        self.lease_lost = False
+
+    @property
+    def stage(self) -> Optional[str]:
+        return self.tracker.stage
+
+    def finish(self, state: str, result: Optional[dict] = None, error: Optional[str] = None):
+        self.state = state
+        self.result = result
+        self.error = error
+        self.finished_at = time.time()
+
+    def to_record(self) -> dict:
+        return {
+            "id": self.id,
+            "params": self.params,
+            "state": self.state,
+            "stage": self.stage,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "worker": self.worker,
+            "attempts": self.attempts,
+            "stage_timings": self.tracker.timings,
+            "counters": self.tracker.counters,
+        }
+
+    @classmethod
+    def from_record(cls, record: dict) -> "Job":
+        job = cls(record["params"], job_id=record["id"])
+        job.state = record["state"]
+        job.result = record["result"]
+        job.error = record["error"]
+        job.created_at = record["created_at"]
+        job.started_at = record["started_at"]
+        job.finished_at = record["finished_at"]
+        job.worker = record.get("worker")
+        job.attempts = record.get("attempts", 0)
+        job.cancel_requested = record.get("cancel_requested", False)
+        job.tracker.stage = record.get("stage")
+        job.tracker.timings = record.get("stage_timings") or {}
+        job.tracker.counters = record.get("counters") or {}
+        return job
+
+
+class JobManager:
+    """
+    Runs jobs from a shared JobStore on `workers` concurrent asyncio tasks.
+
+    Every process that opens the same store (API replicas, uvicorn workers,
+    worker.py) submits to and claims from one queue, so adding a process adds
+    `workers` job slots. A heartbeat renews the leases of this process's
+    running jobs and publishes their progress; jobs of a process that dies
+    are claimed again once their lease expires and resume from their
+    checkpoints. Stopping hands running jobs back to the queue.
+    """
+
+    def __init__(self, runner: Callable[[Job], Awaitable[dict]], workers: int = 4,
+                 history: int = 1000, store: Optional[JobStore] = None):
+        self.runner = runner
+        self.workers = workers
+        self.history = history
+        self.store = store or JobStore()
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        # Jobs this process is running, with their live trackers
+        self.running: Dict[str, Job] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._worker_tasks = []
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        self._worker_tasks = [
+            asyncio.create_task(self._worker(i), name=f"job-worker-{i}")
+            for i in range(self.workers)
+        ]
+        if self.workers:
+            self._worker_tasks.append(asyncio.create_task(self._heartbeat(), name="job-heartbeat"))
+            print(f"[INFO] Job worker {self.worker_id}: {self.workers} slot(s), queue {self.store.path}")
+
+    async def stop(self):
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+        if self.workers:
+            await asyncio.to_thread(self.store.unregister, self.worker_id)
+
+    def submit(self, params: dict, dedupe_key: Optional[str] = None) -> Job:
+        """
+        Queue a job (blocking: call from a thread). With a `dedupe_key`, an
+        identical job still queued or running anywhere is returned instead.
+        """
+        record, created = self.store.submit(Job(params).to_record(), dedupe_key)
+        if created:
+            self.store.trim(self.history)
+            if self._loop is not None:
+                # Wake an idle local worker instead of waiting for its next poll
+                self._loop.call_soon_threadsafe(self._wakeup.set)
+        return Job.from_record(record)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """Blocking lookup; jobs running in this process come with their live tracker."""
+        job = self.running.get(job_id)
+        if job is not None:
+            return job
+        record = self.store.get(job_id)
+        return Job.from_record(record) if record is not None else None
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """
+        Cancel a queued or running job (blocking). A job running in another
+        process stops at that process's next heartbeat.
+        """
+        if self.store.cancel(job_id) is None:
+            return None
+        job = self.running.get(job_id)
+        if job is not None and job.task is not None and not job.cancel_requested:
+            job.cancel_requested = True
+            job.task.get_loop().call_soon_threadsafe(job.task.cancel)
+        return self.get(job_id)
+
+    def queue_position(self, job: Job) -> Optional[int]:
+        if job.state != QUEUED:
+            return None
+        return self.store.queue_position(job.id)
+
+    def stats(self) -> dict:
+        stats = self.store.stats()
+        counts = stats["jobs"]
+        return {
+            "workers": stats["slots"],
+            "processes": stats["processes"],
+            "queue_depth": counts[QUEUED],
+            "running": counts[RUNNING],
+            "jobs": counts,
+        }
+
+    async def _worker(self, index: int):
+        while True:
+            # Cleared before looking, so a submit during the claim is not missed
+            self._wakeup.clear()
+            record = await asyncio.to_thread(self.store.claim, self.worker_id)
+            if record is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run(Job.from_record(record))
+
+    async def _run(self, job: Job):
+        self.running[job.id] = job
+        if job.attempts > 1:
+            print(f"[INFO] Resuming job {job.id} (attempt {job.attempts})")
+        job.task = asyncio.create_task(self.runner(job))
+        try:
+            result = await job.task
+        except asyncio.CancelledError:
+            if job.lease_lost:
+                # Another worker owns it now; leave its record alone
+                return
+            if not job.cancel_requested:
+                # The worker itself is being stopped: hand the job back so another
+                # process (or the next start) picks it up from its checkpoints
+                job.task.cancel()
+                await asyncio.to_thread(self.store.release, job.id, self.worker_id)
+                raise
+            job.finish(CANCELLED, error="Cancelled while running")
+        except Exception as e:
+            print(f"[ERROR] Job {job.id} failed: {e}")
+            job.finish(FAILED, error=str(e))
+        else:
+            job.finish(COMPLETED, result=result)
+        finally:
+            job.task = None
+            self.running.pop(job.id, None)
+        tracker = job.tracker
+        stored = await asyncio.to_thread(self.store.finish, job.id, self.worker_id, job.state, job.result,
+                                         job.error, tracker.stage, dict(tracker.timings), dict(tracker.counters))
+        if not stored:
+            print(f"[WARNING] Job {job.id} finished after its lease moved to another worker")
+
+    async def _heartbeat(self):
+        while True:
+            # Copied on the loop thread; the trackers keep changing while the store writes
+            progress = {
+                job.id: (job.tracker.stage, dict(job.tracker.timings), dict(job.tracker.counters))
+                for job in self.running.values()
+            }
+            try:
+                lost, cancelled = await asyncio.to_thread(self.store.heartbeat, self.worker_id, self.workers,
+                                                          progress)
+            except Exception as e:
+                print(f"[WARNING] Job heartbeat failed: {e}")
+                lost, cancelled = [], []
+            for job_id in lost:
+                job = self.running.get(job_id)
+                if job is not None and job.task is not None:
+                    print(f"[WARNING] Lost the lease on job {job_id}, stopping it here")
+                    job.lease_lost = True
+                    job.task.cancel()
+            for job_id in cancelled:
+                job = self.running.get(job_id)
+                if job is not None and job.task is not None and not job.cancel_requested:
+                    job.cancel_requested = True
+                    job.task.cancel()
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
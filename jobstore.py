@@ -0,0 +1,297 @@
+"""
+Durable job queue in SQLite, shared by every process that opens the same file.
+
+API replicas, uvicorn workers and standalone workers (worker.py) submit to
+and claim from one table. A claim is a lease that the owning process renews
+with heartbeats; when a lease runs out (process killed, container gone) the
+job is claimed again by any other worker and resumes from its checkpoints.
+Claims run in BEGIN IMMEDIATE transactions, so a job is never handed to two
+workers at once.
+
+The file needs working POSIX locks: a local disk or a Docker volume shared
+by containers on one host, not a network share.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from cache import BUSY_TIMEOUT, CACHE_DIR, enable_wal
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+FINISHED_STATES = (COMPLETED, FAILED, CANCELLED)
+
+QUEUE_PATH = os.environ.get("LR_QUEUE_PATH", os.path.join(CACHE_DIR, "queue.sqlite3"))
+# A running job whose owner has not renewed it for this long is claimed again
+LEASE_SECONDS = float(os.environ.get("LR_QUEUE_LEASE", "60"))
+# Claims per job before it is failed instead of reclaimed (a job that keeps killing its worker)
+MAX_ATTEMPTS = int(os.environ.get("LR_QUEUE_MAX_ATTEMPTS", "3"))
+
+_JSON_COLUMNS = ("params", "result", "stage_timings", "counters")
+
+
+class JobStore:
+    """Jobs and worker registrations in one SQLite file; every method is one short transaction."""
+
+    def __init__(self, path: str = QUEUE_PATH, lease: float = LEASE_SECONDS, max_attempts: int = MAX_ATTEMPTS):
+        self.path = path
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self._initialized = False
+        self._init_lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        # A connection per call, as in DiskCache: safe across threads and processes
+        if not self._initialized:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        if not self._initialized:
+            with self._init_lock:
+                enable_wal(conn)
+                conn.executescript(
+                    "CREATE TABLE IF NOT EXISTS jobs ("
+                    " id TEXT PRIMARY KEY,"
+                    " dedupe_key TEXT,"
+                    " params TEXT NOT NULL,"
+                    " state TEXT NOT NULL,"
+                    " stage TEXT,"
+                    " result TEXT,"
+                    " error TEXT,"
+                    " stage_timings TEXT NOT NULL DEFAULT '{}',"
+                    " counters TEXT NOT NULL DEFAULT '{}',"
+                    " created_at REAL NOT NULL,"
+                    " started_at REAL,"
+                    " finished_at REAL,"
+                    " worker TEXT,"
+                    " lease_until REAL,"
+                    " attempts INTEGER NOT NULL DEFAULT 0,"
+                    " cancel_requested INTEGER NOT NULL DEFAULT 0);"
+                    "CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, created_at);"
+                    "CREATE INDEX IF NOT EXISTS jobs_dedupe ON jobs (dedupe_key);"
+                    "CREATE TABLE IF NOT EXISTS workers ("
+                    " id TEXT PRIMARY KEY,"
+                    " slots INTEGER NOT NULL,"
+                    " seen REAL NOT NULL);"
+                )
+                self._initialized = True
+        return conn
+
+    @staticmethod
+    def _record(row: Optional[sqlite3.Row]) -> Optional[dict]:
+        if row is None:
+            return None
+        record = dict(row)
+        for column in _JSON_COLUMNS:
+            if record[column] is not None:
+                record[column] = json.loads(record[column])
+        record["cancel_requested"] = bool(record["cancel_requested"])
+        return record
+
+    def submit(self, record: dict, dedupe_key: Optional[str] = None) -> Tuple[dict, bool]:
+        """
+        Queue a job record (Job.to_record()). With a `dedupe_key`, an identical
+        job that is still queued or running is returned instead.
+        Returns (record, created).
+        """
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            if dedupe_key is not None:
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE dedupe_key = ? AND state IN (?, ?) ORDER BY created_at LIMIT 1",
+                    (dedupe_key, QUEUED, RUNNING)
+                ).fetchone()
+                if row is not None:
+                    conn.execute("COMMIT")
+                    return self._record(row), False
+            conn.execute(
+                "INSERT INTO jobs (id, dedupe_key, params, state, created_at) VALUES (?, ?, ?, ?, ?)",
+                (record["id"], dedupe_key, json.dumps(record["params"], ensure_ascii=False), QUEUED,
+                 record["created_at"])
+            )
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (record["id"],)).fetchone()
+            conn.execute("COMMIT")
+            return self._record(row), True
+        finally:
+            conn.close()
+
+    def claim(self, worker: str) -> Optional[dict]:
+        """Lease the oldest queued job, or one whose owner stopped renewing its lease."""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            # Abandoned jobs that were cancelled, or already had their attempts, are not run again
+            conn.execute(
+                "UPDATE jobs SET state = ?, error = 'Cancelled while running', finished_at = ?, worker = NULL,"
+                " lease_until = NULL WHERE state = ? AND lease_until < ? AND cancel_requested = 1",
+                (CANCELLED, now, RUNNING, now)
+            )
+            conn.execute(
+                "UPDATE jobs SET state = ?, error = 'Worker lost ' || attempts || ' time(s)', finished_at = ?,"
+                " worker = NULL, lease_until = NULL WHERE state = ? AND lease_until < ? AND attempts >= ?",
+                (FAILED, now, RUNNING, now, self.max_attempts)
+            )
+            row = conn.execute(
+                "SELECT id, state, worker FROM jobs WHERE state = ? OR (state = ? AND lease_until < ?)"
+                " ORDER BY created_at LIMIT 1",
+                (QUEUED, RUNNING, now)
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            if row["state"] == RUNNING:
+                print(f"[INFO] Reclaiming job {row['id']} from {row['worker']} (lease expired)")
+            conn.execute(
+                "UPDATE jobs SET state = ?, worker = ?, lease_until = ?, started_at = ?,"
+                " attempts = attempts + 1 WHERE id = ?",
+                (RUNNING, worker, now + self.lease, now, row["id"])
+            )
+            claimed = conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone()
+            conn.execute("COMMIT")
+            return self._record(claimed)
+        finally:
+            conn.close()
+
+    def heartbeat(self, worker: str, slots: int, progress: Dict[str, tuple]) -> Tuple[List[str], List[str]]:
+        """
+        Renew the worker's registration and the leases of its running jobs,
+        storing their progress ({job_id: (stage, timings, counters)}).
+        Returns (lost, cancelled): jobs no longer leased to this worker, and
+        jobs someone asked to cancel.
+        """
+        conn = self._connect()
+        lost, cancelled = [], []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            conn.execute("INSERT OR REPLACE INTO workers (id, slots, seen) VALUES (?, ?, ?)", (worker, slots, now))
+            for job_id, (stage, timings, counters) in progress.items():
+                updated = conn.execute(
+                    "UPDATE jobs SET lease_until = ?, stage = ?, stage_timings = ?, counters = ?"
+                    " WHERE id = ? AND worker = ? AND state = ?",
+                    (now + self.lease, stage, json.dumps(timings), json.dumps(counters), job_id, worker, RUNNING)
+                ).rowcount
+                if not updated:
+                    lost.append(job_id)
+                elif conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()[0]:
+                    cancelled.append(job_id)
+            # Registrations of workers that stopped without unregistering
+            conn.execute("DELETE FROM workers WHERE seen < ?", (now - self.lease,))
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        return lost, cancelled
+
+    def finish(self, job_id: str, worker: str, state: str, result: Optional[dict], error: Optional[str],
+               stage: Optional[str], timings: dict, counters: dict) -> bool:
+        """Record the outcome; False if the lease was lost and another worker owns the job now."""
+        conn = self._connect()
+        try:
+            with conn:
+                return bool(conn.execute(
+                    "UPDATE jobs SET state = ?, result = ?, error = ?, stage = ?, stage_timings = ?, counters = ?,"
+                    " finished_at = ?, worker = NULL, lease_until = NULL WHERE id = ? AND worker = ? AND state = ?",
+                    (state, json.dumps(result, ensure_ascii=False) if result is not None else None, error, stage,
+                     json.dumps(timings), json.dumps(counters), time.time(), job_id, worker, RUNNING)
+                ).rowcount)
+        finally:
+            conn.close()
+
+    def release(self, job_id: str, worker: str):
+        """
+        Hand a running job back to the queue (graceful shutdown); the attempt
+        is not counted. A job with a pending cancel request is cancelled instead.
+        """
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    "UPDATE jobs SET state = CASE WHEN cancel_requested THEN ? ELSE ? END,"
+                    " error = CASE WHEN cancel_requested THEN 'Cancelled while running' ELSE error END,"
+                    " finished_at = CASE WHEN cancel_requested THEN ? ELSE NULL END,"
+                    " worker = NULL, lease_until = NULL, attempts = MAX(attempts - 1, 0)"
+                    " WHERE id = ? AND worker = ? AND state = ?",
+                    (CANCELLED, QUEUED, time.time(), job_id, worker, RUNNING)
+                )
+        finally:
+            conn.close()
+
+    def unregister(self, worker: str):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("DELETE FROM workers WHERE id = ?", (worker,))
+        finally:
+            conn.close()
+
+    def cancel(self, job_id: str) -> Optional[dict]:
+        """Cancel a queued job now, or flag a running one for its owner's next heartbeat."""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "UPDATE jobs SET state = ?, error = 'Cancelled before start', finished_at = ? WHERE id = ? AND state = ?",
+                (CANCELLED, time.time(), job_id, QUEUED)
+            )
+            conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND state = ?", (job_id, RUNNING))
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            conn.execute("COMMIT")
+            return self._record(row)
+        finally:
+            conn.close()
+
+    def get(self, job_id: str) -> Optional[dict]:
+        conn = self._connect()
+        try:
+            return self._record(conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+        finally:
+            conn.close()
+
+    def queue_position(self, job_id: str) -> Optional[int]:
+        """Queued jobs ahead of this one, or None if it is not queued."""
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT (SELECT COUNT(*) FROM jobs AS other WHERE other.state = ?"
+                " AND other.created_at < jobs.created_at) FROM jobs WHERE id = ? AND state = ?",
+                (QUEUED, job_id, QUEUED)
+            ).fetchone()
+            return row[0] if row is not None else None
+        finally:
+            conn.close()
+
+    def stats(self) -> dict:
+        """Jobs by state plus the live workers (processes and job slots) across every process."""
+        conn = self._connect()
+        try:
+            counts = {state: 0 for state in (QUEUED, RUNNING, COMPLETED, FAILED, CANCELLED)}
+            for state, count in conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state"):
+                counts[state] = count
+            processes, slots = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(slots), 0) FROM workers WHERE seen >= ?", (time.time() - self.lease,)
+            ).fetchone()
+        finally:
+            conn.close()
+        return {"jobs": counts, "processes": processes, "slots": slots}
+
+    def trim(self, history: int):
+        """Keep only the newest `history` finished jobs."""
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    "DELETE FROM jobs WHERE id IN (SELECT id FROM jobs WHERE state IN (?, ?, ?)"
+                    " ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                    (*FINISHED_STATES, history)
+                )
+        finally:
+            conn.close()
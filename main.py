@@ -2,138 +2,273 @@
 import os
 import sys
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 
+import profiling
+from audio import SUPPORTED_VIDEO_EXTENSIONS
+from audio_cache import extract_audio_cached
+from batch import STAGES, run_batch
+from segment import SEGMENT_ASR, segmented_subtitles_sync
+from trim import TRIM_SILENCE, OffsetMap, remap_result, trim_silence_sync
+from checkpoint import Checkpoint
 from step1 import generate_data_hash, check_file_exists
 from step2 import upload_file
-from step3 import wait_for_subtitles
+from step3 import cached_subtitles, store_subtitles, wait_for_subtitles
 from step4 import translate_subtitles
-from srt_build import parse_srt
-
-
-def ms_to_srt_time(ms):
-    # 밀리초를 SRT 시간 형식으로 변환
-    seconds = ms / 1000
-    hours = int(seconds // 3600)
-    minutes = int((seconds % 3600) // 60)
-    secs = int(seconds % 60)
-    millis = int((ms % 1000))
-    return f"{hours:02d}:{minutes:02d}:{secs:02d},{millis:03d}"
-
-
-def create_srt(subs, originals, translations, output_path, mode='orig'):
-    # SRT 파일 생성 (원본 + 번역)
-    with open(output_path, 'w', encoding='utf-8') as f:
-        for i, (sub, orig, trans) in enumerate(zip(subs, originals, translations), 1):
-            start_time = ms_to_srt_time(sub['begin'])
-            end_time = ms_to_srt_time(sub['end'])
-
-            f.write(f"{i}\n")
-            f.write(f"{start_time} --> {end_time}\n")
-            
-            if mode == 'orig':
-                f.write(f"{orig}\n")
-            
-            elif mode == 'dual':
-                f.write(f"{orig}\n")
-                if trans:
-                    f.write(f"({trans})\n")
-
-            elif mode == 'trans':
-                if trans:
-                    f.write(f"{trans}\n")
+from srt_build import plan_outputs, split_list
+from subtitles import DEFAULT_FORMATS, FORMATS, cues_from_subs, read_srt, write_subtitles
+
+SUBTITLE_MODES = ('orig', 'dual', 'trans')
+
+
+def transcribe_audio(args, file_path, checkpoint):
+    # Step 1 ~ 3: 오디오 추출/해시, 업로드, ASR (단계마다 체크포인트 저장) -> 원래 타임라인의 자막
+    streamed = None
+    temp_files = []
+    try:
+        # Step 1 (비디오는 추출 오디오 캐시 확인 후, 없으면 ffmpeg 출력을 파이프로 받아 바로 해시)
+        hash_info = checkpoint.audio()
+        if hash_info is not None:
+            print(f"\n[INFO] 체크포인트의 오디오 사용: {hash_info['file_path']}")
+        elif os.path.splitext(file_path)[1].lower() in SUPPORTED_VIDEO_EXTENSIONS:
+            print("\n[Step 1-0] 비디오에서 오디오 추출")
+            hash_info, streamed = extract_audio_cached(file_path)
+            if hash_info is None:
+                print("[ERROR] 오디오 추출 실패")
+                sys.exit(1)
+        else:
+            hash_info = profiling.call(generate_data_hash, file_path)
+        checkpoint.save_audio(hash_info)
+        upload_source = hash_info['file_path'] or hash_info.get('buffer')
+
+        # 캐시된 ASR 결과가 있으면 Step 1-2 ~ 3 전부 건너뜀
+        subtitle_result = cached_subtitles(hash_info['dataHash'], args.source)
+        if subtitle_result is not None:
+            print("\n[INFO] Step 1-2 ~ 3 건너뜀 (캐시된 자막 사용)")
+            return subtitle_result['data']['subs']
+
+        audio_path = hash_info['file_path']
+        if audio_path is None and (args.segment or args.trim_silence):
+            # ffmpeg가 탐색할 수 있도록 로컬 임시 파일로 저장
+            audio_path = streamed.save_temp()
+            temp_files.append(audio_path)
+
+        # 긴 무음 구간을 잘라낸 오디오로 업로드/ASR (타임스탬프는 나중에 원래대로 복원)
+        asr_info, offsets = hash_info, None
+        trimmed_checkpoint = checkpoint.get('trim')
+        if (args.trim_silence and trimmed_checkpoint
+                and checkpoint.get('uploaded') == trimmed_checkpoint['dataHash']):
+            # 잘라낸 오디오가 이미 서버에 있음 -> 오프셋 정보만 복원
+            print("\n[INFO] 체크포인트의 무음 제거 결과 사용")
+            offsets = OffsetMap(trimmed_checkpoint['kept'], trimmed_checkpoint['duration'])
+            asr_info = {'dataHash': trimmed_checkpoint['dataHash'], 'file_path': None,
+                        'size': trimmed_checkpoint['size']}
+            # 통째로 업로드됐다는 것은 구간 분할이 필요 없던 길이라는 뜻
+            args.segment = False
+        elif args.trim_silence:
+            trimmed = trim_silence_sync(audio_path)
+            if trimmed is not None:
+                audio_path, offsets = trimmed
+                temp_files.append(audio_path)
+                asr_info = profiling.call(generate_data_hash, audio_path, use_cache=False)
+                upload_source = audio_path
+                checkpoint.save('trim', {
+                    'dataHash': asr_info['dataHash'], 'size': asr_info['size'],
+                    'kept': offsets.kept, 'duration': offsets.duration,
+                })
+
+        # 긴 오디오는 무음 구간에서 잘라 구간별 ASR을 동시에 실행 (짧으면 None -> 기존 방식)
+        if args.segment:
+            subtitle_result = segmented_subtitles_sync(
+                audio_path, asr_info['dataHash'], args.source, size=asr_info['size']
+            )
+
+        if subtitle_result is None:
+            # Step 2 (업로드 완료가 체크포인트에 있으면 존재 확인도 생략)
+            if checkpoint.get('uploaded') == asr_info['dataHash']:
+                print("\n[INFO] Step 1-2 ~ 2 건너뜀 (체크포인트: 업로드 완료)")
+            else:
+                exists = check_file_exists(asr_info['dataHash'])
+                if not exists:
+                    exists = upload_file(upload_source, asr_info['dataHash']) is not None
                 else:
-                    f.write(f"{orig}\n")
-            
-            f.write(f"\n")
+                    print("\n[INFO] Step 2 건너뜀 (파일이 이미 존재)")
+                if exists:
+                    checkpoint.save('uploaded', asr_info['dataHash'])
 
-    print(f"[OK] SRT 파일 생성: {output_path}")
+            # Step 3
+            subtitle_result = wait_for_subtitles(asr_info['dataHash'], args.source, size=asr_info['size'])
+            if not subtitle_result:
+                print("[ERROR] 자막 생성 실패")
+                sys.exit(1)
+
+        if offsets is not None:
+            # 원래 타임라인으로 복원 후 원본 오디오의 dataHash로 캐시
+            subtitle_result = remap_result(subtitle_result, offsets)
+            store_subtitles(hash_info['dataHash'], args.source, subtitle_result)
+        return subtitle_result['data']['subs']
+
+    finally:
+        if streamed is not None:
+            streamed.close()
+        for path in temp_files:
+            os.remove(path)
+
+
+def run_batch_mode(parser, args, modes, dests, formats):
+    # 배치 모드: 파일마다 단계(추출/해시/업로드/ASR/번역)를 독립적으로 흘려보냄
+    limits = {}
+    for item in split_list(args.limit):
+        stage, _, value = item.partition('=')
+        if stage not in STAGES or not value.isdigit() or int(value) < 1:
+            parser.error(f"잘못된 --limit 값: {item} ({', '.join(STAGES)} 중 STAGE=N)")
+        limits[stage] = int(value)
+    if args.no_translate:
+        modes = ['orig']
+
+    try:
+        report = run_batch(args.batch, args.source, dests, modes, args.external_srt, limits, args.report,
+                           args.segment, args.trim_silence, formats)
+    except Exception as e:
+        print(f"\n[ERROR] 오류 발생: {e}")
+        sys.exit(1)
+    if report['failed']:
+        sys.exit(1)
 
 
 def main():
     parser = argparse.ArgumentParser(description='Language Reactor 자막 생성 & 번역')
-    parser.add_argument('file_path', help='오디오/비디오 파일 경로')
+    parser.add_argument('file_path', nargs='?', help='오디오/비디오 파일 경로 (.srt를 주면 번역만 수행)')
     parser.add_argument('--source', default='ja', help='원본 언어 (기본: ja)')
-    parser.add_argument('--dest', default='ko', help='번역 대상 언어 (기본: ko)')
+    parser.add_argument('--dest', nargs='+', default=['ko'], help='번역 대상 언어, 여러 개 가능 (예: ko en ja 또는 ko,en,ja) (기본: ko)')
     parser.add_argument('--no-translate', action='store_true', help='번역 건너뛰기')
     parser.add_argument('--temp-audio', action='store_true', help='임시 오디오 파일 (완료 후 삭제)')
-    parser.add_argument('--subtitle-mode', choices=['orig', 'dual', 'trans'], default='orig', help='자막 출력 방식: orig(원어), dual(원어+번역), trans(번역만)')
-    parser.add_argument('--external-srt', action='store_true', help='기존 SRT 사용 (파일명 동일한 .srt)')
+    parser.add_argument('--subtitle-mode', nargs='+', default=['orig'], help='자막 출력 방식, 여러 개 가능: orig(원어), dual(원어+번역), trans(번역만)')
+    parser.add_argument('--format', nargs='+', default=DEFAULT_FORMATS,
+                        help=f"자막 파일 형식, 여러 개 가능: {', '.join(FORMATS)} (기본: {','.join(DEFAULT_FORMATS)})")
+    parser.add_argument('--external-srt', action='store_true', help='기존 SRT 사용 (파일명 동일한 .srt, 오디오 처리 없이 번역만)')
+    parser.add_argument('--segment', action='store_true', default=SEGMENT_ASR,
+                        help='긴 오디오를 무음 구간에서 나눠 구간별 ASR을 동시에 실행')
+    parser.add_argument('--trim-silence', action='store_true', default=TRIM_SILENCE,
+                        help='업로드 전에 긴 무음 구간 제거 (자막 시간은 원래 타임라인으로 복원)')
+    parser.add_argument('--batch', metavar='DIR|GLOB', help='폴더 또는 glob 패턴의 모든 미디어 파일을 단계별 파이프라인으로 처리')
+    parser.add_argument('--limit', nargs='+', default=[], metavar='STAGE=N',
+                        help='배치 단계별 동시 실행 수 (예: extract=4 upload=2 asr=32 translate=4 hash=4)')
+    parser.add_argument('--report', metavar='PATH', help='배치 결과 리포트(JSON) 저장 경로')
+    parser.add_argument('--profile', action='store_true',
+                        help='단계/HTTP 요청/ffmpeg 시간을 Chrome 트레이스(<파일명>.trace.json)로 저장 (chrome://tracing, ui.perfetto.dev)')
+    parser.add_argument('--profile-cpu', action='store_true',
+                        help='--profile + 해시/자막 파싱/출력의 cProfile 결과를 <파일명>.prof로 저장')
 
     args = parser.parse_args()
-    mode = args.subtitle_mode
+    modes = split_list(args.subtitle_mode)
+    dests = split_list(args.dest)
+    formats = split_list(args.format)
 
-    if not os.path.exists(args.file_path):
-        print(f"[ERROR] 파일이 존재하지 않습니다: {args.file_path}")
-        sys.exit(1)
+    for fmt in formats:
+        if fmt not in FORMATS:
+            parser.error(f"잘못된 자막 형식: {fmt} ({', '.join(FORMATS)} 중 선택)")
+    for mode in modes:
+        if mode not in SUBTITLE_MODES:
+            parser.error(f"잘못된 자막 출력 방식: {mode} (orig, dual, trans 중 선택)")
+    if not modes or not dests or not formats:
+        parser.error("자막 출력 방식, 대상 언어, 형식을 하나 이상 지정하세요")
+
+    profile = args.profile or args.profile_cpu
+    if args.batch:
+        if profile:
+            parser.error("--profile 은 단일 파일에서만 사용할 수 있습니다")
+        run_batch_mode(parser, args, modes, dests, formats)
+        return
+    if not args.file_path:
+        parser.error("파일 경로 또는 --batch 를 지정하세요")
 
     file_path = os.path.abspath(args.file_path)
     file_dir = os.path.dirname(file_path)
     file_name = os.path.splitext(os.path.basename(file_path))[0]
 
+    # 번역 전용 모드: 기존 SRT만 읽고 미디어 파일은 건드리지 않음 (ffmpeg/해시/업로드 없음)
+    srt_only = args.external_srt or file_path.lower().endswith('.srt')
+    srt_path = os.path.join(file_dir, f"{file_name}.srt")
+    # 입력이 SRT 자체면 절대 삭제하지 않음
+    temp_audio = args.temp_audio and not file_path.lower().endswith('.srt')
+
+    if srt_only:
+        if not os.path.exists(srt_path):
+            print(f"[ERROR] SRT 파일 없음: {srt_path}")
+            sys.exit(1)
+    elif not os.path.exists(args.file_path):
+        print(f"[ERROR] 파일이 존재하지 않습니다: {args.file_path}")
+        sys.exit(1)
+
     print("="*60)
     print("Language Reactor 자막 생성 및 번역")
     print("="*60)
     print(f"파일: {file_path}")
-    print(f"언어: {args.source} -> {args.dest}")
+    print(f"언어: {args.source} -> {', '.join(dests)}")
     print("="*60)
 
-    try:
-        # Step 1
-        hash_info = generate_data_hash(file_path)
-        exists = check_file_exists(hash_info['dataHash'])
-
-        # Step 2
-        if not exists:
-            upload_file(hash_info['file_content'], hash_info['dataHash'])
-        else:
-            print("\n[INFO] Step 2 건너뜀 (파일이 이미 존재)")
-
-        # Step 3
-        if args.external_srt:
-            srt_path = os.path.splitext(file_path)[0] + '.srt'
+    trace = None
+    if profile:
+        # 번역 스레드에서도 기록되도록 프로세스 전체 트레이스로 등록
+        trace = profiling.Trace(os.path.basename(file_path), cpu=args.profile_cpu)
+        profiling.start_process_trace(trace)
 
-            if not os.path.exists(srt_path):
-                print(f"[ERROR] SRT 파일 없음: {srt_path}")
-                sys.exit(1)
-
-            subs, subs_texts = parse_srt(srt_path)
+    try:
+        if srt_only:
+            # Step 3 (기존 SRT)
+            print(f"\n[INFO] 번역 전용 모드: {srt_path}")
+            cues = profiling.call(read_srt, srt_path)
+            checkpoint = Checkpoint(None)
 
         else:
-            subtitle_result = wait_for_subtitles(hash_info['dataHash'], args.source)
-            if not subtitle_result:
-                print("[ERROR] 자막 생성 실패")
-                sys.exit(1)
-
-            subs = subtitle_result['data']['subs']
-            subs_texts = [sub['text'] for sub in subs]
-
-        # Step 4
-        if not args.no_translate:
-            translation_result = translate_subtitles(subs_texts, args.source, args.dest)
-            if translation_result:
-                translations = translation_result['data']['subs']
+            # 중단된 이전 실행이 있으면 마지막으로 끝난 단계 다음부터 이어서 진행
+            checkpoint = Checkpoint.load(file_path, args.source)
+            subs = checkpoint.get('subs')
+            if subs is not None:
+                print("\n[INFO] Step 1 ~ 3 건너뜀 (체크포인트의 자막 사용)")
             else:
-                translations = None
-        else:
-            translations = None
+                with profiling.span('transcribe'):
+                    subs = transcribe_audio(args, file_path, checkpoint)
+                checkpoint.save('subs', subs)
+            cues = cues_from_subs(subs)
+        subs_texts = [cue.text for cue in cues]
 
-        # SRT 파일 저장 (원본 파일명과 동일하게)
-        if mode == "trans":
-            output_path = os.path.join(file_dir, f"{file_name}_{args.dest}.srt")
-        else:
-            output_path = os.path.join(file_dir, f"{file_name}.srt")
+        # Step 4 (대상 언어별 번역을 동시에 요청, 체크포인트에 있는 언어는 건너뜀)
+        translations = dict(checkpoint.get('translations', {}))
+        failed = []
+        if not args.no_translate and any(mode != 'orig' for mode in modes):
+            pending = [dest for dest in dests if dest not in translations]
+            if len(pending) < len(dests):
+                print(f"\n[INFO] 체크포인트의 번역 사용: {', '.join(sorted(translations))}")
+            if pending:
+                with profiling.span('translate', langs=','.join(pending)), \
+                        ThreadPoolExecutor(max_workers=len(pending)) as pool:
+                    results = pool.map(lambda dest: translate_subtitles(subs_texts, args.source, dest), pending)
+                    for dest, translation_result in zip(pending, results):
+                        if translation_result:
+                            translations[dest] = translation_result['data']['subs']
+                            checkpoint.save_translation(dest, translations[dest])
+                        else:
+                            failed.append(dest)
 
-        if translations:
-            create_srt(subs, subs_texts, translations, output_path, mode)
-        else:
-            create_srt(subs, subs_texts, [None]*len(subs_texts), output_path, mode)
+        # 자막 파일 저장 (원본 파일명과 동일하게, 요청한 형식마다 확장자만 다름)
+        with profiling.span('write'):
+            for mode, dest, output_name in plan_outputs(file_name, modes, dests):
+                output_path = os.path.join(file_dir, output_name)
+                for path in profiling.call(write_subtitles, cues, translations.get(dest), mode, output_path, formats):
+                    print(f"[OK] 자막 파일 생성: {path}")
+
+        # 실패한 번역이 있으면 체크포인트를 남겨 다음 실행에서 그 언어만 다시 요청
+        if not failed:
+            checkpoint.clear()
 
         print("\n" + "="*60)
         print("[OK] 모든 작업 완료")
         print("="*60)
 
         # 임시 오디오 파일 삭제
-        if args.temp_audio:
+        if temp_audio:
             try:
                 os.remove(file_path)
                 print(f"[INFO] 임시 오디오 파일 삭제: {file_path}")
@@ -143,13 +278,18 @@ def main():
     except Exception as e:
         print(f"\n[ERROR] 오류 발생: {e}")
         # 오류 발생 시에도 임시 파일 삭제 시도
-        if args.temp_audio and os.path.exists(file_path):
+        if temp_audio and os.path.exists(file_path):
             try:
                 os.remove(file_path)
                 print(f"[INFO] 임시 오디오 파일 삭제: {file_path}")
             except:
                 pass
         sys.exit(1)
+    finally:
+        # 실패/중단된 실행도 어디까지 걸렸는지 볼 수 있게 항상 저장
+        if trace is not None:
+            for path in trace.write(os.path.join(file_dir, file_name)):
+                print(f"[INFO] 프로파일 저장: {path}")
 
 
 if __name__ == '__main__':
@@ -0,0 +1,236 @@
+"""
+In-process metrics in the Prometheus text format, served by the API at /metrics.
+
+Counters, gauges and histograms are plain thread-safe objects (the step
+modules run both in worker threads and on the event loop). Values that
+already live elsewhere (cache hit counters, queue depth, single-flight
+state) are read at scrape time through registered collectors instead of
+being duplicated.
+"""
+import asyncio
+import functools
+import math
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Seconds: from a cached hash lookup up to a long ASR wait
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+_metrics: List['_Metric'] = []
+_collectors: List[Callable[[], Iterable[tuple]]] = []
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+class _Metric:
+    type = ''
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[tuple, object] = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            # Unlabelled metrics are exported from the start, not only after the first event
+            self._values[()] = self._initial()
+        _metrics.append(self)
+
+    @property
+    def family(self) -> str:
+        return self.name
+
+    def _initial(self):
+        return 0
+
+    def _key(self, labels: Dict[str, str]) -> tuple:
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    @property
+    def family(self) -> str:
+        return self.name + '_total'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [(self.name + '_total', dict(zip(self.labelnames, key)), value) for key, value in items]
+
+
+class Gauge(_Metric):
+    type = 'gauge'
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [(self.name, dict(zip(self.labelnames, key)), value) for key, value in items]
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DURATION_BUCKETS):
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        super().__init__(name, help, labelnames)
+
+    def _initial(self):
+        # [count per bucket (not cumulative), sum]
+        return [[0] * len(self.buckets), 0.0]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = self._initial()
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+        samples = []
+        for key, counts, total in items:
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                samples.append((self.name + '_bucket', {**labels, 'le': _format_value(bound)}, cumulative))
+            samples.append((self.name + '_sum', labels, total))
+            samples.append((self.name + '_count', labels, cumulative))
+        return samples
+
+
+def register_collector(collect: Callable[[], Iterable[tuple]]):
+    """
+    Add a scrape-time source. `collect()` yields (name, type, help, samples)
+    with samples as [(labels dict, value)].
+    """
+    _collectors.append(collect)
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format (0.0.4)."""
+    lines = []
+    for metric in _metrics:
+        lines.append(f"# HELP {metric.family} {metric.help}")
+        lines.append(f"# TYPE {metric.family} {metric.type}")
+        for name, labels, value in metric.samples():
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+    for collect in _collectors:
+        try:
+            families = list(collect())
+        except Exception as e:
+            print(f"[WARNING] Metrics collector failed: {e}")
+            continue
+        for name, kind, help, samples in families:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+    return '\n'.join(lines) + '\n'
+
+
+STEP_SECONDS = Histogram('lr_step_duration_seconds', 'Time spent in each pipeline step call', ['step'])
+STEP_CALLS = Counter('lr_step_calls', 'Pipeline step calls by outcome (ok, failed, error)', ['step', 'outcome'])
+STEP_IN_FLIGHT = Gauge('lr_step_in_flight', 'Pipeline step calls currently running', ['step'])
+STAGE_SECONDS = Histogram('lr_stage_duration_seconds', 'Per-job stage time as recorded by StageTracker',
+                          ['stage'])
+UPLOAD_BYTES = Counter('lr_upload_bytes', 'Audio bytes sent to the upload endpoint')
+ASR_POLLS = Histogram('lr_asr_polls', 'Status polls per ASR wait',
+                      buckets=(1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144))
+ASR_WAIT_SECONDS = Histogram('lr_asr_wait_seconds', 'Time from the first ASR request to the result')
+TRANSLATE_CUES = Histogram('lr_translate_cues', 'Cues per translate_subtitles call',
+                           buckets=(10, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 20000))
+TRANSLATE_PAYLOAD_BYTES = Histogram('lr_translate_payload_bytes', 'Request body size per translation request',
+                                    buckets=(1024, 4096, 16384, 65536, 262144, 1048576, 4194304))
+
+
+def timed(step: str, failure: Optional[Callable[[object], bool]] = None):
+    """
+    Record duration, outcome and in-flight count of a sync or async function.
+
+    `failure(result)` marks a returned value as a failed call (the steps
+    return None instead of raising); exceptions count as "error".
+    """
+    def decorate(fn):
+        def finish(started, outcome):
+            STEP_IN_FLIGHT.dec(step=step)
+            STEP_SECONDS.observe(time.perf_counter() - started, step=step)
+            STEP_CALLS.inc(step=step, outcome=outcome)
+
+        def outcome_of(result):
+            return 'failed' if failure is not None and failure(result) else 'ok'
+
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                STEP_IN_FLIGHT.inc(step=step)
+                started = time.perf_counter()
+                outcome = 'error'
+                try:
+                    result = await fn(*args, **kwargs)
+                    outcome = outcome_of(result)
+                    return result
+                finally:
+                    finish(started, outcome)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            STEP_IN_FLIGHT.inc(step=step)
+            started = time.perf_counter()
+            outcome = 'error'
+            try:
+                result = fn(*args, **kwargs)
+                outcome = outcome_of(result)
+                return result
+            finally:
+                finish(started, outcome)
+        return wrapper
+
+    return decorate
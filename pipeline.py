@@ -0,0 +1,398 @@
+"""
+Async step1-step4 pipeline shared by /transcribe and the background job workers.
+"""
+import asyncio
+import functools
+import os
+import time
+from contextlib import asynccontextmanager, contextmanager
+from pathlib import Path
+from typing import AsyncContextManager, Callable, List, Optional, Tuple
+
+import metrics
+import profiling
+import progress
+from audio import SUPPORTED_VIDEO_EXTENSIONS
+from audio_cache import extract_audio_cached_async
+from step1 import generate_data_hash_async, check_file_exists_async
+from step2 import upload_file_async
+from step3 import cached_subtitles_async, store_subtitles, wait_for_subtitles_async
+from step4 import translate_subtitles_async
+from segment import SEGMENT_ASR, segmented_subtitles
+from singleflight import release_after, started_calls
+from trim import TRIM_SILENCE, OffsetMap, remap_result, trim_silence
+from checkpoint import Checkpoint
+from srt_build import plan_outputs
+from subtitles import DEFAULT_FORMATS, FORMATS, Cue, cues_from_subs, read_srt, render
+
+VALID_MODES = ('orig', 'dual', 'trans')
+
+
+class PipelineError(Exception):
+    """A pipeline stage failed in a way the caller should report."""
+
+
+class StageTracker:
+    """
+    Records the current stage and how long each stage took, and passes
+    progress events to its listeners (see progress.py).
+    """
+
+    def __init__(self):
+        self.stage = None
+        self.timings = {}
+        self.counters = {}
+        self._listeners = []
+
+    def subscribe(self, listener: Callable[[dict], None]):
+        """`listener(event)` is called for every event; it may run on a worker thread."""
+        self._listeners.append(listener)
+
+    def unsubscribe(self, listener: Callable[[dict], None]):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def emit(self, event: str, **data):
+        self._dispatch({'event': event, 'time': round(time.time(), 3), **data})
+
+    def forward(self, record: dict):
+        """Listener for another tracker whose run this one joined: take its events as this run's."""
+        if record['event'] == 'stage':
+            self.stage = record['stage']
+        elif record['event'] == 'stage_done':
+            self.timings[record['stage']] = round(self.timings.get(record['stage'], 0.0) + record['seconds'], 3)
+        self._dispatch(record)
+
+    def _dispatch(self, record: dict):
+        for listener in list(self._listeners):
+            try:
+                listener(record)
+            except Exception as e:
+                print(f"[WARNING] Progress listener failed: {e}")
+
+    @contextmanager
+    def track(self, name: str):
+        self.stage = name
+        self.emit('stage', stage=name)
+        started = time.perf_counter()
+        try:
+            with profiling.span(name, 'stage'):
+                yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.timings[name] = round(self.timings.get(name, 0.0) + elapsed, 3)
+            metrics.STAGE_SECONDS.observe(elapsed, stage=name)
+            self.emit('stage_done', stage=name, seconds=round(elapsed, 3))
+
+
+async def translate_and_write(cues: List[Cue], file_stem: str, source_lang: str,
+                              target_langs: List[str], modes: List[str], output_dir: Path,
+                              tracker: StageTracker,
+                              checkpoint: Optional[Checkpoint] = None,
+                              formats: Optional[List[str]] = None) -> List[dict]:
+    """Step 4 plus output: translate once per target language and write every output in every format."""
+    print(f"[INFO] Subtitle count: {len(cues)}")
+    tracker.emit('subtitles', count=len(cues))
+    checkpoint = checkpoint or Checkpoint(None)
+    formats = formats or DEFAULT_FORMATS
+    subs_texts = [cue.text for cue in cues]
+
+    # Step 4: Translate to every target language an output needs
+    translations = dict(checkpoint.get('translations', {}))
+    if any(mode != 'orig' for mode in modes):
+        pending = [dest for dest in target_langs if dest not in translations]
+        if len(pending) < len(target_langs):
+            print(f"[INFO] Translations from checkpoint: {', '.join(sorted(translations))}")
+
+        async def translate(dest):
+            translation_result = await translate_subtitles_async(subs_texts, source_lang, dest)
+            if translation_result:
+                translations[dest] = translation_result['data']['subs']
+                tracker.emit('translated', lang=dest, count=len(translations[dest]))
+                await asyncio.to_thread(checkpoint.save_translation, dest, translations[dest])
+            else:
+                tracker.emit('translation_failed', lang=dest)
+                print(f"[WARNING] Translation to {dest} failed, using original text")
+                tracker.counters['translation_failures'] = tracker.counters.get('translation_failures', 0) + 1
+
+        with tracker.track('translate'):
+            if pending:
+                print(f"[Step 4] Translating subtitles to {', '.join(pending)}...")
+            await asyncio.gather(*(translate(dest) for dest in pending))
+    else:
+        print("[Step 4] Skipping translation (mode=orig)")
+
+    outputs = []
+    with tracker.track('write'):
+        for mode, dest, output_filename in plan_outputs(file_stem, modes, target_langs):
+            # Every format of this output comes from one pass over the cues
+            rendered = await asyncio.to_thread(profiling.call, render, cues, translations.get(dest), mode, formats)
+
+            for fmt, content in rendered.items():
+                output_path = (output_dir / output_filename).with_suffix(FORMATS[fmt])
+                await asyncio.to_thread(output_path.write_text, content, encoding='utf-8')
+                print(f"[OK] Output saved: {output_path}")
+
+                outputs.append({
+                    'mode': mode,
+                    'lang': dest or source_lang,
+                    'format': fmt,
+                    'filename': output_path.name,
+                    'path': str(output_path),
+                })
+                tracker.emit('output', **outputs[-1])
+
+    return outputs
+
+
+def _result(outputs: List[dict], used_external_srt: bool, subtitle_count: int) -> dict:
+    return {
+        'output_filename': outputs[0]['filename'],
+        'output_path': outputs[0]['path'],
+        'outputs': outputs,
+        'used_external_srt': used_external_srt,
+        'subtitle_count': subtitle_count,
+    }
+
+
+async def run_translation_only(srt_path: Path, source_lang: str, target_langs: List[str],
+                               modes: List[str], output_dir: Path,
+                               tracker: Optional[StageTracker] = None,
+                               formats: Optional[List[str]] = None) -> dict:
+    """
+    Translate an existing SRT without touching the media file.
+
+    No ffmpeg, hashing or upload: the subtitles go straight from read_srt to step 4.
+    With mode 'orig' this only converts the SRT to the requested formats.
+    """
+    tracker = tracker or StageTracker()
+
+    with progress.bound(tracker):
+        with tracker.track('parse'):
+            print(f"[Step 3] Using external SRT: {srt_path}")
+            cues = await asyncio.to_thread(profiling.call, read_srt, srt_path)
+
+        outputs = await translate_and_write(
+            cues, srt_path.stem, source_lang, target_langs, modes, output_dir, tracker, formats=formats
+        )
+    return _result(outputs, True, len(cues))
+
+
+def _tracked(tracker: StageTracker) -> Callable[[str], AsyncContextManager]:
+    """Default `stage` for the helpers below: just time the stage (batch also waits for a slot)."""
+    @asynccontextmanager
+    async def stage(name: str):
+        with tracker.track(name):
+            yield
+    return stage
+
+
+async def trim_for_asr(hash_info: dict, audio_path: str, checkpoint: Checkpoint,
+                       stage: Callable[[str], AsyncContextManager]
+                       ) -> Tuple[dict, Optional[str], Optional[OffsetMap], bool]:
+    """
+    Cut long silences before upload, or restore a checkpointed trim.
+
+    Returns (asr_info, trimmed temp file or None, offsets or None, resumed);
+    `resumed` means the trimmed audio is already on the server, whole.
+    """
+    trimmed_checkpoint = checkpoint.get('trim')
+    if trimmed_checkpoint and checkpoint.get('uploaded') == trimmed_checkpoint['dataHash']:
+        # The trimmed audio is already on the server; only the offset map is needed
+        print("[INFO] Trimmed audio from checkpoint")
+        offsets = OffsetMap(trimmed_checkpoint['kept'], trimmed_checkpoint['duration'])
+        asr_info = {'dataHash': trimmed_checkpoint['dataHash'], 'file_path': None,
+                    'size': trimmed_checkpoint['size']}
+        return asr_info, None, offsets, True
+
+    async with stage('trim'):
+        trimmed = await trim_silence(audio_path)
+        if trimmed is None:
+            return hash_info, None, None, False
+        trimmed_path, offsets = trimmed
+        try:
+            asr_info = await generate_data_hash_async(trimmed_path, use_cache=False)
+        except BaseException:
+            os.remove(trimmed_path)
+            raise
+        await asyncio.to_thread(checkpoint.save, 'trim', {
+            'dataHash': asr_info['dataHash'], 'size': asr_info['size'],
+            'kept': offsets.kept, 'duration': offsets.duration,
+        })
+    return asr_info, trimmed_path, offsets, False
+
+
+async def request_asr(asr_info: dict, upload_source, audio_path: Optional[str], source_lang: str,
+                      segment: bool, tracker: StageTracker, checkpoint: Checkpoint,
+                      stage: Optional[Callable[[str], AsyncContextManager]] = None) -> dict:
+    """
+    Steps 1-2 to 3 for one audio: segmented when asked and long enough, else a single job.
+
+    Shared with batch.py, whose `stage` also waits for a free slot of the stage.
+    """
+    stage = stage or _tracked(tracker)
+    if segment:
+        async with stage('asr'):
+            subtitle_result = await segmented_subtitles(audio_path, asr_info['dataHash'], source_lang,
+                                                        size=asr_info['size'], stats=tracker.counters)
+        if subtitle_result is not None:
+            return subtitle_result
+
+    if checkpoint.get('uploaded') == asr_info['dataHash']:
+        print("[Step 2] Upload confirmed by checkpoint, skipping")
+    else:
+        # A network round-trip, so not part of the local 'hash' time
+        async with stage('exists'):
+            exists = await check_file_exists_async(asr_info['dataHash'])
+
+        # Step 2: Upload if not exists
+        if not exists:
+            async with stage('upload'):
+                print("[Step 2] Uploading audio file...")
+                exists = await upload_file_async(upload_source, asr_info['dataHash']) is not None
+        else:
+            print("[Step 2] File already exists on server, skipping upload")
+            tracker.emit('upload_skipped', data_hash=asr_info['dataHash'])
+        if exists:
+            await asyncio.to_thread(checkpoint.save, 'uploaded', asr_info['dataHash'])
+
+    # Step 3: Get subtitles from ASR
+    async with stage('asr'):
+        print("[Step 3] Requesting ASR subtitles from API...")
+        subtitle_result = await wait_for_subtitles_async(
+            asr_info['dataHash'], source_lang, size=asr_info['size'], stats=tracker.counters
+        )
+    if not subtitle_result:
+        raise PipelineError("ASR subtitle generation failed")
+    return subtitle_result
+
+
+def _release_audio(streamed, temp_files: List[str]):
+    """Release the spooled audio (memory or local tmp file) and any trimmed copies."""
+    if streamed is not None:
+        streamed.close()
+    for path in temp_files:
+        try:
+            os.remove(path)
+        except OSError as e:
+            print(f"[WARNING] Failed to remove temp file {path}: {e}")
+
+
+async def _transcribe_audio(input_path: Path, source_lang: str, segment: bool, trim: bool,
+                            tracker: StageTracker, checkpoint: Checkpoint) -> List[dict]:
+    """Extraction/hash, upload and ASR for one input; returns subs on the original timeline."""
+    streamed = None
+    temp_files = []
+
+    with started_calls() as shared:
+        try:
+            hash_info = checkpoint.audio()
+            if hash_info is not None:
+                print(f"[INFO] Audio from checkpoint: {hash_info['file_path']}")
+            elif input_path.suffix.lower() in SUPPORTED_VIDEO_EXTENSIONS:
+                # Video: reuse cached audio, or pipe ffmpeg output straight into hashing
+                with tracker.track('extract'):
+                    print("[INFO] Video file detected, extracting audio...")
+                    hash_info, streamed = await extract_audio_cached_async(input_path)
+                    if hash_info is None:
+                        raise PipelineError("Failed to extract audio from video")
+                tracker.counters['audio_cache_hit'] = int(hash_info.get('cached', False))
+            else:
+                # Step 1: Generate hash
+                with tracker.track('hash'):
+                    print("[Step 1] Generating hash and checking existence...")
+                    hash_info = await generate_data_hash_async(str(input_path))
+            await asyncio.to_thread(checkpoint.save_audio, hash_info)
+            upload_source = hash_info['file_path'] or hash_info.get('buffer')
+
+            # A cached ASR result makes the existence check, upload and polling unnecessary
+            subtitle_result = await cached_subtitles_async(hash_info['dataHash'], source_lang)
+            tracker.counters['asr_cache_hit'] = int(subtitle_result is not None)
+            if subtitle_result is not None:
+                print("[Step 1-3] Cached ASR result found, skipping existence check, upload and polling")
+                tracker.emit('asr_cached', count=len(subtitle_result['data']['subs']))
+                return subtitle_result['data']['subs']
+
+            audio_path = hash_info['file_path']
+            if audio_path is None and (segment or trim):
+                # ffmpeg needs a named file to seek in
+                audio_path = await asyncio.to_thread(streamed.save_temp)
+                temp_files.append(audio_path)
+
+            asr_info, offsets = hash_info, None
+            if trim:
+                asr_info, trimmed_path, offsets, resumed = await trim_for_asr(
+                    hash_info, audio_path, checkpoint, _tracked(tracker)
+                )
+                if trimmed_path is not None:
+                    temp_files.append(trimmed_path)
+                    audio_path = upload_source = trimmed_path
+                if resumed:
+                    # It went up whole, so it was short enough for a single ASR job
+                    segment = False
+            if offsets is not None:
+                tracker.counters['trimmed_seconds'] = round(offsets.removed, 3)
+
+            subtitle_result = await request_asr(asr_info, upload_source, audio_path, source_lang,
+                                                segment, tracker, checkpoint)
+
+            if offsets is not None:
+                # Back to the original timeline, cached under the untrimmed audio's dataHash
+                subtitle_result = remap_result(subtitle_result, offsets)
+                await asyncio.to_thread(store_subtitles, hash_info['dataHash'], source_lang, subtitle_result)
+            return subtitle_result['data']['subs']
+
+        finally:
+            # Shared uploads/segmentations started here read this audio; if this run was
+            # cancelled they may still be running for other callers, so release it after them
+            release_after(shared, functools.partial(_release_audio, streamed, temp_files))
+
+
+async def run_transcription(input_path: Path, srt_path: Optional[Path], source_lang: str,
+                            target_langs: List[str], modes: List[str], output_dir: Path,
+                            tracker: Optional[StageTracker] = None,
+                            segment: Optional[bool] = None,
+                            trim: Optional[bool] = None,
+                            formats: Optional[List[str]] = None) -> dict:
+    """
+    Run steps 1-4 without blocking the event loop and write every requested SRT.
+
+    ASR runs once; translations to all target languages are requested concurrently.
+    With an external SRT the audio work is skipped entirely (see run_translation_only).
+    With `segment` (default LR_SEGMENT_ASR) long audio is split at silences and
+    the segments go through ASR in parallel (see segment.py). With `trim`
+    (default LR_TRIM_SILENCE) long silences are cut before upload and the
+    timestamps are mapped back afterwards (see trim.py).
+
+    Every stage is checkpointed (see checkpoint.py), so a rerun after a crash
+    or failure resumes from the last completed stage. Each output is written
+    in every format of `formats` (default LR_SUBTITLE_FORMATS, see subtitles.py).
+    """
+    tracker = tracker or StageTracker()
+    segment = SEGMENT_ASR if segment is None else segment
+    trim = TRIM_SILENCE if trim is None else trim
+    if srt_path is not None:
+        return await run_translation_only(srt_path, source_lang, target_langs, modes, output_dir, tracker,
+                                          formats)
+
+    checkpoint = await asyncio.to_thread(Checkpoint.load, input_path, source_lang)
+    tracker.counters['resumed'] = int(bool(checkpoint.data))
+    if checkpoint.data:
+        tracker.emit('resumed', after=list(checkpoint.data))
+
+    with progress.bound(tracker):
+        subs = checkpoint.get('subs')
+        if subs is not None:
+            print("[Step 1-3] ASR subtitles from checkpoint")
+        else:
+            subs = await _transcribe_audio(input_path, source_lang, segment, trim, tracker, checkpoint)
+            await asyncio.to_thread(checkpoint.save, 'subs', subs)
+
+        outputs = await translate_and_write(
+            cues_from_subs(subs), input_path.stem, source_lang, target_langs, modes, output_dir, tracker,
+            checkpoint, formats
+        )
+    if not tracker.counters.get('translation_failures'):
+        # Keep it otherwise, so a rerun only retries the failed translations
+        await asyncio.to_thread(checkpoint.clear)
+    return _result(outputs, False, len(subs))
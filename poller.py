@@ -0,0 +1,251 @@
+# ASR 상태 폴링 스케줄 (적응형 간격 + 여러 작업을 하나의 스케줄러로 처리)
+import asyncio
+import heapq
+import itertools
+import os
+import random
+import time
+from collections import OrderedDict
+
+import progress
+
+# 폴링 간격 (초): 처음엔 짧게, 이후 배수로 늘려 최대값까지
+MIN_INTERVAL = float(os.environ.get('LR_POLL_MIN_INTERVAL', '1'))
+MAX_INTERVAL = float(os.environ.get('LR_POLL_MAX_INTERVAL', '15'))
+BACKOFF = float(os.environ.get('LR_POLL_BACKOFF', '1.5'))
+JITTER = 0.2
+
+# 업로드 오디오 기준 비트레이트 (ffmpeg -b:a 32k)로 길이를 추정
+ASSUMED_BITRATE = 32000
+# 오디오 길이 대비 ASR 처리 시간 비율 (예상 완료 시각 계산용)
+ASR_REALTIME_FACTOR = float(os.environ.get('LR_ASR_REALTIME_FACTOR', '0.05'))
+# 타임아웃: 최소 300초, 길이가 길면 길이 * 배수 + 여유
+BASE_TIMEOUT = float(os.environ.get('LR_ASR_BASE_TIMEOUT', '300'))
+TIMEOUT_FACTOR = float(os.environ.get('LR_ASR_TIMEOUT_FACTOR', '0.5'))
+
+# 동시에 나가는 폴링 요청 수
+POLL_CONCURRENCY = int(os.environ.get('LR_POLL_CONCURRENCY', '8'))
+
+
+def estimate_duration(size=None, duration=None):
+    # 길이(초)를 알면 그대로, 모르면 파일 크기로 추정
+    if duration:
+        return float(duration)
+    if size:
+        return size * 8 / ASSUMED_BITRATE
+    return None
+
+
+class PollSchedule:
+    # 한 작업의 폴링 간격/타임아웃 계산
+
+    def __init__(self, size=None, duration=None, max_wait=None, interval=None):
+        media_seconds = estimate_duration(size, duration)
+        self.expected = media_seconds * ASR_REALTIME_FACTOR if media_seconds else None
+        if max_wait is None:
+            max_wait = BASE_TIMEOUT
+            if media_seconds:
+                max_wait = max(BASE_TIMEOUT, media_seconds * TIMEOUT_FACTOR + 120)
+        self.max_wait = max_wait
+        # interval을 지정하면 예전처럼 고정 간격
+        self.fixed_interval = interval
+        self.attempt = 0
+
+    def next_delay(self, elapsed):
+        # 다음 폴링까지 대기 시간 (None이면 타임아웃)
+        if elapsed >= self.max_wait:
+            return None
+        if self.fixed_interval is not None:
+            delay = self.fixed_interval
+        else:
+            delay = min(MAX_INTERVAL, MIN_INTERVAL * BACKOFF ** self.attempt)
+            if self.expected is not None:
+                remaining = self.expected - elapsed
+                if remaining > 0:
+                    # 예상 완료 시각을 넘겨서 자지 않음
+                    delay = min(delay, max(MIN_INTERVAL, remaining))
+                    if remaining <= delay:
+                        # 예상 시각 이후엔 다시 빠르게 폴링
+                        self.attempt = -1
+            delay *= random.uniform(1 - JITTER, 1 + JITTER)
+        self.attempt += 1
+        return min(delay, self.max_wait - elapsed)
+
+
+class _Pending:
+    def __init__(self, data_hash, language, schedule, future):
+        self.data_hash = data_hash
+        self.language = language
+        self.schedule = schedule
+        self.future = future
+        self.started = time.monotonic()
+        self.polls = 0
+        self.waiters = 0
+        self.seq = None
+        # 이 키를 기다리는 작업들의 진행 상황 수신자 (progress.py)
+        self.reporters = []
+
+
+class PollScheduler:
+    # 대기 중인 모든 (dataHash, 언어)를 하나의 태스크가 시간순으로 폴링
+    # 같은 키를 여러 작업이 기다리면 폴링 한 번으로 모두에게 결과 전달
+
+    def __init__(self, fetch, check, concurrency=POLL_CONCURRENCY, history=1000, describe=None):
+        # fetch(data_hash, language) -> 응답, check(응답) -> (끝났는지, 결과)
+        # describe(응답) -> 진행 이벤트에 붙일 서버 상태 (dict, 선택)
+        self.fetch = fetch
+        self.check = check
+        self.describe = describe
+        self.concurrency = concurrency
+        self.history = history
+        self.total_polls = 0
+        self.completed = 0
+        self.timeouts = 0
+        self.poll_counts = OrderedDict()  # 끝난 키별 폴링 횟수
+        self._pending = {}
+        self._heap = []
+        self._counter = itertools.count()
+        self._loop = None
+        self._task = None
+        self._wakeup = None
+        self._slots = None
+        self._poll_tasks = set()
+
+    def _ensure_running(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._task is None or self._task.done():
+            # 새 이벤트 루프(테스트, 재시작)에서는 상태를 새로 만듦
+            self._loop = loop
+            self._pending = {}
+            self._heap = []
+            self._wakeup = asyncio.Event()
+            self._slots = asyncio.Semaphore(self.concurrency)
+            self._task = loop.create_task(self._run(), name='asr-poll-scheduler')
+
+    def _schedule(self, entry, delay):
+        entry.seq = next(self._counter)
+        heapq.heappush(self._heap, (self._loop.time() + delay, entry.seq, (entry.data_hash, entry.language)))
+        self._wakeup.set()
+
+    async def wait(self, data_hash, language, size=None, duration=None, max_wait=None,
+                   interval=None, stats=None):
+        # 자막 완료까지 대기 후 결과 반환 (실패/타임아웃이면 None)
+        # stats(dict)를 넘기면 폴링 횟수와 대기 시간을 채워줌
+        self._ensure_running()
+        key = (data_hash, language)
+        entry = self._pending.get(key)
+        if entry is None:
+            schedule = PollSchedule(size, duration, max_wait, interval)
+            entry = _Pending(data_hash, language, schedule, self._loop.create_future())
+            self._pending[key] = entry
+            self._schedule(entry, 0)
+
+        entry.waiters += 1
+        reporter = progress.current()
+        if reporter is not None:
+            entry.reporters.append(reporter)
+        try:
+            return await asyncio.shield(entry.future)
+        finally:
+            entry.waiters -= 1
+            if reporter is not None:
+                entry.reporters.remove(reporter)
+            if stats is not None:
+                stats['asr_polls'] = entry.polls
+                stats['asr_wait'] = round(time.monotonic() - entry.started, 3)
+            if entry.waiters == 0 and not entry.future.done():
+                # 기다리는 작업이 모두 취소되면 폴링도 중단
+                entry.future.cancel()
+                if self._pending.get(key) is entry:
+                    self._pending.pop(key)
+
+    async def _run(self):
+        while True:
+            if not self._heap:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+
+            due, seq, key = self._heap[0]
+            delay = due - self._loop.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
+
+            heapq.heappop(self._heap)
+            entry = self._pending.get(key)
+            if entry is None or entry.seq != seq:
+                continue
+            entry.seq = None
+            task = self._loop.create_task(self._poll(key, entry))
+            self._poll_tasks.add(task)
+            task.add_done_callback(self._poll_tasks.discard)
+
+    async def _poll(self, key, entry):
+        if entry.future.done():
+            return
+        try:
+            async with self._slots:
+                response = await self.fetch(entry.data_hash, entry.language)
+            entry.polls += 1
+            self.total_polls += 1
+            done, result = self.check(response)
+        except Exception as e:
+            self._finish(key, entry, error=e)
+            return
+
+        if done:
+            self._finish(key, entry, result=result)
+            return
+
+        elapsed = time.monotonic() - entry.started
+        print(f"    [INFO] 처리중... ({int(elapsed)}초 경과)", end='\r')
+        self._report(entry, response, elapsed)
+        delay = entry.schedule.next_delay(elapsed)
+        if delay is None:
+            print(f"\n    [ERROR] 타임아웃 ({int(entry.schedule.max_wait)}초 초과)")
+            self.timeouts += 1
+            self._finish(key, entry, result=None)
+            return
+        self._schedule(entry, delay)
+
+    def _report(self, entry, response, elapsed):
+        # 기다리는 작업마다 폴링 상태 전달 (스트리밍 API)
+        if not entry.reporters:
+            return
+        state = {}
+        if self.describe is not None:
+            try:
+                state = self.describe(response) or {}
+            except Exception:
+                state = {}
+        for reporter in list(entry.reporters):
+            reporter.emit('asr_poll', data_hash=entry.data_hash, polls=entry.polls,
+                          elapsed=round(elapsed, 1), **state)
+
+    def _finish(self, key, entry, result=None, error=None):
+        if self._pending.get(key) is entry:
+            self._pending.pop(key)
+        self.completed += 1
+        self.poll_counts[key] = entry.polls
+        while len(self.poll_counts) > self.history:
+            self.poll_counts.popitem(last=False)
+        if entry.future.done():
+            return
+        if error is not None:
+            entry.future.set_exception(error)
+        else:
+            entry.future.set_result(result)
+
+    def stats(self):
+        # 폴링 지표
+        return {
+            'pending': len(self._pending),
+            'total_polls': self.total_polls,
+            'completed': self.completed,
+            'timeouts': self.timeouts,
+        }
@@ -0,0 +1,161 @@
+"""
+Per-job timeline traces in the Chrome trace event format (chrome://tracing, ui.perfetto.dev).
+
+A Trace is bound to a run (a context variable, like progress.py) or, for
+main.py, to the whole process. While one is active, stages, dioco requests
+(with connect/TLS/TTFB/transfer phases), ffmpeg runs, hashing and subtitle
+rendering record spans into it; otherwise `span()` costs one lookup. Each
+asyncio task and each thread gets its own lane, so concurrent requests do
+not overlap in the viewer.
+
+With `cpu=True` the CPU-bound calls made through `call()` are also run under
+cProfile and merged into one .prof file (read with `python -m pstats` or
+snakeviz). Python 3.12+ allows one active profiler per interpreter, so
+profiled calls run one at a time.
+"""
+import asyncio
+import cProfile
+import json
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+_current: ContextVar = ContextVar('profiling_trace', default=None)
+# Process-wide trace (main.py --profile): its worker threads do not inherit context variables
+_process_trace: Optional['Trace'] = None
+_cpu_lock = threading.Lock()
+
+
+class Trace:
+    """Complete ('X') events of one job, in microseconds since the trace started."""
+
+    def __init__(self, name: str = 'job', cpu: bool = False):
+        self.name = name
+        self.cpu = cpu
+        self.events: List[dict] = []
+        self._origin = time.perf_counter()
+        self._lanes: Dict[object, int] = {}
+        self._profiles: List[cProfile.Profile] = []
+        self._lock = threading.Lock()
+
+    def _us(self, t: float) -> float:
+        return round((t - self._origin) * 1e6, 1)
+
+    def _lane(self) -> int:
+        # One lane per asyncio task, or per thread outside the event loop
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        key = task if task is not None else threading.get_ident()
+        with self._lock:
+            lane = self._lanes.get(key)
+            if lane is None:
+                lane = self._lanes[key] = len(self._lanes) + 1
+                label = task.get_name() if task is not None else threading.current_thread().name
+                self.events.append({'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': lane,
+                                    'args': {'name': label}})
+        return lane
+
+    def complete(self, name: str, cat: str, start: float, end: float, args: Optional[dict] = None,
+                 lane: Optional[int] = None):
+        """Record a span from perf_counter() timestamps."""
+        event = {'name': name, 'cat': cat, 'ph': 'X', 'pid': 1, 'tid': lane or self._lane(),
+                 'ts': self._us(start), 'dur': round((end - start) * 1e6, 1)}
+        if args:
+            event['args'] = args
+        with self._lock:
+            self.events.append(event)
+
+    @contextmanager
+    def span(self, name: str, cat: str, **args):
+        """Time the block; the yielded dict becomes the span's args and may be filled in inside it."""
+        lane = self._lane()
+        start = time.perf_counter()
+        try:
+            yield args
+        except BaseException as e:
+            args['error'] = type(e).__name__
+            raise
+        finally:
+            self.complete(name, cat, start, time.perf_counter(), args, lane)
+
+    def profiled(self, fn, *args, **kwargs):
+        """Run fn under its own cProfile.Profile; the profiles are merged on write."""
+        with _cpu_lock:
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # Another profiler is already running (python -m cProfile main.py ...)
+                return fn(*args, **kwargs)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                profile.disable()
+                with self._lock:
+                    self._profiles.append(profile)
+
+    def write(self, base_path) -> List[str]:
+        """Write <base_path>.trace.json (and <base_path>.prof with cpu=True); returns the paths."""
+        base_path = str(base_path)
+        with self._lock:
+            events = list(self.events)
+            profiles = list(self._profiles)
+        written = []
+        trace_path = base_path + '.trace.json'
+        with open(trace_path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms',
+                       'otherData': {'name': self.name, 'pid': os.getpid()}}, f)
+        written.append(trace_path)
+        if self.cpu and profiles:
+            prof_path = base_path + '.prof'
+            stats = pstats.Stats(profiles[0])
+            for profile in profiles[1:]:
+                stats.add(profile)
+            stats.dump_stats(prof_path)
+            written.append(prof_path)
+        return written
+
+
+@contextmanager
+def bound(trace: Trace):
+    """Record into `trace` inside the block and in tasks/threads (asyncio.to_thread) started from it."""
+    token = _current.set(trace)
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+
+
+def start_process_trace(trace: Trace):
+    """Record into `trace` from every thread of the process (plain threads do not copy context)."""
+    global _process_trace
+    _process_trace = trace
+
+
+def current() -> Optional[Trace]:
+    return _current.get() or _process_trace
+
+
+@contextmanager
+def span(name: str, cat: str = 'stage', **args):
+    """Trace.span on the active trace; a no-op (yielding the args dict) without one."""
+    trace = current()
+    if trace is None:
+        yield args
+        return
+    with trace.span(name, cat, **args) as span_args:
+        yield span_args
+
+
+def call(fn, *args, **kwargs):
+    """fn(*args) under cProfile when the active trace asked for CPU profiles."""
+    trace = current()
+    if trace is None or not trace.cpu:
+        return fn(*args, **kwargs)
+    return trace.profiled(fn, *args, **kwargs)
@@ -0,0 +1,59 @@
+"""
+Progress events of a pipeline run, for the streaming endpoints.
+
+The pipeline binds its StageTracker while it runs; code deep in the steps
+(upload byte counts, ASR polls) looks it up with `current()` without the
+tracker being passed down. Context variables follow asyncio tasks and
+asyncio.to_thread, so events land on the run that caused them. Work shared
+between runs (singleflight.py, the ASR poller) reports to every run waiting
+on it. Outside a bound run (main.py, batch) there is no reporter.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Optional
+
+_current: ContextVar = ContextVar('progress_reporter', default=None)
+
+
+@contextmanager
+def bound(reporter):
+    """Send `emit()` calls made inside the block (and tasks started from it) to `reporter.emit`."""
+    token = _current.set(reporter)
+    try:
+        yield reporter
+    finally:
+        _current.reset(token)
+
+
+def current():
+    """The reporter of the run this code belongs to, or None."""
+    return _current.get()
+
+
+class Fanout:
+    """Reporter passing each event to every reporter currently in `reporters` (a list owned by the caller)."""
+
+    def __init__(self, reporters: list):
+        self.reporters = reporters
+
+    def emit(self, event: str, **data):
+        for reporter in list(self.reporters):
+            reporter.emit(event, **data)
+
+
+async def counting(chunks: AsyncIterator[bytes], total: int, event: str = 'upload',
+                   interval: float = 0.5, reporter=None, **data) -> AsyncIterator[bytes]:
+    """Pass `chunks` through, emitting {sent, total} at most every `interval` seconds and at the end."""
+    reporter = reporter or _current.get()
+    sent = 0
+    last: Optional[float] = None
+    async for chunk in chunks:
+        yield chunk
+        sent += len(chunk)
+        if reporter is None:
+            continue
+        now = time.monotonic()
+        if last is None or now - last >= interval or sent >= total:
+            last = now
+            reporter.emit(event, sent=sent, total=total, **data)
@@ -0,0 +1,212 @@
+# dioco 엔드포인트별 요청 속도 제한 (토큰 버킷) + 서킷 브레이커
+# 스레드(main.py, ThreadPoolExecutor)와 asyncio 작업(API 서버, 배치)이 같은 버킷을 공유함
+import asyncio
+import os
+import threading
+import time
+
+# 엔드포인트별 기본 (초당 요청 수, 버스트)
+# LR_RATE_<엔드포인트 이름 대문자>="초당요청수[:버스트]" 로 덮어씀 (예: LR_RATE_FASR_ASC=20:40, 0이면 제한 없음)
+DEFAULT_RATE = float(os.environ.get('LR_RATE_DEFAULT', '10'))
+DEFAULT_LIMITS = {
+    'fasr_ada_UPLOAD': (10.0, 20),
+    'fasr_uploadAudio': (2.0, 4),
+    'fasr_asc': (10.0, 20),
+    'base_media_videoFileTranslations': (4.0, 8),
+}
+
+# 서킷 브레이커: 연속 실패가 이 횟수를 넘으면 OPEN, RESET 초 뒤 시험 요청 1개 허용 (HALF_OPEN)
+BREAKER_THRESHOLD = int(os.environ.get('LR_BREAKER_THRESHOLD', '5'))
+BREAKER_RESET = float(os.environ.get('LR_BREAKER_RESET', '30'))
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    # 엔드포인트가 계속 실패 중이라 요청을 보내지 않음
+    def __init__(self, name, retry_in):
+        super().__init__(f"{name}: circuit open, retry in {retry_in:.0f}s")
+        self.name = name
+        self.retry_in = retry_in
+
+
+class TokenBucket:
+    # 초당 rate개씩 채워지고 최대 burst개까지 쌓이는 버킷
+    # 토큰을 미리 예약하고 (잔고가 음수가 될 수 있음) 대기는 락 밖에서 하므로 스레드/태스크 어디서든 사용 가능
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        # Retry-After를 받으면 이 시각까지 엔드포인트 전체를 멈춤
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        # 토큰 하나를 예약하고 기다려야 할 시간(초)을 돌려줌
+        with self._lock:
+            now = time.monotonic()
+            if self.rate > 0:
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 and self.rate > 0 else 0.0
+            return max(wait, self._paused_until - now)
+
+    def pause(self, seconds):
+        # 서버가 Retry-After로 알려준 시간 동안 새 요청을 보내지 않음
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def acquire(self):
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    async def acquire_async(self):
+        delay = self.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return delay
+
+    def available(self):
+        with self._lock:
+            elapsed = time.monotonic() - self._updated
+            return min(self.burst, self._tokens + elapsed * self.rate)
+
+
+class CircuitBreaker:
+    # 연속 실패 횟수로 상태 전환: CLOSED -> OPEN -> (RESET 초 뒤) HALF_OPEN -> 성공 시 CLOSED
+
+    def __init__(self, name, threshold=BREAKER_THRESHOLD, reset_timeout=BREAKER_RESET):
+        self.name = name
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trips = 0
+        # HALF_OPEN 시험 요청을 보낸 시각 (응답 없이 끝나도 RESET 초 뒤엔 다시 시험)
+        self._probe_started = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return CLOSED
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return HALF_OPEN
+        return OPEN
+
+    def before_request(self):
+        # OPEN이면 CircuitOpenError, HALF_OPEN이면 시험 요청 하나만 통과
+        with self._lock:
+            state = self.state
+            if state == CLOSED:
+                return
+            now = time.monotonic()
+            if state == HALF_OPEN and (self._probe_started is None
+                                       or now - self._probe_started >= self.reset_timeout):
+                self._probe_started = now
+                return
+            retry_in = max(0.0, self.opened_at + self.reset_timeout - now)
+            raise CircuitOpenError(self.name, retry_in)
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probe_started = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            # 시험 요청이 실패했거나, 닫힌 상태에서 연속 실패가 임계값에 도달 (이미 열린 상태면 그대로 둠)
+            probing = self._probe_started is not None
+            if probing or (self.opened_at is None and self.failures >= self.threshold):
+                self.trips += 1
+                print(f"    [WARNING] {self.name}: 연속 실패 {self.failures}회 - {self.reset_timeout:.0f}초 동안 요청 중단")
+                self.opened_at = time.monotonic()
+            self._probe_started = None
+
+
+class Endpoint:
+    # 엔드포인트 하나의 버킷, 브레이커, 지표
+
+    def __init__(self, name, rate, burst):
+        self.name = name
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker(name)
+        self.requests = 0
+        self.retries = 0
+        self.throttled = 0
+        self.failures = 0
+        self.waited = 0.0
+        # 여러 스레드에서 지표를 올리므로 += 도 락 안에서
+        self._lock = threading.Lock()
+
+    def count(self, requests=0, retries=0, throttled=0, failures=0, waited=0.0):
+        with self._lock:
+            self.requests += requests
+            self.retries += retries
+            self.throttled += throttled
+            self.failures += failures
+            self.waited += waited
+
+    def stats(self):
+        with self._lock:
+            counters = {
+                'requests': self.requests,
+                'retries': self.retries,
+                'throttled': self.throttled,
+                'failures': self.failures,
+                'rate_wait_seconds': round(self.waited, 3),
+            }
+        return {
+            'rate': self.bucket.rate,
+            'burst': self.bucket.burst,
+            'tokens': round(self.bucket.available(), 2),
+            'state': self.breaker.state,
+            **counters,
+            'breaker_trips': self.breaker.trips,
+        }
+
+
+def _limits_for(name):
+    rate, burst = DEFAULT_LIMITS.get(name, (DEFAULT_RATE, int(DEFAULT_RATE * 2)))
+    value = os.environ.get(f'LR_RATE_{name.upper()}')
+    if value:
+        rate_text, _, burst_text = value.partition(':')
+        rate = float(rate_text)
+        burst = int(burst_text) if burst_text else max(1, int(rate * 2))
+    return rate, burst
+
+
+_endpoints = {}
+_endpoints_lock = threading.Lock()
+
+
+def endpoint(name):
+    # 이름별 Endpoint (프로세스 전체에서 하나)
+    ep = _endpoints.get(name)
+    if ep is None:
+        with _endpoints_lock:
+            ep = _endpoints.get(name)
+            if ep is None:
+                ep = Endpoint(name, *_limits_for(name))
+                _endpoints[name] = ep
+    return ep
+
+
+def endpoint_for_url(url):
+    # https://api.dioco.io/fasr_uploadAudio?dataHash=... -> fasr_uploadAudio
+    path = url.split('?', 1)[0].rstrip('/')
+    return endpoint(path.rsplit('/', 1)[-1])
+
+
+def stats():
+    # 엔드포인트별 지표
+    return {name: ep.stats() for name, ep in sorted(_endpoints.items())}
@@ -116,21 +116,12 @@ fi
 echo "======================================"
 echo ""
 
-# 비디오 파일 확장자 체크
-if [[ "$FILE_EXT_LOWER" =~ ^(mp4|avi|mkv|mov|wmv|flv|webm)$ ]]; then
-    echo "[INFO] 비디오 파일 감지 - 오디오 추출중..."
-    AUDIO_FILE="${FILE_DIR}${FILE_NAME}.ogg"
-    ffmpeg -i "$INPUT_FILE" -vn -ac 1 -ar 16000 -af "aresample=async=1:first_pts=0" -c:a libopus -b:a 32k -y "$AUDIO_FILE"
-
-    if [ $? -ne 0 ]; then
-        echo "[ERROR] 오디오 추출 실패"
-        read -p "Enter를 눌러 종료..."
-        exit 1
-    fi
-
-    python3 "${SCRIPT_DIR}/main.py" "$AUDIO_FILE" --source $SOURCE_LANG --dest $DEST_LANG $NO_TRANSLATE --subtitle-mode $MODE $USE_EXTERNAL_SRT --temp-audio
-else
+# 기존 SRT 번역은 오디오 처리가 필요 없음 (번역 전용 모드)
+if [ -n "$USE_EXTERNAL_SRT" ]; then
     python3 "${SCRIPT_DIR}/main.py" "$INPUT_FILE" --source $SOURCE_LANG --dest $DEST_LANG $NO_TRANSLATE --subtitle-mode $MODE $USE_EXTERNAL_SRT
+# 비디오/오디오 모두 main.py가 직접 처리 (비디오는 ffmpeg 출력을 파이프로 받아 임시 파일 없음)
+else
+    python3 "${SCRIPT_DIR}/main.py" "$INPUT_FILE" --source $SOURCE_LANG --dest $DEST_LANG $NO_TRANSLATE --subtitle-mode $MODE
 fi
 
 read -p "Enter를 눌러 종료..."
@@ -0,0 +1,280 @@
+"""
+Silence-aware segmentation for long recordings.
+
+The audio is split at silences found by ffmpeg's silencedetect into
+segments of at most SEGMENT_MAX_SECONDS. Each segment goes through
+step1-step3 concurrently as its own ASR job, and the resulting subs are
+shifted by the segment offset and stitched back together. The segments
+overlap by SEGMENT_OVERLAP seconds so no word is lost at a cut, and
+cues duplicated across an edge are merged.
+"""
+import asyncio
+import difflib
+import functools
+import os
+import re
+import shutil
+import tempfile
+from typing import List, Optional, Tuple
+
+import client
+import profiling
+from audio import FFMPEG_AUDIO_ARGS, FFMPEG_BIN, LOCAL_TMP_DIR
+from poller import estimate_duration
+from singleflight import SingleFlight, release_after, started_calls
+from step1 import generate_data_hash_async, check_file_exists_async
+from step2 import upload_file_async
+from step3 import cached_subtitles_async, store_subtitles, wait_for_subtitles_async
+
+# Off by default; LR_SEGMENT_ASR=1 (or --segment / "segment": true) turns it on
+SEGMENT_ASR = os.environ.get('LR_SEGMENT_ASR', '0') == '1'
+SEGMENT_MAX_SECONDS = float(os.environ.get('LR_SEGMENT_MAX_SECONDS', '600'))
+SEGMENT_OVERLAP = float(os.environ.get('LR_SEGMENT_OVERLAP', '0.5'))
+SEGMENT_PARALLELISM = int(os.environ.get('LR_SEGMENT_PARALLELISM', '4'))
+SILENCE_NOISE = os.environ.get('LR_SILENCE_NOISE', '-30dB')
+SILENCE_MIN_SECONDS = float(os.environ.get('LR_SILENCE_MIN_SECONDS', '0.5'))
+
+# Cues closer than this in text are treated as the same line at a segment edge
+MERGE_SIMILARITY = 0.6
+
+_SILENCE_START = re.compile(r'silence_start:\s*(-?[\d.]+)')
+_SILENCE_END = re.compile(r'silence_end:\s*(-?[\d.]+)')
+_DURATION = re.compile(r'Duration:\s*(\d+):(\d+):([\d.]+)')
+
+
+# (dataHash, language) -> segmented run in progress
+segmentations = SingleFlight('segmented ASR')
+
+
+class SegmentationError(Exception):
+    """Segmented ASR failed for at least one segment."""
+
+
+def parse_silencedetect(stderr: str) -> Tuple[List[Tuple[float, float]], Optional[float]]:
+    """(silences as (start, end) seconds, input duration or None) from ffmpeg stderr."""
+    duration = None
+    match = _DURATION.search(stderr)
+    if match:
+        hours, minutes, seconds = match.groups()
+        duration = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+    silences = []
+    start = None
+    for line in stderr.splitlines():
+        match = _SILENCE_START.search(line)
+        if match:
+            start = max(0.0, float(match.group(1)))
+            continue
+        match = _SILENCE_END.search(line)
+        if match and start is not None:
+            silences.append((start, float(match.group(1))))
+            start = None
+    if start is not None and duration is not None:
+        # Silence running to the end of the file
+        silences.append((start, duration))
+    return silences, duration
+
+
+def plan_segments(silences: List[Tuple[float, float]], duration: float,
+                  max_len: float = SEGMENT_MAX_SECONDS) -> List[Tuple[float, float]]:
+    """
+    Cut points as (start, end) seconds, each segment at most `max_len` long.
+
+    Cuts go at the middle of the latest silence in the second half of the
+    window, so segments stay reasonably balanced; without one it is a hard cut.
+    """
+    cuts = [0.0]
+    while duration - cuts[-1] > max_len:
+        start = cuts[-1]
+        candidates = [
+            (s + e) / 2 for s, e in silences
+            if start + max_len / 2 < (s + e) / 2 <= start + max_len
+        ]
+        cuts.append(max(candidates) if candidates else start + max_len)
+    cuts.append(duration)
+    return list(zip(cuts, cuts[1:]))
+
+
+def _normalize(text: str) -> str:
+    return ''.join(text.split())
+
+
+def _same_line(a: str, b: str) -> bool:
+    a, b = _normalize(a), _normalize(b)
+    if not a or not b:
+        return a == b
+    if a in b or b in a:
+        return True
+    return difflib.SequenceMatcher(None, a, b).ratio() >= MERGE_SIMILARITY
+
+
+def stitch_subs(segment_subs: List[Tuple[int, List[dict]]]) -> List[dict]:
+    """Shift each segment's subs by its offset (ms), then merge duplicated edge cues."""
+    cues = []
+    for offset, subs in segment_subs:
+        for sub in subs:
+            cues.append({**sub, 'begin': sub['begin'] + offset, 'end': sub['end'] + offset})
+    cues.sort(key=lambda cue: (cue['begin'], cue['end']))
+
+    merged = []
+    for cue in cues:
+        prev = merged[-1] if merged else None
+        if prev is not None and cue['begin'] < prev['end'] and _same_line(prev['text'], cue['text']):
+            # Same line heard by both segments: keep the fuller text and the union of times
+            if len(_normalize(cue['text'])) > len(_normalize(prev['text'])):
+                prev['text'] = cue['text']
+            prev['end'] = max(prev['end'], cue['end'])
+            continue
+        merged.append(cue)
+    return merged
+
+
+async def run_ffmpeg(args: list) -> str:
+    proc = None
+    try:
+        with profiling.span('ffmpeg', 'subprocess', args=' '.join(map(str, args))[:300]):
+            proc = await asyncio.create_subprocess_exec(
+                FFMPEG_BIN, *args,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.PIPE,
+            )
+            _, stderr = await proc.communicate()
+    except asyncio.CancelledError:
+        if proc is not None and proc.returncode is None:
+            proc.kill()
+        raise
+    stderr = stderr.decode(errors='replace')
+    if proc.returncode != 0:
+        raise SegmentationError(f"FFmpeg failed: {stderr.strip()[-500:]}")
+    return stderr
+
+
+async def detect_silences(audio_path: str) -> Tuple[List[Tuple[float, float]], Optional[float]]:
+    """Run ffmpeg silencedetect over the audio (decode only, no output file)."""
+    stderr = await run_ffmpeg([
+        '-hide_banner', '-nostats',
+        '-i', audio_path,
+        '-vn',
+        '-af', f'silencedetect=noise={SILENCE_NOISE}:d={SILENCE_MIN_SECONDS}',
+        '-f', 'null', '-',
+    ])
+    return parse_silencedetect(stderr)
+
+
+async def plan_audio_segments(audio_path: str, size: Optional[int] = None,
+                              max_len: float = SEGMENT_MAX_SECONDS) -> List[Tuple[float, float]]:
+    """Segments for this audio; a single segment means segmentation is not worth it."""
+    estimated = estimate_duration(size)
+    if estimated is not None and estimated <= max_len:
+        # Short enough for one ASR job; skip the silence scan entirely
+        return [(0.0, estimated)]
+
+    silences, duration = await detect_silences(audio_path)
+    if duration is None:
+        duration = estimated or 0.0
+    return plan_segments(silences, duration, max_len)
+
+
+async def _cut_segment(audio_path: str, start: float, end: float, output_path: str):
+    await run_ffmpeg([
+        '-loglevel', 'error',
+        '-ss', f'{start:.3f}',
+        '-t', f'{end - start:.3f}',
+        '-i', audio_path,
+        *FFMPEG_AUDIO_ARGS,
+        '-y', output_path,
+    ])
+
+
+async def _transcribe_segment(index: int, total: int, audio_path: str, start: float, end: float,
+                              duration: float, language: str, work_dir: str,
+                              slots: asyncio.Semaphore) -> Tuple[int, List[dict]]:
+    # Padded window so a line spoken across the cut is heard whole by one side
+    padded_start = max(0.0, start - SEGMENT_OVERLAP)
+    padded_end = min(duration, end + SEGMENT_OVERLAP)
+    label = f"segment {index + 1}/{total} ({padded_start:.1f}s-{padded_end:.1f}s)"
+
+    async with slots:
+        segment_path = os.path.join(work_dir, f'segment_{index:04d}.ogg')
+        await _cut_segment(audio_path, padded_start, padded_end, segment_path)
+        hash_info = await generate_data_hash_async(segment_path, use_cache=False)
+        data_hash = hash_info['dataHash']
+
+        result = await cached_subtitles_async(data_hash, language)
+        if result is None:
+            if not await check_file_exists_async(data_hash):
+                print(f"[INFO] Uploading {label}")
+                await upload_file_async(segment_path, data_hash)
+            result = await wait_for_subtitles_async(data_hash, language, size=hash_info['size'],
+                                                    duration=padded_end - padded_start)
+        os.remove(segment_path)
+
+    if not result:
+        raise SegmentationError(f"ASR failed for {label}")
+    print(f"[INFO] ASR done for {label}: {len(result['data']['subs'])} subs")
+    return int(round(padded_start * 1000)), result['data']['subs']
+
+
+async def segmented_subtitles(audio_path: str, data_hash: str, language: str,
+                              size: Optional[int] = None, max_len: float = SEGMENT_MAX_SECONDS,
+                              stats: Optional[dict] = None) -> Optional[dict]:
+    """
+    ASR result for long audio via parallel segments, or None if it fits in one job.
+
+    The stitched result is stored in the ASR cache under the full file's dataHash.
+    Concurrent calls for the same (dataHash, language) share one run.
+    Raises SegmentationError when any segment fails.
+    """
+    return await segmentations.do((data_hash, language), _segmented_subtitles,
+                                  audio_path, data_hash, language, size, max_len, stats)
+
+
+async def _segmented_subtitles(audio_path: str, data_hash: str, language: str,
+                               size: Optional[int], max_len: float,
+                               stats: Optional[dict]) -> Optional[dict]:
+    segments = await plan_audio_segments(audio_path, size, max_len)
+    if len(segments) < 2:
+        return None
+
+    duration = segments[-1][1]
+    print(f"[INFO] Splitting {duration:.0f}s of audio into {len(segments)} segments at silences")
+    if stats is not None:
+        stats['segments'] = len(segments)
+
+    slots = asyncio.Semaphore(max(1, SEGMENT_PARALLELISM))
+    work_dir = tempfile.mkdtemp(prefix='segments_', dir=LOCAL_TMP_DIR)
+    with started_calls() as shared:
+        tasks = [
+            asyncio.ensure_future(_transcribe_segment(i, len(segments), audio_path, start, end,
+                                                      duration, language, work_dir, slots))
+            for i, (start, end) in enumerate(segments)
+        ]
+        try:
+            results = await asyncio.gather(*tasks)
+        except BaseException:
+            # One failed segment fails the whole file; stop the others first
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        finally:
+            # Segment uploads shared with other callers may still be reading from work_dir
+            release_after(shared, functools.partial(shutil.rmtree, work_dir, ignore_errors=True))
+
+    subs = stitch_subs(results)
+    result = {'status': 'success', 'data': {'status': 'COMPLETE', 'subs': subs}}
+    await asyncio.to_thread(store_subtitles, data_hash, language, result)
+    print(f"[OK] Stitched {len(subs)} subs from {len(segments)} segments")
+    return result
+
+
+def segmented_subtitles_sync(audio_path: str, data_hash: str, language: str,
+                             size: Optional[int] = None) -> Optional[dict]:
+    """Blocking wrapper of segmented_subtitles for main.py."""
+    async def run():
+        try:
+            return await segmented_subtitles(audio_path, data_hash, language, size=size)
+        finally:
+            await client.close_async_client()
+
+    return asyncio.run(run())
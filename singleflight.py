@@ -0,0 +1,112 @@
+"""
+Single-flight coalescing: concurrent callers with the same key share one call.
+
+The shared call runs with the arguments of the caller that started it
+(spooled buffers, temp files). When that caller is cancelled the call may
+carry on for the others, so callers that own such inputs collect the calls
+they start with `started_calls()` and free the inputs with `release_after()`.
+"""
+import asyncio
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterator, List, Set
+
+import progress
+
+_started: ContextVar = ContextVar('singleflight_started', default=None)
+
+
+class _Call:
+    def __init__(self, task: asyncio.Task, reporters: List):
+        self.task = task
+        self.waiters = 0
+        # Progress reporters of the callers waiting on it (see progress.py)
+        self.reporters = reporters
+
+
+class SingleFlight:
+    """
+    Runs at most one `fn(*args)` per key at a time; callers arriving while it
+    is in flight await the same result (or exception). The call is cancelled
+    only when every waiter has been cancelled. Its progress events go to every
+    waiting caller's reporter, not just the first one's.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started = 0
+        self.coalesced = 0
+        self._calls: Dict[Hashable, _Call] = {}
+
+    def in_flight(self, key: Hashable) -> bool:
+        return key in self._calls
+
+    async def do(self, key: Hashable, fn: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        call = self._calls.get(key)
+        if call is None or call.task.get_loop() is not asyncio.get_running_loop():
+            reporters = []
+            with progress.bound(progress.Fanout(reporters)):
+                call = _Call(asyncio.ensure_future(fn(*args, **kwargs)), reporters)
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+            self.started += 1
+            started = _started.get()
+            if started is not None:
+                started.add(call.task)
+        else:
+            self.coalesced += 1
+            print(f"[INFO] Joining in-flight {self.name}: {key}")
+
+        call.waiters += 1
+        reporter = progress.current()
+        if reporter is not None:
+            call.reporters.append(reporter)
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if reporter is not None:
+                call.reporters.remove(reporter)
+            if call.waiters == 0 and not call.task.done():
+                call.task.cancel()
+
+    def _forget(self, key: Hashable, call: _Call):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def stats(self) -> dict:
+        return {
+            'name': self.name,
+            'in_flight': len(self._calls),
+            'started': self.started,
+            'coalesced': self.coalesced,
+        }
+
+
+@contextmanager
+def started_calls() -> Iterator[Set[asyncio.Task]]:
+    """Collect the shared calls started inside the block (and tasks created from it)."""
+    tasks: Set[asyncio.Task] = set()
+    token = _started.set(tasks)
+    try:
+        yield tasks
+    finally:
+        _started.reset(token)
+
+
+def release_after(tasks: Set[asyncio.Task], release: Callable[[], None]):
+    """Call `release` now, or once the last of `tasks` still running has finished; never waits."""
+    pending = [task for task in tasks if not task.done()]
+    if not pending:
+        release()
+        return
+    remaining = len(pending)
+
+    def done(_):
+        nonlocal remaining
+        remaining -= 1
+        if remaining == 0:
+            release()
+
+    for task in pending:
+        task.add_done_callback(done)
@@ -1,38 +1,31 @@
-import re
-
-def srt_time_to_ms(t):
-    # 00:01:23,456 → ms
-    h, m, rest = t.split(':')
-    s, ms = rest.split(',')
-
-    return (
-        int(h) * 3600000 +
-        int(m) * 60000 +
-        int(s) * 1000 +
-        int(ms)
-    )
-
-
-def parse_srt(path):
-    subs = []
-    texts = []
-
-    with open(path, 'r', encoding='utf-8') as f:
-        blocks = f.read().strip().split('\n\n')
-
-    for block in blocks:
-        lines = block.splitlines()
-        if len(lines) < 3:
+def split_list(value):
+    # "ko,en" / ["ko", "en,ja"] -> ["ko", "en", "ja"] (순서 유지, 중복 제거)
+    if isinstance(value, str):
+        value = [value]
+    items = []
+    for part in value:
+        for item in part.split(','):
+            item = item.strip()
+            if item and item not in items:
+                items.append(item)
+    return items
+
+
+def plan_outputs(file_name, modes, dests):
+    # 출력할 (모드, 대상 언어, 파일명) 목록
+    # 대상 언어 1개 + 모드 1개일 때는 기존 파일명을 그대로 사용
+    # orig: {이름}.srt / trans: {이름}_{언어}.srt
+    # dual: {이름}.srt, orig와 함께 요청하거나 언어가 여러 개면 {이름}_{언어}_dual.srt
+    outputs = []
+    for mode in modes:
+        if mode == 'orig':
+            outputs.append((mode, None, f"{file_name}.srt"))
             continue
-
-        time_line = lines[1]
-        text = " ".join(lines[2:]).strip()
-
-        start, end = time_line.split(' --> ')
-        subs.append({
-            'begin': srt_time_to_ms(start),
-            'end': srt_time_to_ms(end)
-        })
-        texts.append(text)
-
-    return subs, texts
+        for dest in dests:
+            if mode == 'trans':
+                outputs.append((mode, dest, f"{file_name}_{dest}.srt"))
+            elif 'orig' in modes or len(dests) > 1:
+                outputs.append((mode, dest, f"{file_name}_{dest}_dual.srt"))
+            else:
+                outputs.append((mode, dest, f"{file_name}.srt"))
+    return outputs
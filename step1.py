@@ -1,52 +1,99 @@
 # Step 1: dataHash 생성 및 파일 존재 확인
+import asyncio
 import hashlib
-import requests
+import os
+import time
 
+import client
+import metrics
+import profiling
+from cache import DiskCache
+
+# 해시 계산 시 한 번에 읽는 크기 (파일 전체를 메모리에 올리지 않음)
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# (경로, 크기, 수정시각, inode) -> dataHash 캐시
+hash_cache = DiskCache('data_hash', max_entries=int(os.environ.get('LR_HASH_CACHE_MAX', '5000')))
+
+
+def _file_identity(file_path):
+    # 캐시 무효화 판단에 사용하는 파일 식별 정보
+    st = os.stat(file_path)
+    return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'inode': st.st_ino}
+
+
+@metrics.timed('generate_data_hash')
+def generate_data_hash(file_path, use_cache=True):
+    # 파일의 MD5 해시와 크기로 dataHash 생성 (청크 단위로 읽어 메모리 사용량 일정)
+    file_path = os.path.abspath(file_path)
+    identity = _file_identity(file_path)
+
+    if use_cache:
+        cached = hash_cache.get(file_path, validate=lambda v: v['identity'] == identity)
+        if cached is not None:
+            print(f"[Step 1-1] 해시 캐시 사용: {file_path}")
+            print(f"    DataHash: {cached['dataHash']}")
+            return {
+                'dataHash': cached['dataHash'],
+                'file_path': file_path,
+                'md5': cached['md5'],
+                'size': identity['size']
+            }
 
-def generate_data_hash(file_path):
-    # 파일의 MD5 해시와 크기로 dataHash 생성
     print(f"[Step 1-1] 파일 읽기: {file_path}")
 
-    with open(file_path, 'rb') as f:
-        file_content = f.read()
+    md5 = hashlib.md5()
+    file_size = 0
+
+    with profiling.span('md5', 'cpu', path=file_path) as span, open(file_path, 'rb') as f:
+        started = time.perf_counter()
+        buf = bytearray(HASH_CHUNK_SIZE)
+        view = memoryview(buf)
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            md5.update(view[:n])
+            file_size += n
+        elapsed = time.perf_counter() - started
+        span['bytes'] = file_size
+        span['mb_per_s'] = round(file_size / 1e6 / elapsed, 1) if elapsed > 0 else None
 
-    md5_hash = hashlib.md5(file_content).hexdigest()
-    file_size = len(file_content)
+    md5_hash = md5.hexdigest()
     data_hash = f"{md5_hash}_{file_size}"
 
     print(f"    MD5: {md5_hash}")
     print(f"    Size: {file_size}")
     print(f"    DataHash: {data_hash}")
 
+    if use_cache and _file_identity(file_path) == identity:
+        # 해시 도중 파일이 바뀐 경우에는 저장하지 않음
+        hash_cache.set(file_path, {'identity': identity, 'dataHash': data_hash, 'md5': md5_hash})
+
     return {
         'dataHash': data_hash,
-        'file_content': file_content,
+        'file_path': file_path,
         'md5': md5_hash,
         'size': file_size
     }
 
 
-def check_file_exists(data_hash):
-    # 서버에 파일이 이미 존재하는지 확인
-    print(f"\n[Step 1-2] 파일 존재 여부 확인")
-
-    headers = {
-        'accept': 'application/json, text/plain, */*',
-        'accept-language': 'ko,en;q=0.9,en-US;q=0.8',
-        'content-type': 'application/json',
-        'origin': 'https://www.languagereactor.com',
-        'referer': 'https://www.languagereactor.com/',
-        'user-agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-    }
+async def generate_data_hash_async(file_path, use_cache=True):
+    # 해시 계산을 워커 스레드에서 실행 (이벤트 루프를 막지 않음)
+    return await asyncio.to_thread(profiling.call, generate_data_hash, file_path, use_cache)
 
-    response = requests.post(
-        'https://api-cdn.dioco.io/fasr_ada_UPLOAD',
-        headers=headers,
-        json={'dataHash': data_hash}
-    )
 
+def _parse_exists_response(response):
     print(f"    Status: {response.status_code}")
-    result = response.json()
+    # 오류 페이지는 '없음'으로 보고 업로드 단계로 넘김 (업로드가 실패하면 거기서 중단)
+    if response.status_code != 200:
+        print(f"    [ERROR] API 응답 오류: {response.status_code}")
+        return False
+    try:
+        result = response.json()
+    except ValueError as e:
+        print(f"    [ERROR] JSON 파싱 실패: {e}")
+        return False
     exists = result.get('data', {}).get('exists', False)
 
     if exists:
@@ -55,3 +102,31 @@ def check_file_exists(data_hash):
         print(f"    [INFO] 파일 없음 - 업로드 필요")
 
     return exists
+
+
+@metrics.timed('check_file_exists')
+def check_file_exists(data_hash):
+    # 서버에 파일이 이미 존재하는지 확인
+    print(f"\n[Step 1-2] 파일 존재 여부 확인")
+
+    response = client.post(
+        f'{client.CDN_BASE}/fasr_ada_UPLOAD',
+        headers=client.JSON_HEADERS,
+        json={'dataHash': data_hash}
+    )
+
+    return _parse_exists_response(response)
+
+
+@metrics.timed('check_file_exists')
+async def check_file_exists_async(data_hash):
+    # check_file_exists의 비동기 버전
+    print(f"\n[Step 1-2] 파일 존재 여부 확인")
+
+    response = await client.apost(
+        f'{client.CDN_BASE}/fasr_ada_UPLOAD',
+        headers=client.JSON_HEADERS,
+        json={'dataHash': data_hash}
+    )
+
+    return _parse_exists_response(response)
@@ -1,31 +1,115 @@
 # Step 2: 파일 업로드 (exists가 false인 경우만)
-import requests
+import os
 
+import client
+import metrics
+import progress
+from singleflight import SingleFlight
+
+# dataHash -> 진행 중인 업로드
+uploads = SingleFlight('upload')
+
+
+class _SizedReader:
+    # 길이를 아는 읽기 전용 래퍼 - requests가 Content-Length를 붙이고 블록 단위로 읽어 전송함
+    # (스풀 버퍼의 fileno()를 건드리지 않아 메모리에 있는 버퍼가 디스크로 넘어가지 않음)
+
+    def __init__(self, f, size):
+        self._f = f
+        self._size = size
+
+    def __len__(self):
+        return self._size
+
+    def read(self, n=-1):
+        return self._f.read(n)
+
+    def __iter__(self):
+        return iter(lambda: self._f.read(1024 * 1024), b'')
 
-def upload_file(file_content, data_hash):
-    # 오디오/비디오 파일을 서버에 업로드
-    print(f"\n[Step 2] 파일 업로드")
 
-    headers = {
-        'accept': '*/*',
-        'accept-language': 'ko,en;q=0.9,en-US;q=0.8',
-        'content-type': 'application/octet-stream',
-        'origin': 'https://www.languagereactor.com',
-        'referer': 'https://www.languagereactor.com/',
-        'user-agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+def _source_size(source):
+    # 경로 또는 열린 파일 객체의 크기
+    if isinstance(source, (str, os.PathLike)):
+        return os.path.getsize(source)
+    source.seek(0, os.SEEK_END)
+    size = source.tell()
+    source.seek(0)
+    return size
+
+
+def _upload_headers(size):
+    return {
+        **client.UPLOAD_HEADERS,
+        'content-length': str(size),
     }
 
-    response = requests.post(
-        f'https://api.dioco.io/fasr_uploadAudio?dataHash={data_hash}',
-        headers=headers,
-        data=file_content
-    )
 
+def _parse_upload_response(response):
     print(f"    Status: {response.status_code}")
 
-    if response.status_code == 200:
-        print(f"    [OK] 업로드 완료")
-        return response.json()
-    else:
+    if response.status_code != 200:
         print(f"    [ERROR] 업로드 실패")
         return None
+
+    try:
+        result = response.json()
+    except ValueError as e:
+        print(f"    [ERROR] JSON 파싱 실패: {e}")
+        return None
+    print(f"    [OK] 업로드 완료")
+    return result
+
+
+@metrics.timed('upload_file', failure=lambda result: result is None)
+def upload_file(source, data_hash):
+    # 오디오/비디오 파일을 서버에 업로드 (파일을 메모리에 올리지 않고 스트리밍 전송)
+    # source: 파일 경로 또는 열린 파일 객체 (ffmpeg 파이프로 받은 스풀 버퍼 등)
+    print(f"\n[Step 2] 파일 업로드")
+
+    size = _source_size(source)
+    if isinstance(source, (str, os.PathLike)):
+        f = open(source, 'rb')
+    else:
+        f = source
+
+    def body():
+        # 재시도할 때마다 처음부터 다시 보냄
+        f.seek(0)
+        return _SizedReader(f, size)
+
+    try:
+        response = client.post(
+            f'{client.API_BASE}/fasr_uploadAudio?dataHash={data_hash}',
+            headers=client.UPLOAD_HEADERS,
+            data=body,
+            timeout=(client.CONNECT_TIMEOUT, client.UPLOAD_READ_TIMEOUT)
+        )
+    finally:
+        if f is not source:
+            f.close()
+
+    metrics.UPLOAD_BYTES.inc(size)
+    return _parse_upload_response(response)
+
+
+async def upload_file_async(source, data_hash):
+    # upload_file의 비동기 버전 (같은 dataHash 업로드가 진행 중이면 그 결과를 같이 기다림)
+    return await uploads.do(data_hash, _upload_file_async, source, data_hash)
+
+
+@metrics.timed('upload_file', failure=lambda result: result is None)
+async def _upload_file_async(source, data_hash):
+    print(f"\n[Step 2] 파일 업로드")
+
+    size = _source_size(source)
+    response = await client.apost(
+        f'{client.API_BASE}/fasr_uploadAudio?dataHash={data_hash}',
+        headers=_upload_headers(size),
+        # 스트리밍 API 클라이언트에 전송한 바이트 수를 알림
+        content=lambda: progress.counting(client.iter_file(source), size, data_hash=data_hash),
+        timeout=(client.CONNECT_TIMEOUT, client.UPLOAD_READ_TIMEOUT)
+    )
+
+    metrics.UPLOAD_BYTES.inc(size)
+    return _parse_upload_response(response)
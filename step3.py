@@ -1,29 +1,26 @@
 # Step 3: 자막 생성 및 조회 요청
-import requests
+import asyncio
+import os
 import time
 
+import client
+import metrics
+from cache import DiskCache
+from poller import PollSchedule, PollScheduler
 
-def request_subtitles(data_hash, language='ja'):
-    # 자막 생성 요청
-    headers = {
-        'accept': 'application/json, text/plain, */*',
-        'accept-language': 'ko,en;q=0.9,en-US;q=0.8',
-        'content-type': 'application/json',
-        'origin': 'https://www.languagereactor.com',
-        'referer': 'https://www.languagereactor.com/',
-        'user-agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+# (dataHash, 언어) -> 완료된 ASR 결과 캐시
+asr_cache = DiskCache('asr_results', max_entries=int(os.environ.get('LR_ASR_CACHE_MAX', '2000')))
+
+
+def _subtitles_request(data_hash, language):
+    return {
+        'source': 'UPLOAD',
+        'dataHash': data_hash,
+        'lang_G': language
     }
 
-    response = requests.post(
-        'https://api-cdn.dioco.io/fasr_asc',
-        headers=headers,
-        json={
-            'source': 'UPLOAD',
-            'dataHash': data_hash,
-            'lang_G': language
-        }
-    )
 
+def _parse_subtitles_response(response):
     if response.status_code != 200:
         print(f"    [ERROR] API 응답 오류: {response.status_code}")
         print(f"    응답 내용: {response.text}")
@@ -37,30 +34,128 @@ def request_subtitles(data_hash, language='ja'):
         return None
 
 
-def wait_for_subtitles(data_hash, language='ja', max_wait=300, interval=5):
+def request_subtitles(data_hash, language='ja'):
+    # 자막 생성 요청
+    response = client.post(
+        f'{client.CDN_BASE}/fasr_asc',
+        headers=client.JSON_HEADERS,
+        json=_subtitles_request(data_hash, language)
+    )
+
+    return _parse_subtitles_response(response)
+
+
+async def request_subtitles_async(data_hash, language='ja'):
+    # request_subtitles의 비동기 버전
+    response = await client.apost(
+        f'{client.CDN_BASE}/fasr_asc',
+        headers=client.JSON_HEADERS,
+        json=_subtitles_request(data_hash, language)
+    )
+
+    return _parse_subtitles_response(response)
+
+
+def _asr_cache_key(data_hash, language):
+    return f"{data_hash}:{language}"
+
+
+def cached_subtitles(data_hash, language='ja'):
+    # 이전에 완료된 ASR 결과 조회 (없으면 None)
+    result = asr_cache.get(_asr_cache_key(data_hash, language))
+    if result is not None:
+        print(f"\n[Step 3] 캐시된 자막 사용 ({len(result['data']['subs'])}개)")
+    return result
+
+
+async def cached_subtitles_async(data_hash, language='ja'):
+    return await asyncio.to_thread(cached_subtitles, data_hash, language)
+
+
+def store_subtitles(data_hash, language, result):
+    # 자막(subs)만 저장 (단어별 segments는 크기가 커서 제외)
+    if result is not None:
+        asr_cache.set(_asr_cache_key(data_hash, language), {
+            'status': 'success',
+            'data': {'status': 'COMPLETE', 'subs': result['data']['subs']}
+        })
+
+
+def _check_result(result):
+    # 폴링 결과 확인: (끝났는지, 반환할 결과)
+    if result is None:
+        print(f"\n    [ERROR] API 요청 실패")
+        return True, None
+
+    status = result.get('data', {}).get('status')
+
+    if status == 'COMPLETE':
+        subs = result.get('data', {}).get('subs', [])
+        print(f"\n    [OK] 자막 생성 완료")
+        print(f"    자막 개수: {len(subs)}")
+        return True, result
+
+    return False, None
+
+
+@metrics.timed('wait_for_subtitles', failure=lambda result: result is None)
+def wait_for_subtitles(data_hash, language='ja', max_wait=None, interval=None,
+                       size=None, duration=None, stats=None):
     # 자막 생성 완료까지 대기
+    # 처음엔 짧은 간격으로, 이후 점점 길게 폴링 (interval을 주면 고정 간격)
+    # max_wait를 생략하면 파일 크기/길이에 비례해 타임아웃 결정
     print(f"\n[Step 3] 자막 생성 대기중...")
 
-    elapsed = 0
+    schedule = PollSchedule(size, duration, max_wait, interval)
+    started = time.monotonic()
+    polls = 0
+
+    try:
+        while True:
+            polls += 1
+            done, result = _check_result(request_subtitles(data_hash, language))
+            if done:
+                store_subtitles(data_hash, language, result)
+                return result
+
+            elapsed = time.monotonic() - started
+            delay = schedule.next_delay(elapsed)
+            if delay is None:
+                print(f"\n    [ERROR] 타임아웃 ({int(schedule.max_wait)}초 초과)")
+                return None
+
+            print(f"    [INFO] 처리중... ({int(elapsed)}초 경과)", end='\r')
+            time.sleep(delay)
+    finally:
+        wait = time.monotonic() - started
+        metrics.ASR_POLLS.observe(polls)
+        metrics.ASR_WAIT_SECONDS.observe(wait)
+        if stats is not None:
+            stats['asr_polls'] = polls
+            stats['asr_wait'] = round(wait, 3)
 
-    while elapsed < max_wait:
-        result = request_subtitles(data_hash, language)
 
-        if result is None:
-            print(f"\n    [ERROR] API 요청 실패")
-            return None
+def _poll_state(result):
+    # 처리 중 응답의 서버 상태 (예: {'lastChunkIndex': 3}) - 진행 이벤트용
+    status = (result or {}).get('data', {}).get('status')
+    return {'status': status} if status is not None else {}
 
-        status = result.get('data', {}).get('status')
 
-        if status == 'COMPLETE':
-            subs = result.get('data', {}).get('subs', [])
-            print(f"\n    [OK] 자막 생성 완료")
-            print(f"    자막 개수: {len(subs)}")
-            return result
+# 비동기 대기는 프로세스 전체에서 하나의 스케줄러가 처리
+scheduler = PollScheduler(request_subtitles_async, _check_result, describe=_poll_state)
 
-        print(f"    [INFO] 처리중... ({elapsed}초 경과)", end='\r')
-        time.sleep(interval)
-        elapsed += interval
 
-    print(f"\n    [ERROR] 타임아웃 ({max_wait}초 초과)")
-    return None
+@metrics.timed('wait_for_subtitles', failure=lambda result: result is None)
+async def wait_for_subtitles_async(data_hash, language='ja', max_wait=None, interval=None,
+                                   size=None, duration=None, stats=None):
+    # wait_for_subtitles의 비동기 버전 (대기 중 이벤트 루프를 막지 않음)
+    print(f"\n[Step 3] 자막 생성 대기중...")
+    stats = {} if stats is None else stats
+    try:
+        result = await scheduler.wait(data_hash, language, size=size, duration=duration,
+                                      max_wait=max_wait, interval=interval, stats=stats)
+    finally:
+        metrics.ASR_POLLS.observe(stats.get('asr_polls', 0))
+        metrics.ASR_WAIT_SECONDS.observe(stats.get('asr_wait', 0.0))
+    await asyncio.to_thread(store_subtitles, data_hash, language, result)
+    return result
@@ -1,55 +1,254 @@
 # Step 4: 번역 요청
-import requests
+import asyncio
+import hashlib
+import os
+import time
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
 
+import client
+import metrics
+from cache import DiskCache
+from singleflight import SingleFlight
 
-def translate_subtitles(subs_texts, source_lang='ja', dest_lang='ko'):
-    # 자막 번역 요청
+AZ1_SHA256 = 'AAQSkZJRgABAQAAAQABAAD/2wCEAAkGBxMTEhUSEhMWFhUXF'
+
+# (원본 언어, 대상 언어, 정규화된 문장) -> 번역문 캐시
+translation_cache = DiskCache(
+    'translations', max_entries=int(os.environ.get('LR_TRANSLATION_CACHE_MAX', '200000'))
+)
+
+# (원본 언어, 대상 언어, 자막 목록 해시) -> 진행 중인 번역
+inflight_translations = SingleFlight('translation')
+
+# 긴 자막은 청크로 나눠 동시에 요청 (줄 수/글자 수 상한)
+CHUNK_LINES = int(os.environ.get('LR_TRANSLATE_CHUNK_LINES', '400'))
+CHUNK_CHARS = int(os.environ.get('LR_TRANSLATE_CHUNK_CHARS', '20000'))
+PARALLELISM = int(os.environ.get('LR_TRANSLATE_PARALLELISM', '4'))
+# 실패한 청크만 다시 요청하는 횟수
+RETRIES = int(os.environ.get('LR_TRANSLATE_RETRIES', '2'))
+RETRY_DELAY = 1.0
+
+
+def _normalize(text):
+    # 유니코드 정규화 + 공백 정리 (같은 대사는 같은 키가 되도록)
+    return ' '.join(unicodedata.normalize('NFC', text).split())
+
+
+def _cache_key(source_lang, dest_lang, text):
+    raw = f"{source_lang}\0{dest_lang}\0{_normalize(text)}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def _plan(subs_texts, source_lang, dest_lang, use_cache):
+    # 캐시에 없는 문장만 중복 없이 골라냄
     print(f"\n[Step 4] 번역 요청")
     print(f"    자막 개수: {len(subs_texts)}")
     print(f"    {source_lang} -> {dest_lang}")
 
-    # f 값 계산 (핵심 공식)
-    f_value = (len(subs_texts) % 56) + 17
-    print(f"    f 값: {f_value}")
+    keys = [_cache_key(source_lang, dest_lang, text) for text in subs_texts]
+    cached = translation_cache.get_many(keys) if use_cache else {}
+
+    miss_keys = []
+    miss_texts = []
+    seen = set()
+    for key, text in zip(keys, subs_texts):
+        if key in cached or key in seen:
+            continue
+        seen.add(key)
+        miss_keys.append(key)
+        miss_texts.append(text)
 
-    headers = {
-        'accept': 'application/json, text/plain, */*',
-        'accept-language': 'ko,en;q=0.9,en-US;q=0.8',
-        'content-type': 'application/json',
-        'origin': 'https://www.languagereactor.com',
-        'priority': 'u=1, i',
-        'referer': 'https://www.languagereactor.com/',
-        'sec-ch-ua': '"Microsoft Edge";v="143", "Chromium";v="143", "Not A(Brand";v="24"',
-        'sec-ch-ua-mobile': '?0',
-        'sec-ch-ua-platform': '"Windows"',
-        'sec-fetch-dest': 'empty',
-        'sec-fetch-mode': 'cors',
-        'sec-fetch-site': 'cross-site',
-        'user-agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+    hit_lines = sum(1 for key in keys if key in cached)
+    print(f"    캐시 적중: {hit_lines}줄, 요청: {len(miss_texts)}줄 (중복 제거)")
+
+    return keys, cached, miss_keys, miss_texts
+
+
+def _split_chunks(texts, max_lines, max_chars):
+    # [(시작, 끝)] 구간으로 나눔 (한 줄이 상한보다 길어도 최소 한 줄은 포함)
+    chunks = []
+    start = 0
+    chars = 0
+    for i, text in enumerate(texts):
+        if i > start and (i - start >= max_lines or chars + len(text) > max_chars):
+            chunks.append((start, i))
+            start = i
+            chars = 0
+        chars += len(text)
+    if start < len(texts):
+        chunks.append((start, len(texts)))
+    return chunks
+
+
+def _collect(chunks, results, miss_keys):
+    # 성공한 청크의 번역만 {key: 번역} 으로 모음
+    fresh = {}
+    for (start, end), translated in zip(chunks, results):
+        if translated is not None:
+            fresh.update(zip(miss_keys[start:end], translated))
+    return fresh
+
+
+def _assemble(keys, cached, fresh, use_cache, complete):
+    # 새 번역을 캐시에 저장하고 원래 순서대로 다시 배치
+    # 일부 청크가 실패해도 성공한 부분은 저장 (다음 실행에서 실패분만 요청)
+    if use_cache:
+        translation_cache.set_many(fresh)
+    if not complete:
+        print(f"    [ERROR] 번역 실패 (일부 청크 실패)")
+        return None
+    merged = {**cached, **fresh}
+    return {
+        'status': 'success',
+        'data': {'subs': [merged.get(key) for key in keys]}
     }
 
-    json_data = {
-        'AZ1_sha256': 'AAQSkZJRgABAQAAAQABAAD/2wCEAAkGBxMTEhUSEhMWFhUXF',
+
+def _translation_request(subs_texts, source_lang, dest_lang):
+    # f 값 계산 (핵심 공식) - 실제로 보내는 자막 개수 기준
+    f_value = (len(subs_texts) % 56) + 17
+    print(f"    f 값: {f_value}")
+
+    return {
+        'AZ1_sha256': AZ1_SHA256,
         'subs': subs_texts,
         'langCode_G': source_lang,
         'destLangCode_G': dest_lang,
         'f': f_value,
     }
 
-    response = requests.post(
-        'https://api-cdn.dioco.io/base_media_videoFileTranslations',
-        headers=headers,
-        json=json_data
-    )
 
+def _parse_translation_response(response, expected):
     print(f"    Status: {response.status_code}")
-    result = response.json()
+    if response.status_code != 200:
+        print(f"    [ERROR] API 응답 오류: {response.status_code}")
+        return None
+    try:
+        result = response.json()
+    except ValueError as e:
+        print(f"    [ERROR] JSON 파싱 실패: {e}")
+        return None
 
     if result.get('status') == 'success':
         translations = result.get('data', {}).get('subs', [])
+        if len(translations) != expected:
+            print(f"    [ERROR] 번역 개수 불일치 ({len(translations)} != {expected})")
+            return None
         print(f"    [OK] 번역 완료")
         print(f"    번역 개수: {len(translations)}")
-        return result
+        return translations
     else:
         print(f"    [ERROR] 번역 실패")
         return None
+
+
+def _post_chunk(texts, source_lang, dest_lang, label):
+    print(f"    {label} ({len(texts)}줄)")
+    try:
+        response = client.post(
+            f'{client.CDN_BASE}/base_media_videoFileTranslations',
+            headers=client.TRANSLATE_HEADERS,
+            json=_translation_request(texts, source_lang, dest_lang)
+        )
+        metrics.TRANSLATE_PAYLOAD_BYTES.observe(len(response.request.body or b''))
+        return _parse_translation_response(response, len(texts))
+    except Exception as e:
+        print(f"    [ERROR] {label} 요청 실패: {e}")
+        return None
+
+
+async def _post_chunk_async(texts, source_lang, dest_lang, label):
+    print(f"    {label} ({len(texts)}줄)")
+    try:
+        response = await client.apost(
+            f'{client.CDN_BASE}/base_media_videoFileTranslations',
+            headers=client.TRANSLATE_HEADERS,
+            json=_translation_request(texts, source_lang, dest_lang)
+        )
+        metrics.TRANSLATE_PAYLOAD_BYTES.observe(len(response.request.content))
+        return _parse_translation_response(response, len(texts))
+    except Exception as e:
+        print(f"    [ERROR] {label} 요청 실패: {e}")
+        return None
+
+
+@metrics.timed('translate_subtitles', failure=lambda result: result is None)
+def translate_subtitles(subs_texts, source_lang='ja', dest_lang='ko', use_cache=True,
+                        chunk_lines=CHUNK_LINES, chunk_chars=CHUNK_CHARS,
+                        parallelism=PARALLELISM, retries=RETRIES):
+    # 자막 번역 요청 (캐시에 없는 문장만, 청크 단위로 동시에 전송)
+    metrics.TRANSLATE_CUES.observe(len(subs_texts))
+    keys, cached, miss_keys, miss_texts = _plan(subs_texts, source_lang, dest_lang, use_cache)
+    if not miss_texts:
+        print(f"    [OK] 전부 캐시에서 번역 사용")
+        return _assemble(keys, cached, {}, use_cache, True)
+
+    chunks = _split_chunks(miss_texts, chunk_lines, chunk_chars)
+    results = [None] * len(chunks)
+    pending = list(range(len(chunks)))
+
+    for attempt in range(retries + 1):
+        if attempt:
+            print(f"    [INFO] 실패한 청크 {len(pending)}개 재시도 ({attempt}/{retries})")
+            time.sleep(RETRY_DELAY * attempt)
+        with ThreadPoolExecutor(max_workers=max(1, min(parallelism, len(pending)))) as pool:
+            outputs = list(pool.map(
+                lambda i: _post_chunk(miss_texts[slice(*chunks[i])], source_lang, dest_lang,
+                                      f"청크 {i + 1}/{len(chunks)}"),
+                pending
+            ))
+        for i, output in zip(pending, outputs):
+            results[i] = output
+        pending = [i for i in pending if results[i] is None]
+        if not pending:
+            break
+
+    return _assemble(keys, cached, _collect(chunks, results, miss_keys), use_cache, not pending)
+
+
+async def translate_subtitles_async(subs_texts, source_lang='ja', dest_lang='ko', use_cache=True,
+                                    chunk_lines=CHUNK_LINES, chunk_chars=CHUNK_CHARS,
+                                    parallelism=PARALLELISM, retries=RETRIES):
+    # translate_subtitles의 비동기 버전 (캐시 조회/저장은 워커 스레드에서)
+    # 같은 자막 목록을 같은 언어로 번역 중이면 새로 요청하지 않고 그 결과를 같이 기다림
+    digest = hashlib.sha256('\0'.join(subs_texts).encode('utf-8')).hexdigest()
+    key = (source_lang, dest_lang, digest, use_cache)
+    return await inflight_translations.do(key, _translate_subtitles_async, subs_texts, source_lang, dest_lang,
+                                 use_cache, chunk_lines, chunk_chars, parallelism, retries)
+
+
+@metrics.timed('translate_subtitles', failure=lambda result: result is None)
+async def _translate_subtitles_async(subs_texts, source_lang, dest_lang, use_cache,
+                                     chunk_lines, chunk_chars, parallelism, retries):
+    metrics.TRANSLATE_CUES.observe(len(subs_texts))
+    keys, cached, miss_keys, miss_texts = await asyncio.to_thread(
+        _plan, subs_texts, source_lang, dest_lang, use_cache
+    )
+    if not miss_texts:
+        print(f"    [OK] 전부 캐시에서 번역 사용")
+        return await asyncio.to_thread(_assemble, keys, cached, {}, use_cache, True)
+
+    chunks = _split_chunks(miss_texts, chunk_lines, chunk_chars)
+    results = [None] * len(chunks)
+    pending = list(range(len(chunks)))
+    slots = asyncio.Semaphore(max(1, parallelism))
+
+    async def run(i):
+        async with slots:
+            return await _post_chunk_async(miss_texts[slice(*chunks[i])], source_lang, dest_lang,
+                                           f"청크 {i + 1}/{len(chunks)}")
+
+    for attempt in range(retries + 1):
+        if attempt:
+            print(f"    [INFO] 실패한 청크 {len(pending)}개 재시도 ({attempt}/{retries})")
+            await asyncio.sleep(RETRY_DELAY * attempt)
+        outputs = await asyncio.gather(*(run(i) for i in pending))
+        for i, output in zip(pending, outputs):
+            results[i] = output
+        pending = [i for i in pending if results[i] is None]
+        if not pending:
+            break
+
+    fresh = _collect(chunks, results, miss_keys)
+    return await asyncio.to_thread(_assemble, keys, cached, fresh, use_cache, not pending)
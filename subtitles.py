@@ -0,0 +1,225 @@
+"""
+Subtitle model, SRT parser and SRT/WebVTT/ASS/JSON writers shared by main.py and the API.
+
+Cues are compact (`__slots__`) and every writer works from the same list,
+so one pass over the cues renders all requested formats of an output.
+"""
+import json
+import os
+import re
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+
+import profiling
+
+# Extension of each output format
+FORMATS = {
+    'srt': '.srt',
+    'vtt': '.vtt',
+    'ass': '.ass',
+    'json': '.json',
+}
+
+# Formats written when a request does not name any (LR_SUBTITLE_FORMATS="srt,vtt")
+DEFAULT_FORMATS = [
+    fmt.strip() for fmt in os.environ.get('LR_SUBTITLE_FORMATS', 'srt').split(',') if fmt.strip()
+]
+
+# "00:01:23,456 --> 00:01:25,000" and the usual variants: '.' separator, no hours, short fractions,
+# trailing position settings
+_TIMING = re.compile(
+    r'(?:(\d+):)?(\d{1,2}):(\d{1,2})[,.](\d{1,3})\s*-->\s*(?:(\d+):)?(\d{1,2}):(\d{1,2})[,.](\d{1,3})'
+)
+
+ASS_HEADER = """[Script Info]
+ScriptType: v4.00+
+WrapStyle: 0
+ScaledBorderAndShadow: yes
+PlayResX: 1920
+PlayResY: 1080
+
+[V4+ Styles]
+Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding
+Style: Default,Arial,56,&H00FFFFFF,&H000000FF,&H00000000,&H80000000,0,0,0,0,100,100,0,0,1,2,1,2,40,40,40,1
+
+[Events]
+Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
+"""
+
+
+class Cue:
+    """One subtitle: begin/end in ms and its text."""
+
+    __slots__ = ('begin', 'end', 'text')
+
+    def __init__(self, begin: int, end: int, text: str):
+        self.begin = begin
+        self.end = end
+        self.text = text
+
+    def __repr__(self):
+        return f"Cue({self.begin}, {self.end}, {self.text!r})"
+
+
+def cues_from_subs(subs: Iterable[dict]) -> List[Cue]:
+    """Cues from step3 subs ({'begin', 'end', 'text'} dicts)."""
+    return [Cue(sub['begin'], sub['end'], sub['text']) for sub in subs]
+
+
+def _ms(hours: Optional[str], minutes: str, seconds: str, fraction: str) -> int:
+    return ((int(hours or 0) * 60 + int(minutes)) * 60 + int(seconds)) * 1000 + int(fraction.ljust(3, '0'))
+
+
+def iter_srt(lines: Iterable[str]) -> Iterator[Cue]:
+    """
+    Cues from SRT lines, one at a time.
+
+    Tolerates a BOM, CRLF line ends, missing or extra blank lines, missing
+    index lines and '.' as the millisecond separator. Multi-line text is
+    joined with spaces; cues without text are skipped.
+    """
+    begin = end = None
+    text: List[str] = []
+    first = True
+    for line in lines:
+        if first:
+            line = line.lstrip('\ufeff')
+            first = False
+        line = line.strip()
+        match = _TIMING.search(line) if '-->' in line else None
+        if match:
+            if begin is not None:
+                # No blank line before this cue: the previous line was its index
+                if text and text[-1].isdigit():
+                    text.pop()
+                if text:
+                    yield Cue(begin, end, ' '.join(text))
+            groups = match.groups()
+            begin, end = _ms(*groups[:4]), _ms(*groups[4:])
+            text = []
+        elif not line:
+            if begin is not None and text:
+                yield Cue(begin, end, ' '.join(text))
+                begin = None
+                text = []
+        elif begin is not None:
+            text.append(line)
+    if begin is not None and text:
+        yield Cue(begin, end, ' '.join(text))
+
+
+def read_srt(path) -> List[Cue]:
+    """Parse an SRT file (streamed line by line)."""
+    with profiling.span('parse_srt', 'cpu', path=str(path)) as span, \
+            open(path, 'r', encoding='utf-8-sig', errors='replace') as f:
+        cues = list(iter_srt(f))
+        span['cues'] = len(cues)
+        return cues
+
+
+def cue_lines(original: str, translation: Optional[str], mode: str) -> List[str]:
+    """Text lines of one cue for an output mode (orig / dual / trans)."""
+    if mode == 'dual':
+        return [original, f"({translation})"] if translation else [original]
+    if mode == 'trans':
+        return [translation or original]
+    return [original]
+
+
+def _clock(ms: int, separator: str) -> str:
+    hours, ms = divmod(int(ms), 3600000)
+    minutes, ms = divmod(ms, 60000)
+    seconds, ms = divmod(ms, 1000)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}{separator}{ms:03d}"
+
+
+def _ass_clock(ms: int) -> str:
+    hours, ms = divmod(int(ms), 3600000)
+    minutes, ms = divmod(ms, 60000)
+    seconds, ms = divmod(ms, 1000)
+    return f"{hours:d}:{minutes:02d}:{seconds:02d}.{ms // 10:02d}"
+
+
+def _vtt_text(text: str) -> str:
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+def _ass_text(text: str) -> str:
+    # Braces start override blocks in ASS
+    return text.replace('{', '(').replace('}', ')').replace('\n', ' ')
+
+
+def render(cues: Sequence[Cue], translations: Optional[Sequence[Optional[str]]] = None,
+           mode: str = 'orig', formats: Iterable[str] = ('srt',)) -> Dict[str, str]:
+    """
+    Render the cues in every requested format in a single pass.
+
+    `translations` lines up with `cues` (None entries fall back to the
+    original text). Returns {format: file content}.
+    """
+    formats = list(dict.fromkeys(formats))
+    for fmt in formats:
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown subtitle format: {fmt}")
+    with profiling.span('render', 'cpu', cues=len(cues), formats=','.join(formats), mode=mode) as span:
+        rendered = _render(cues, translations, mode, formats)
+        span['bytes'] = sum(len(content) for content in rendered.values())
+    return rendered
+
+
+def _render(cues: Sequence[Cue], translations: Optional[Sequence[Optional[str]]], mode: str,
+            formats: List[str]) -> Dict[str, str]:
+    if translations is None:
+        translations = [None] * len(cues)
+
+    srt = [] if 'srt' in formats else None
+    vtt = ['WEBVTT\n\n'] if 'vtt' in formats else None
+    ass = [ASS_HEADER] if 'ass' in formats else None
+    entries = [] if 'json' in formats else None
+
+    for i, (cue, translation) in enumerate(zip(cues, translations), 1):
+        lines = cue_lines(cue.text, translation, mode)
+        if srt is not None or vtt is not None:
+            begin, end = _clock(cue.begin, ','), _clock(cue.end, ',')
+            if srt is not None:
+                srt.append(f"{i}\n{begin} --> {end}\n" + '\n'.join(lines) + '\n\n')
+            if vtt is not None:
+                # Same digits, '.' before the milliseconds
+                vtt.append(f"{i}\n{begin.replace(',', '.')} --> {end.replace(',', '.')}\n"
+                           + '\n'.join(_vtt_text(line) for line in lines) + '\n\n')
+        if ass is not None:
+            ass.append(f"Dialogue: 0,{_ass_clock(cue.begin)},{_ass_clock(cue.end)},Default,,0,0,0,,"
+                       + '\\N'.join(_ass_text(line) for line in lines) + '\n')
+        if entries is not None:
+            entry = {'index': i, 'begin': cue.begin, 'end': cue.end, 'text': cue.text}
+            if mode != 'orig':
+                entry['translation'] = translation
+            entries.append(entry)
+
+    rendered = {}
+    for fmt in formats:
+        if fmt == 'srt':
+            rendered[fmt] = ''.join(srt)
+        elif fmt == 'vtt':
+            rendered[fmt] = ''.join(vtt)
+        elif fmt == 'ass':
+            rendered[fmt] = ''.join(ass)
+        else:
+            rendered[fmt] = json.dumps({'mode': mode, 'cues': entries}, ensure_ascii=False, indent=1) + '\n'
+    return rendered
+
+
+def write_subtitles(cues: Sequence[Cue], translations: Optional[Sequence[Optional[str]]], mode: str,
+                    output_path, formats: Iterable[str] = ('srt',)) -> List[Path]:
+    """
+    Write one output in every requested format; the extension of
+    `output_path` is replaced per format. Returns the written paths.
+    """
+    output_path = Path(output_path)
+    written = []
+    for fmt, content in render(cues, translations, mode, formats).items():
+        path = output_path.with_suffix(FORMATS[fmt])
+        with open(path, 'w', encoding='utf-8', newline='\n') as f:
+            f.write(content)
+        written.append(path)
+    return written
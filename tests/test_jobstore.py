@@ -0,0 +1,119 @@
+import pytest
+
+from jobstore import CANCELLED, COMPLETED, FAILED, QUEUED, RUNNING, JobStore
+
+
+@pytest.fixture
+def store(tmp_path, clock):
+    return JobStore(str(tmp_path / "queue.sqlite3"), lease=10, max_attempts=2)
+
+
+def submit(store, job_id, clock, dedupe_key=None):
+    record, created = store.submit({"id": job_id, "params": {"name": job_id}, "created_at": clock()}, dedupe_key)
+    clock.advance(1)
+    return record, created
+
+
+def test_submit_dedupes_unfinished_jobs(store, clock):
+    first, created = submit(store, "a", clock, dedupe_key="k")
+    assert created and first["state"] == QUEUED and first["params"] == {"name": "a"}
+    again, created = submit(store, "b", clock, dedupe_key="k")
+    assert not created and again["id"] == "a"
+
+    store.claim("w1")
+    assert not submit(store, "c", clock, dedupe_key="k")[1]
+    store.finish("a", "w1", COMPLETED, {"ok": True}, None, "done", {}, {})
+    # A finished job no longer absorbs new submissions
+    record, created = submit(store, "d", clock, dedupe_key="k")
+    assert created and record["id"] == "d"
+
+
+def test_claim_leases_oldest_queued_job(store, clock):
+    submit(store, "a", clock)
+    submit(store, "b", clock)
+    job = store.claim("w1")
+    assert job["id"] == "a" and job["state"] == RUNNING
+    assert job["worker"] == "w1" and job["attempts"] == 1
+    assert job["lease_until"] == clock() + 10
+    assert store.claim("w2")["id"] == "b"
+    assert store.claim("w3") is None
+
+
+def test_heartbeat_renews_lease(store, clock):
+    submit(store, "a", clock)
+    store.claim("w1")
+    clock.advance(8)
+    assert store.heartbeat("w1", 1, {"a": ("asr", {"asr": 1.0}, {"chunks": 2})}) == ([], [])
+    clock.advance(8)
+    # Renewed lease has not run out, so nothing to reclaim
+    assert store.claim("w2") is None
+    job = store.get("a")
+    assert job["stage"] == "asr" and job["stage_timings"] == {"asr": 1.0} and job["counters"] == {"chunks": 2}
+
+
+def test_expired_lease_is_reclaimed(store, clock):
+    submit(store, "a", clock)
+    store.claim("w1")
+    clock.advance(11)
+    job = store.claim("w2")
+    assert job["id"] == "a" and job["worker"] == "w2" and job["attempts"] == 2
+    # The old owner learns it lost the job and can no longer finish it
+    assert store.heartbeat("w1", 1, {"a": ("asr", {}, {})}) == (["a"], [])
+    assert not store.finish("a", "w1", COMPLETED, {}, None, None, {}, {})
+    assert store.finish("a", "w2", COMPLETED, {}, None, None, {}, {})
+    assert store.get("a")["state"] == COMPLETED
+
+
+def test_job_fails_after_max_attempts(store, clock):
+    submit(store, "a", clock)
+    store.claim("w1")
+    clock.advance(11)
+    store.claim("w2")
+    clock.advance(11)
+    assert store.claim("w3") is None
+    job = store.get("a")
+    assert job["state"] == FAILED and job["worker"] is None
+    assert job["error"] == "Worker lost 2 time(s)"
+
+
+def test_release_requeues_without_counting_attempt(store, clock):
+    submit(store, "a", clock)
+    store.claim("w1")
+    store.release("a", "w1")
+    job = store.get("a")
+    assert job["state"] == QUEUED and job["attempts"] == 0 and job["worker"] is None
+    assert store.claim("w2")["attempts"] == 1
+
+
+def test_cancel_queued_and_running(store, clock):
+    submit(store, "a", clock)
+    submit(store, "b", clock)
+    assert store.cancel("b")["state"] == CANCELLED
+    store.claim("w1")
+    flagged = store.cancel("a")
+    assert flagged["state"] == RUNNING and flagged["cancel_requested"]
+    assert store.heartbeat("w1", 1, {"a": ("asr", {}, {})}) == ([], ["a"])
+    store.release("a", "w1")
+    assert store.get("a")["state"] == CANCELLED
+
+
+def test_abandoned_cancelled_job_is_not_reclaimed(store, clock):
+    submit(store, "a", clock)
+    store.claim("w1")
+    store.cancel("a")
+    clock.advance(11)
+    assert store.claim("w2") is None
+    assert store.get("a")["state"] == CANCELLED
+
+
+def test_queue_position_and_stats(store, clock):
+    for job_id in ("a", "b", "c"):
+        submit(store, job_id, clock)
+    assert store.queue_position("c") == 2
+    store.claim("w1")
+    assert store.queue_position("a") is None
+    assert store.queue_position("c") == 1
+    store.heartbeat("w1", 3, {"a": ("asr", {}, {})})
+    stats = store.stats()
+    assert stats["jobs"][QUEUED] == 2 and stats["jobs"][RUNNING] == 1
+    assert stats["processes"] == 1 and stats["slots"] == 3
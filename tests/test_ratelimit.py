@@ -0,0 +1,143 @@
+import email.utils
+
+import pytest
+import requests
+
+import client
+from ratelimit import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError, Endpoint, TokenBucket
+
+
+def response(status, retry_after=None):
+    resp = requests.Response()
+    resp.status_code = status
+    if retry_after is not None:
+        resp.headers["Retry-After"] = retry_after
+    return resp
+
+
+def test_bucket_allows_burst_then_paces(clock):
+    bucket = TokenBucket(rate=2, burst=3)
+    assert [bucket.reserve() for _ in range(3)] == [0, 0, 0]
+    # Each reservation past the burst waits one more token interval
+    assert bucket.reserve() == pytest.approx(0.5)
+    assert bucket.reserve() == pytest.approx(1.0)
+    clock.advance(1.0)
+    assert bucket.available() == pytest.approx(0.0)
+    clock.advance(10)
+    assert bucket.available() == 3
+
+
+def test_bucket_acquire_sleeps_for_the_reservation(clock):
+    bucket = TokenBucket(rate=1, burst=1)
+    assert bucket.acquire() == 0
+    assert bucket.acquire() == pytest.approx(1.0)
+    assert clock.slept == [pytest.approx(1.0)]
+
+
+def test_bucket_unlimited_rate_never_waits(clock):
+    bucket = TokenBucket(rate=0, burst=1)
+    assert [bucket.reserve() for _ in range(5)] == [0] * 5
+
+
+def test_bucket_pause_holds_every_request(clock):
+    bucket = TokenBucket(rate=10, burst=10)
+    bucket.pause(5)
+    assert bucket.reserve() == pytest.approx(5)
+    # A shorter pause does not cut an existing one short
+    bucket.pause(1)
+    clock.advance(2)
+    assert bucket.reserve() == pytest.approx(3)
+    clock.advance(3)
+    assert bucket.reserve() == 0
+
+
+def test_breaker_opens_after_threshold(clock):
+    breaker = CircuitBreaker("ep", threshold=3, reset_timeout=30)
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == CLOSED
+    breaker.before_request()
+    breaker.record_failure()
+    assert breaker.state == OPEN and breaker.trips == 1
+    clock.advance(10)
+    with pytest.raises(CircuitOpenError) as info:
+        breaker.before_request()
+    assert info.value.retry_in == pytest.approx(20)
+
+
+def test_breaker_success_resets_failures(clock):
+    breaker = CircuitBreaker("ep", threshold=2, reset_timeout=30)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+
+
+def test_breaker_half_open_lets_one_probe_through(clock):
+    breaker = CircuitBreaker("ep", threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock.advance(30)
+    assert breaker.state == HALF_OPEN
+    breaker.before_request()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    breaker.before_request()
+
+
+def test_breaker_failed_probe_reopens(clock):
+    breaker = CircuitBreaker("ep", threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock.advance(30)
+    breaker.before_request()
+    breaker.record_failure()
+    assert breaker.state == OPEN and breaker.trips == 2
+    clock.advance(29)
+    assert breaker.state == OPEN
+    clock.advance(1)
+    assert breaker.state == HALF_OPEN
+
+
+def test_breaker_unanswered_probe_is_retried_after_reset(clock):
+    breaker = CircuitBreaker("ep", threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    clock.advance(30)
+    breaker.before_request()
+    clock.advance(30)
+    breaker.before_request()
+
+
+def test_retry_after_seconds():
+    assert client._retry_after(response(429, "7")) == 7
+    assert client._retry_after(response(429, "-3")) == 0
+    assert client._retry_after(response(429, "10000")) == client.RETRY_AFTER_MAX
+    assert client._retry_after(response(429)) is None
+    assert client._retry_after(response(429, "soon")) is None
+    assert client._retry_after(None) is None
+
+
+def test_retry_after_http_date(clock):
+    clock.now = 1_700_000_000.0
+    assert client._retry_after(response(503, email.utils.formatdate(clock.now + 45, usegmt=True))) == 45
+    assert client._retry_after(response(503, email.utils.formatdate(clock.now - 45, usegmt=True))) == 0
+
+
+def test_retry_delay_honours_retry_after(clock):
+    endpoint = Endpoint("ep", rate=10, burst=10)
+    assert client._retry_delay(endpoint, 0, 3, response=response(429, "4")) == 4
+    # The whole endpoint is paused, and a 429 is not a breaker failure
+    assert endpoint.bucket.reserve() == pytest.approx(4)
+    stats = endpoint.stats()
+    assert stats["throttled"] == 1 and stats["retries"] == 1 and stats["failures"] == 0
+    assert endpoint.breaker.failures == 0
+
+
+def test_retry_delay_stops_when_breaker_opens(clock):
+    endpoint = Endpoint("ep", rate=10, burst=10)
+    endpoint.breaker.threshold = 2
+    assert client._retry_delay(endpoint, 0, 3, response=response(503)) is not None
+    assert client._retry_delay(endpoint, 1, 3, response=response(503)) is None
+    assert endpoint.breaker.state == OPEN
+    assert client._retry_delay(endpoint, 0, 3, response=response(200)) is None
+    assert endpoint.breaker.state == CLOSED
@@ -0,0 +1,59 @@
+from subtitles import Cue, iter_srt, read_srt, render
+
+SRT = """1
+00:00:01,000 --> 00:00:02,500
+Hello
+
+2
+00:00:03,000 --> 00:00:04,000
+Two
+lines
+
+"""
+
+
+def cues(parsed):
+    return [(cue.begin, cue.end, cue.text) for cue in parsed]
+
+
+EXPECTED = [(1000, 2500, "Hello"), (3000, 4000, "Two lines")]
+
+
+def test_iter_srt_plain():
+    assert cues(iter_srt(SRT.splitlines(keepends=True))) == EXPECTED
+
+
+def test_iter_srt_bom_and_crlf():
+    lines = ("\ufeff" + SRT.replace("\n", "\r\n")).splitlines(keepends=True)
+    assert lines[-1] == "\r\n"
+    assert cues(iter_srt(lines)) == EXPECTED
+
+
+def test_iter_srt_missing_blank_lines():
+    text = "1\n00:00:01,000 --> 00:00:02,500\nHello\n2\n00:00:03,000 --> 00:00:04,000\nTwo\nlines"
+    assert cues(iter_srt(text.splitlines())) == EXPECTED
+
+
+def test_iter_srt_extra_blank_lines_and_no_index():
+    text = "\n\n00:00:01,000 --> 00:00:02,500\nHello\n\n\n\n00:00:03,000 --> 00:00:04,000\nTwo\nlines\n\n\n"
+    assert cues(iter_srt(text.splitlines())) == EXPECTED
+
+
+def test_iter_srt_timing_variants():
+    text = ("1\n01:02.5 --> 01:03.25 X:100 Y:200\nShort\n\n"
+            "2\n1:00:00.000 --> 1:00:01.000\nHours\n\n"
+            "3\n00:00:05,000 --> 00:00:06,000\n\n")
+    assert cues(iter_srt(text.splitlines())) == [(62500, 63250, "Short"), (3600000, 3601000, "Hours")]
+
+
+def test_read_srt_bom_and_crlf(tmp_path):
+    path = tmp_path / "in.srt"
+    path.write_bytes(("\ufeff" + SRT.replace("\n", "\r\n")).encode("utf-8"))
+    assert cues(read_srt(path)) == EXPECTED
+
+
+def test_read_srt_round_trips_rendered_srt(tmp_path):
+    original = [Cue(0, 1500, "First"), Cue(2000, 3600005, "Second")]
+    path = tmp_path / "out.srt"
+    path.write_text(render(original)["srt"], encoding="utf-8")
+    assert cues(read_srt(path)) == cues(original)
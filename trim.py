@@ -0,0 +1,126 @@
+"""
+Silence trimming before hashing and upload.
+
+Silences longer than TRIM_MIN_SILENCE are cut out of the extracted audio
+(keeping TRIM_PADDING on each side), so less audio is uploaded and the
+remote ASR has less to process. An OffsetMap records where every kept
+stretch came from, and step3's begin/end timestamps are mapped back to
+the original timeline before the SRT is written.
+"""
+import asyncio
+import bisect
+import os
+import tempfile
+from typing import List, Optional, Tuple
+
+from audio import FFMPEG_AUDIO_ARGS, LOCAL_TMP_DIR
+from segment import detect_silences, run_ffmpeg
+
+# Off by default; LR_TRIM_SILENCE=1 (or --trim-silence / "trim_silence": true) turns it on
+TRIM_SILENCE = os.environ.get('LR_TRIM_SILENCE', '0') == '1'
+TRIM_MIN_SILENCE = float(os.environ.get('LR_TRIM_MIN_SILENCE', '2.0'))
+TRIM_PADDING = float(os.environ.get('LR_TRIM_PADDING', '0.3'))
+# Not worth a re-encode when less than this fraction would be removed
+TRIM_MIN_SAVING = float(os.environ.get('LR_TRIM_MIN_SAVING', '0.05'))
+
+
+class OffsetMap:
+    """Maps times in the trimmed audio back to the original timeline."""
+
+    def __init__(self, kept: List[Tuple[float, float]], duration: float):
+        # Parallel lists in ms: where each kept stretch starts in the trimmed and original audio
+        self.kept = [tuple(stretch) for stretch in kept]
+        self.duration = duration
+        self._trimmed = []
+        self._original = []
+        self._lengths = []
+        position = 0
+        for start, end in kept:
+            length = int(round((end - start) * 1000))
+            self._trimmed.append(position)
+            self._original.append(int(round(start * 1000)))
+            self._lengths.append(length)
+            position += length
+        self.trimmed_duration = position / 1000
+        self.removed = duration - self.trimmed_duration
+
+    def to_original(self, ms: int, end: bool = False) -> int:
+        """
+        Original time for a trimmed time. A time exactly at a cut belongs to the
+        stretch after it for a begin and to the stretch before it for an end.
+        """
+        if not self._trimmed:
+            return ms
+        find = bisect.bisect_left if end else bisect.bisect_right
+        i = max(0, find(self._trimmed, ms) - 1)
+        return self._original[i] + min(ms - self._trimmed[i], self._lengths[i])
+
+    def remap(self, subs: List[dict]) -> List[dict]:
+        return [
+            {**sub, 'begin': self.to_original(sub['begin']), 'end': self.to_original(sub['end'], end=True)}
+            for sub in subs
+        ]
+
+
+def remap_result(result: dict, offsets: OffsetMap) -> dict:
+    """Copy of a step3 result with its subs on the original timeline."""
+    return {**result, 'data': {**result['data'], 'subs': offsets.remap(result['data']['subs'])}}
+
+
+def keep_intervals(silences: List[Tuple[float, float]], duration: float,
+                   min_silence: float = TRIM_MIN_SILENCE,
+                   padding: float = TRIM_PADDING) -> List[Tuple[float, float]]:
+    """Complement of the long silences, each shrunk by `padding` so speech edges survive."""
+    kept = []
+    position = 0.0
+    for start, end in silences:
+        if end - start < min_silence:
+            continue
+        cut_start = start + padding
+        cut_end = min(duration, end - padding)
+        if cut_start > position:
+            kept.append((position, cut_start))
+        position = max(position, cut_end)
+    if position < duration:
+        kept.append((position, duration))
+    return kept
+
+
+def _trim_args(kept: List[Tuple[float, float]]) -> list:
+    select = '+'.join(f'between(t,{start:.3f},{end:.3f})' for start, end in kept)
+    args = list(FFMPEG_AUDIO_ARGS)
+    i = args.index('-af')
+    args[i + 1] = f"aselect='{select}',asetpts=N/SR/TB,{args[i + 1]}"
+    return args
+
+
+async def trim_silence(audio_path: str) -> Optional[Tuple[str, OffsetMap]]:
+    """
+    Write a trimmed copy of the audio to local tmp and return (path, offset map).
+
+    Returns None when there is too little silence to be worth it. The caller
+    deletes the returned file.
+    """
+    silences, duration = await detect_silences(audio_path)
+    if not duration:
+        return None
+    kept = keep_intervals(silences, duration)
+    removed = duration - sum(end - start for start, end in kept)
+    if not kept or removed < duration * TRIM_MIN_SAVING:
+        print(f"[INFO] Silence trimming skipped ({removed:.1f}s of {duration:.0f}s is silence)")
+        return None
+
+    fd, output_path = tempfile.mkstemp(dir=LOCAL_TMP_DIR, suffix='.ogg')
+    os.close(fd)
+    try:
+        await run_ffmpeg(['-loglevel', 'error', '-i', audio_path, *_trim_args(kept), '-y', output_path])
+    except BaseException:
+        os.remove(output_path)
+        raise
+    print(f"[INFO] Trimmed {removed:.1f}s of silence ({len(kept)} stretches kept of {duration:.0f}s)")
+    return output_path, OffsetMap(kept, duration)
+
+
+def trim_silence_sync(audio_path: str) -> Optional[Tuple[str, OffsetMap]]:
+    """Blocking wrapper of trim_silence for main.py."""
+    return asyncio.run(trim_silence(audio_path))
@@ -0,0 +1,48 @@
+"""
+Standalone queue worker: runs jobs submitted to any API replica, without serving HTTP.
+
+Every worker on the same queue (LR_QUEUE_PATH) and caches (LR_CACHE_DIR)
+adds LR_JOB_WORKERS job slots:
+
+    python worker.py
+    docker compose up -d --scale srt-translator-worker=3
+"""
+import asyncio
+import signal
+
+import client
+from app import job_manager
+
+
+async def run():
+    client.get_session()
+    client.get_async_client()
+    job_manager.start()
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stopping.set)
+        except NotImplementedError:
+            # Windows: Ctrl+C still raises KeyboardInterrupt
+            pass
+    try:
+        await stopping.wait()
+    finally:
+        # Running jobs go back to the queue for the remaining workers
+        print("[INFO] Stopping worker, handing running jobs back to the queue")
+        await job_manager.stop()
+        await client.close_async_client()
+        client.close_session()
+
+
+def main():
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()